@@ -0,0 +1,355 @@
+"""
+Benchmarks for the tomogram loading, annotation parsing and sampling paths.
+
+Fixtures are generated with `tomograms.synthetic`, so no real data is needed.
+Each benchmark reports its median wall time, throughput and peak traced
+memory. Results can be saved as JSON and compared against a saved baseline to
+catch regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--shape 128 512 512] [--points 1000]
+        [--repeat 5] [--only load,process] [--json out.json]
+        [--compare baseline.json] [--tolerance 0.2] [--stages]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tomograms
+from tomograms import instrumentation, synthetic
+from tomograms.subtomogram import Subtomogram, SubtomogramGenerator
+from tomograms.supercomputer_utils import seek_dirs, seek_annotated_tomos
+
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Benchmark:
+    """A single benchmark.
+
+    Attributes:
+        name (str): Name of the benchmark.
+
+        setup (callable): Takes the fixture dictionary and returns the state
+        passed to `run`. Not timed.
+
+        run (callable): Takes the state and returns the amount of work done,
+        in `unit`s.
+
+        unit (str): Unit of work, i.e., "B" for bytes or "samples".
+    """
+    def __init__(
+            self,
+            name: str,
+            setup: Callable[[Dict[str, Any]], Any],
+            run: Callable[[Any], float],
+            unit: str
+        ):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.unit = unit
+
+    def measure(self, fixtures: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+        """Runs the benchmark `repeat` times, then once more to trace memory.
+
+        Args:
+            fixtures (dict): The generated fixtures.
+
+            repeat (int): The number of timed runs.
+
+        Returns:
+            A dictionary of results.
+        """
+        times = []
+        for _ in range(repeat):
+            state = self.setup(fixtures)
+            start = time.perf_counter()
+            work = self.run(state)
+            times.append(time.perf_counter() - start)
+            del state
+
+        state = self.setup(fixtures)
+        tracemalloc.start()
+        self.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del state
+
+        median = statistics.median(times)
+        return {
+            "name": self.name,
+            "median_s": median,
+            "min_s": min(times),
+            "throughput": work / median if median > 0 else float("inf"),
+            "unit": self.unit,
+            "peak_bytes": peak,
+        }
+
+
+def make_fixtures(root: str, shape: List[int], n_points: int, n_tomograms: int) -> Dict[str, Any]:
+    """Writes the synthetic files used by the benchmarks.
+
+    Args:
+        root (str): Directory to write the fixtures into.
+
+        shape (list of int): Shape of each synthetic tomogram.
+
+        n_points (int): Number of annotation points per tomogram.
+
+        n_tomograms (int): Number of tomograms in the synthetic archive.
+
+    Returns:
+        A dictionary describing the fixtures.
+    """
+    gen = np.random.default_rng(0)
+    directories = synthetic.write_dataset(root, n_tomograms, shape, n_points, gen)
+    directory = directories[0]
+    name = os.path.basename(directory)
+    return {
+        "root": root,
+        "shape": shape,
+        "n_points": n_points,
+        "n_tomograms": n_tomograms,
+        "rec": os.path.join(directory, f"{name}.rec"),
+        "mod": os.path.join(directory, "FM.mod"),
+        "ndjson": os.path.join(directory, "FM.ndjson"),
+    }
+
+
+def _loaded_tomogram(fixtures: Dict[str, Any]) -> tomograms.TomogramFile:
+    annotation = tomograms.AnnotationFile(fixtures["mod"], "Flagellar Motor")
+    return tomograms.TomogramFile(fixtures["rec"], [annotation])
+
+
+def _loaded_raw(fixtures: Dict[str, Any]) -> tomograms.TomogramFile:
+    tomo = tomograms.TomogramFile(fixtures["rec"], load=False)
+    tomo.load(preprocess=False)
+    return tomo
+
+
+def _generator(fixtures: Dict[str, Any]) -> SubtomogramGenerator:
+    stg = SubtomogramGenerator(_loaded_tomogram(fixtures))
+    stg.set_vol_shape(tuple(max(s // 4, 1) for s in fixtures["shape"]))
+    stg.pads = tuple(max(s // 32, 0) for s in fixtures["shape"])
+    return stg
+
+
+N_SAMPLES = 50
+
+
+def _run_load(preprocess: bool) -> Callable[[Any], float]:
+    def run(state):
+        state.load(preprocess=preprocess)
+        return state.data.nbytes
+    return run
+
+
+def _run_process(state):
+    state.process()
+    return state.data.nbytes
+
+
+def _run_process_parallel(state):
+    state.process(workers=os.cpu_count())
+    return state.data.nbytes
+
+
+def _run_subtomograms(state):
+    tomo, bounds, shape = state
+    for lower_bounds in bounds:
+        Subtomogram(tomo, lower_bounds, shape)
+    return len(bounds)
+
+
+def _crop_bounds(fixtures):
+    shape = tuple(max(s // 4, 1) for s in fixtures["shape"])
+    gen = np.random.default_rng(0)
+    bounds = [gen.integers(0, np.array(fixtures["shape"]) - shape + 1) for _ in range(N_SAMPLES)]
+    return bounds, shape
+
+
+def _setup_subtomograms(fixtures):
+    return (_loaded_tomogram(fixtures), *_crop_bounds(fixtures))
+
+
+def _setup_regions(fixtures):
+    tomo = tomograms.TomogramFile(fixtures["rec"], load=False)
+    tomo.intensity_range()
+    return (tomo, *_crop_bounds(fixtures))
+
+
+def _run_regions(state):
+    tomo, bounds, shape = state
+    for lower_bounds in bounds:
+        tomo.read_region(lower_bounds, shape)
+    return len(bounds)
+
+
+def _run_samples(positive: bool) -> Callable[[Any], float]:
+    def run(state):
+        for _ in range(N_SAMPLES):
+            state.positive_sample() if positive else state.negative_sample()
+        return N_SAMPLES
+    return run
+
+
+def _run_seek(state):
+    root = state
+    directories = seek_dirs(root, re.compile(r"syn\d{4}.*"))
+    tomos = seek_annotated_tomos(
+        directories,
+        re.compile(r".*\.rec$"),
+        [re.compile(r"^FM\.mod$")],
+        ["Flagellar Motor"]
+    )
+    return len(tomos)
+
+
+BENCHMARKS = [
+    Benchmark(
+        "load",
+        lambda f: tomograms.TomogramFile(f["rec"], load=False),
+        _run_load(False),
+        "B"
+    ),
+    Benchmark(
+        "load_preprocess",
+        lambda f: tomograms.TomogramFile(f["rec"], load=False),
+        _run_load(True),
+        "B"
+    ),
+    Benchmark("process", _loaded_raw, _run_process, "B"),
+    Benchmark("process_parallel", _loaded_raw, _run_process_parallel, "B"),
+    Benchmark(
+        "mrc_to_np",
+        lambda f: f["rec"],
+        lambda path: tomograms.TomogramFile.mrc_to_np(path).nbytes,
+        "B"
+    ),
+    Benchmark(
+        "mod_points",
+        lambda f: f["mod"],
+        lambda path: len(tomograms.AnnotationFile.mod_points(path)),
+        "points"
+    ),
+    Benchmark(
+        "mod_points_cached",
+        lambda f: (tomograms.AnnotationFile(f["mod"], cache_dir=f["root"]), f)[1],
+        lambda f: len(tomograms.AnnotationFile(f["mod"], cache_dir=f["root"]).points),
+        "points"
+    ),
+    Benchmark(
+        "ndjson_points",
+        lambda f: f["ndjson"],
+        lambda path: len(tomograms.AnnotationFile.ndjson_points(path)),
+        "points"
+    ),
+    Benchmark("subtomogram", _setup_subtomograms, _run_subtomograms, "samples"),
+    Benchmark("read_region", _setup_regions, _run_regions, "samples"),
+    Benchmark("positive_sample", _generator, _run_samples(True), "samples"),
+    Benchmark("negative_sample", _generator, _run_samples(False), "samples"),
+    Benchmark("seek", lambda f: f["root"], _run_seek, "tomograms"),
+]
+
+
+def format_quantity(value: float, unit: str) -> str:
+    """Formats a throughput for display, i.e., 1.2 GB/s."""
+    if unit != "B":
+        return f"{value:,.1f} {unit}/s"
+    for prefix in ["", "K", "M", "G"]:
+        if value < 1000:
+            return f"{value:.1f} {prefix}B/s"
+        value /= 1000
+    return f"{value:.1f} TB/s"
+
+
+def report(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]], tolerance: float) -> bool:
+    """Prints a table of results, flagging regressions against `baseline`.
+
+    Returns:
+        True if no benchmark regressed by more than `tolerance`.
+    """
+    ok = True
+    print(f"{'benchmark':<18}{'median':>12}{'throughput':>22}{'peak memory':>16}  note")
+    for result in results:
+        note = ""
+        if baseline is not None and result["name"] in baseline:
+            reference = baseline[result["name"]]["median_s"]
+            ratio = result["median_s"] / reference
+            note = f"{ratio:.2f}x baseline"
+            if ratio > 1 + tolerance:
+                note += "  REGRESSION"
+                ok = False
+        print(
+            f"{result['name']:<18}"
+            f"{result['median_s'] * 1000:>10.2f}ms"
+            f"{format_quantity(result['throughput'], result['unit']):>22}"
+            f"{result['peak_bytes'] / 1e6:>13.1f} MB"
+            f"  {note}"
+        )
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=[64, 256, 256],
+                        help="shape of the synthetic tomograms")
+    parser.add_argument("--points", type=int, default=200,
+                        help="annotation points per tomogram")
+    parser.add_argument("--tomograms", type=int, default=4,
+                        help="tomograms in the synthetic archive used by `seek`")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--only", type=str, default=None,
+                        help="comma-separated names of benchmarks to run")
+    parser.add_argument("--json", type=str, default=None, help="file to save results to")
+    parser.add_argument("--compare", type=str, default=None, help="baseline results to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown relative to the baseline")
+    parser.add_argument("--stages", action="store_true",
+                        help="also report per-stage counters from tomograms.instrumentation")
+    args = parser.parse_args(argv)
+
+    selected = BENCHMARKS
+    if args.only is not None:
+        names = args.only.split(",")
+        selected = [b for b in BENCHMARKS if b.name in names]
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = {r["name"]: r for r in json.load(file)["results"]}
+
+    with tempfile.TemporaryDirectory() as root:
+        fixtures = make_fixtures(root, args.shape, args.points, args.tomograms)
+        results = [benchmark.measure(fixtures, args.repeat) for benchmark in selected]
+
+    ok = report(results, baseline, args.tolerance)
+    if args.stages:
+        # Run each benchmark once more with instrumentation on, so that it
+        # does not affect the timings above.
+        with tempfile.TemporaryDirectory() as root:
+            fixtures = make_fixtures(root, args.shape, args.points, args.tomograms)
+            stats = instrumentation.enable()
+            for benchmark in selected:
+                benchmark.run(benchmark.setup(fixtures))
+            instrumentation.disable()
+        print()
+        print(stats.report())
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump({"config": vars(args), "results": results}, file, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
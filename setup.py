@@ -13,6 +13,11 @@ setup(
         'pandas',
         'cryoet-data-portal'
     ],
+    entry_points={
+        'console_scripts': [
+            'tomograms=tomograms.cli:main',
+        ],
+    },
     author='Matthew Ward',
     author_email='matthew.merrill.ward@gmail.com',
     description='A package for handling tomograms and related tasks',
@@ -1,5 +1,60 @@
 import sys
 import os
 
+import pytest
+
+import numpy as np
+
 # Add the tomograms directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tomograms')))
+
+import tomograms
+from tomograms import synthetic
+from tomograms.subtomogram import SubtomogramGenerator
+
+# Random number generator
+gen = np.random.default_rng()
+
+
+@pytest.fixture
+def make_generator(tmp_path):
+    """ 
+    Returns a function that makes a SubtomogramGenerator of (8, 16, 16)
+    volumes with pads of (1, 2, 2), for a tomogram with the given "motor"
+    annotation points. The tomogram is read from `filepath` if given, and is
+    otherwise a new random (30, 60, 60) .npy file.
+    """
+    count = 0
+
+    def make(points, filepath=None):
+        nonlocal count
+        if filepath is None:
+            filepath = str(tmp_path / f"tomo_{count}.npy")
+            np.save(filepath, gen.random(size=(30, 60, 60)))
+            count += 1
+        tomo = tomograms.TomogramFile(filepath, [tomograms.Annotation(points, "motor")])
+        stg = SubtomogramGenerator(tomo)
+        stg.set_vol_shape((8, 16, 16))
+        stg.pads = (1, 2, 2)
+        return stg
+
+    return make
+
+@pytest.fixture
+def make_dataset(tmp_path):
+    """ 
+    Returns a function that writes a small synthetic dataset of
+    `n_tomograms` tomograms of the given shape, each with `n_points`
+    "Flagellar Motor" points, and returns their unloaded TomogramFiles.
+    """
+    def make(n_tomograms, shape, n_points=3):
+        root = tmp_path / "dataset"
+        synthetic.write_dataset(str(root), n_tomograms, shape, n_points, gen)
+        tomos = []
+        for directory in sorted(str(p) for p in root.iterdir()):
+            name = os.path.basename(directory)
+            annotation = tomograms.AnnotationFile(os.path.join(directory, "FM.mod"), "Flagellar Motor")
+            tomos.append(tomograms.TomogramFile(os.path.join(directory, f"{name}.rec"), [annotation], load=False))
+        return tomos
+
+    return make
@@ -1,5 +1,9 @@
 import pytest
 
+import asyncio
+import os
+import shutil
+
 import numpy as np
 import pandas as pd
 
@@ -45,4 +49,43 @@ def test_tomogram_shape_from_mod():
     annotation = tomograms.AnnotationFile(FILE_2)
     shape = annotation.tomogram_shape_from_mod()
     assert len(shape) == 3
-    # TODO: actually read .mod in imod and investigate shape
\ No newline at end of file
+    # TODO: actually read .mod in imod and investigate shape
+
+def test_read_mod_header():
+    from imodmodel import ImodModel
+    header = ImodModel.from_file(FILE_2).header
+    shape = tomograms.AnnotationFile.mod_shape(FILE_2)
+    assert np.array_equal(shape, [header.zmax, header.xmax, header.ymax])
+    assert np.array_equal(tomograms.AnnotationFile.mod_shapes([FILE_2, FILE_2])[1], shape)
+    with pytest.raises(IOError):
+        tomograms.AnnotationFile.read_mod_header(FILE_1)
+
+def test_cached_mod_points(tmp_path, monkeypatch):
+    filepath = str(tmp_path / "FM.mod")
+    shutil.copy(FILE_2, filepath)
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    parsed = tomograms.AnnotationFile.mod_points(filepath)
+
+    # Without a cache directory, nothing is written
+    assert np.array_equal(tomograms.AnnotationFile(filepath).points, parsed)
+    assert sorted(os.listdir(tmp_path)) == ["FM.mod", "cache"]
+
+    assert np.array_equal(tomograms.AnnotationFile(filepath, cache_dir=cache_dir).points, parsed)
+    assert os.path.exists(tomograms.AnnotationFile.points_cache_path(filepath, cache_dir))
+
+    # A fresh cache is read without parsing
+    def fail(filepath):
+        raise AssertionError("parsed")
+    monkeypatch.setattr(tomograms.AnnotationFile, "mod_points", staticmethod(fail))
+    assert np.array_equal(tomograms.AnnotationFile(filepath, cache_dir=cache_dir).points, parsed)
+
+    # A changed file is parsed again
+    os.utime(filepath, ns=(1, 1))
+    with pytest.raises(AssertionError):
+        tomograms.AnnotationFile(filepath, cache_dir=cache_dir)
+
+def test_aopen_all():
+    annotations = asyncio.run(tomograms.AnnotationFile.aopen_all([FILE_1, FILE_2], ["a", "b"]))
+    assert [a.name for a in annotations] == ["a", "b"]
+    assert len(annotations[0].points) == 2
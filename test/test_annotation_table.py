@@ -0,0 +1,57 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms.annotation_table import AnnotationTable
+
+# Random number generator
+gen = np.random.default_rng()
+
+
+@pytest.fixture
+def tomos():
+    """ 
+    Generates three tomograms of shape 10 x 20 x 30. Tomogram `i` has `i`
+    "motor" annotations of two points each, and the last has a "pilus" too.
+    """
+    tomos = []
+    for i in range(3):
+        annotations = [
+            tomograms.Annotation([np.array([1, 2, 3]), np.array([5, 10, 15])], "motor")
+            for _ in range(i)
+        ]
+        tomos.append(tomograms.Tomogram(np.zeros((10, 20, 30)), annotations))
+    tomos[2].add_annotation(tomograms.Annotation([np.array([9, 19, 0])], "pilus"))
+    return tomos
+
+def test_from_tomograms(tomos):
+    table = AnnotationTable.from_tomograms(tomos)
+    assert len(table) == 7
+    assert table.names == ["motor", "pilus"]
+    assert table.n_tomograms == 3
+    assert table.points.shape == (7, 3)
+    assert list(table.counts_per_tomogram()) == [0, 2, 5]
+    assert list(table.counts_per_tomogram("motor", annotations=True)) == [0, 1, 2]
+
+def test_views(tomos):
+    table = AnnotationTable.from_tomograms(tomos)
+    view = table.view(2)
+    assert len(view) == 5
+    assert np.shares_memory(view.points, table.points)
+    annotations = view.annotations()
+    assert [a.name for a in annotations] == ["motor", "motor", "pilus"]
+    assert np.allclose(annotations[2].points, [[9, 19, 0]])
+    assert len(table.view(0).annotations()) == 0
+
+def test_group_counts(tomos):
+    table = AnnotationTable.from_tomograms(tomos)
+    counts = table.counts_by_group(["a", "b", "b"], "motor", annotations=True)
+    assert counts == {"a": 0, "b": 3}
+
+def test_border_queries(tomos):
+    table = AnnotationTable.from_tomograms(tomos)
+    distances = table.border_distances()
+    assert distances[table.mask("pilus")] == 0
+    assert np.count_nonzero(table.near_border(2)) == 4
+    assert np.count_nonzero(table.near_border(2, "motor")) == 3
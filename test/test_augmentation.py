@@ -0,0 +1,56 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms.subtomogram import SubtomogramGenerator
+
+# Random number generator
+gen = np.random.default_rng()
+
+
+@pytest.fixture
+def marked_tomo():
+    """ 
+    Generates a random tomogram with annotation points at voxels that are
+    marked with the value 2.
+    """
+    data = gen.random(size=(40, 60, 60))
+    points = [np.array([10, 20, 30]), np.array([25, 35, 12])]
+    for point in points:
+        data[tuple(point)] = 2
+    return tomograms.Tomogram(data, [tomograms.Annotation(points, "marks")])
+
+def test_orientation_matches_points(marked_tomo):
+    for _ in range(10):
+        augmentation = tomograms.RandomOrientation()
+        augmentation(marked_tomo)
+        assert marked_tomo.shape == (40, 60, 60)
+        for point in marked_tomo.annotation_points():
+            assert marked_tomo.data[tuple(point.astype(int))] == 2
+
+def test_orientation_is_view(marked_tomo):
+    data = marked_tomo.data
+    tomograms.RandomOrientation()(marked_tomo)
+    assert np.shares_memory(data, marked_tomo.data)
+
+def test_permutations_preserve_shape():
+    augmentation = tomograms.RandomOrientation()
+    assert len(augmentation.permutations((64, 256, 256))) == 2
+    assert len(augmentation.permutations((32, 32, 32))) == 6
+    assert len(tomograms.RandomOrientation(transpose=False).permutations((32, 32, 32))) == 1
+
+def test_generator_augmentation(marked_tomo, tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    np.save(filepath, marked_tomo.data)
+    tomo = tomograms.TomogramFile(filepath, marked_tomo.annotations, load=False)
+    tomo.load(preprocess=False)
+    stg = SubtomogramGenerator(tomo)
+    stg.set_vol_shape((16, 32, 32))
+    stg.pads = (2, 4, 4)
+    stg.set_augmentation(tomograms.RandomOrientation())
+    for _ in range(10):
+        sample = stg.positive_sample()
+        assert sample.orientation is not None
+        for point in sample.annotation_points():
+            assert sample.data[tuple(point.astype(int))] == 2
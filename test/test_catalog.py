@@ -0,0 +1,40 @@
+import pytest
+
+import os
+
+import numpy as np
+
+import tomograms
+from tomograms import synthetic
+from tomograms.catalog import Catalog
+
+# Random number generator
+gen = np.random.default_rng()
+
+SHAPE = (12, 20, 24)
+
+
+@pytest.fixture
+def dataset(make_dataset):
+    return make_dataset(2, SHAPE)
+
+def test_round_trip(dataset, tmp_path):
+    extra = tomograms.Annotation([np.array([1., 2., 3.])], "extra")
+    dataset[0].add_annotation(extra)
+    catalog = Catalog.from_tomograms(dataset, workers=2)
+    path = str(tmp_path / "catalog.json")
+    catalog.save(path)
+
+    loaded = Catalog.load(path).tomograms()
+    assert [t.filepath for t in loaded] == [t.filepath for t in dataset]
+    assert all(t.shape == SHAPE for t in loaded)
+    assert np.array_equal(loaded[0].annotation_points(), dataset[0].annotation_points())
+    assert isinstance(loaded[0].annotations[0], tomograms.AnnotationFile)
+    assert loaded[0].annotations[1].name == "extra"
+
+def test_stale(dataset):
+    catalog = Catalog.from_tomograms(dataset)
+    assert catalog.stale() == []
+    synthetic.write_mrc(dataset[1].filepath, SHAPE, gen)
+    os.utime(dataset[1].filepath, ns=(1, 1))
+    assert catalog.stale() == [1]
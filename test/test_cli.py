@@ -0,0 +1,82 @@
+import pytest
+
+import io
+import os
+
+import numpy as np
+
+import tomograms
+from tomograms import cli, synthetic
+from tomograms.catalog import Catalog
+
+# Random number generator
+gen = np.random.default_rng()
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """ 
+    Writes a small synthetic dataset, catalogues it with the command line,
+    and returns the path of the catalog.
+    """
+    root = tmp_path / "archive"
+    synthetic.write_dataset(str(root), 3, (12, 20, 24), 2, gen)
+    path = str(tmp_path / "catalog.json")
+    assert cli.main([
+        "catalog", "-o", path, "--root", str(root), "--dir-regex", r"syn\d{4}",
+        "--annotation-regex", r"^FM\.mod$", "--annotation-name", "Flagellar Motor"
+    ]) == 0
+    return path
+
+def test_catalog(catalog):
+    tomos = Catalog.load(catalog).tomograms()
+    assert len(tomos) == 3
+    assert all(t.annotations[0].name == "Flagellar Motor" for t in tomos)
+
+def test_preprocess(catalog, tmp_path, capsys):
+    # The cache directory is created if it does not exist
+    cache_dir = str(tmp_path / "cache" / "processed")
+    assert cli.main(["preprocess", catalog, "--cache-dir", cache_dir, "--workers", "2"]) == 0
+    assert "3/3" in capsys.readouterr().err
+
+    tomo = Catalog.load(catalog).tomograms(cache_dir=cache_dir)[0]
+    assert tomo.processed_is_fresh()
+    expected = tomograms.TomogramFile(tomo.filepath).data
+    assert np.array_equal(tomo.load(), expected)
+
+    # Up-to-date tomograms are skipped
+    assert cli.main(["preprocess", catalog, "--cache-dir", cache_dir]) == 0
+    assert "3 up to date" in capsys.readouterr().err
+
+def test_pyramid(catalog, tmp_path):
+    cache_dir = str(tmp_path / "cache" / "pyramid")
+    assert cli.main(["pyramid", catalog, "--cache-dir", cache_dir, "--levels", "2"]) == 0
+    tomo = Catalog.load(catalog).tomograms(cache_dir=cache_dir)[0]
+    assert os.path.exists(tomo.pyramid_path(2))
+
+def test_progress():
+    stream = io.StringIO()
+    progress = cli.Progress(2, 2 * 10**9, stream)
+    progress.update(10**9)
+    progress.update(10**9, skipped=True)
+    assert "[2/2]" in stream.getvalue()
+    assert progress.skipped == 1
+
+    # Skipped tomograms do not count towards throughput
+    progress = cli.Progress(3, 3 * 10**9, io.StringIO())
+    progress.update(2 * 10**9, skipped=True)
+    assert progress.done_bytes == 0
+    assert "0.00 GB/s" in progress.line() and "ETA ?" in progress.line()
+
+    # and neither do failed ones
+    progress = cli.Progress(3, 3 * 10**9, io.StringIO())
+    progress.update(10**9, failed=True)
+    assert progress.done_bytes == 0 and progress.failed_bytes == 10**9
+    assert "0.0 tomograms/min" in progress.line()
+
+def test_summarize(catalog, capsys):
+    assert cli.main(["summarize", catalog, "--bins", "32", "--workers", "2"]) == 0
+    assert "3 tomograms summarized" in capsys.readouterr().err
+    summary = Catalog.load(catalog).summary
+    assert len(summary) == 3
+    assert summary.intensity.count == 3 * 12 * 20 * 24
@@ -0,0 +1,61 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms import instrumentation, synthetic
+
+# Random number generator
+gen = np.random.default_rng()
+
+
+@pytest.fixture
+def stats():
+    """ 
+    Enables instrumentation for the duration of a test.
+    """
+    stats = instrumentation.enable()
+    yield stats
+    instrumentation.disable()
+
+@pytest.fixture
+def rec_file(tmp_path):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (20, 40, 40), gen)
+    return filepath
+
+def test_load_stages(stats, rec_file):
+    tomograms.TomogramFile(rec_file)
+    for name in ["TomogramFile.load", "mrc_to_np.read", "mrc_to_np.cast",
+                 "process.percentile", "process.rescale"]:
+        assert stats[name].calls == 1
+    assert stats["mrc_to_np.read"].bytes_read == 20 * 40 * 40 * 4
+    assert stats["mrc_to_np.cast"].bytes_allocated == 20 * 40 * 40 * 8
+    assert stats["TomogramFile.load"].seconds >= stats["mrc_to_np.read"].seconds
+
+def test_sampling_stages(stats, rec_file, make_generator):
+    stg = make_generator([np.array([10, 20, 20])], rec_file)
+    stg.positive_sample()
+    stg.negative_sample()
+    assert stats["positive_sample"].calls == 1
+    assert stats["negative_sample"].calls == 1
+    assert stats["Subtomogram.crop"].calls == 2
+    assert stats["negative_lower_bounds"].rejections >= 0
+
+def test_hooks(stats, rec_file):
+    records = []
+    hook = lambda stage, counters: records.append((stage, counters))
+    instrumentation.add_hook(hook)
+    try:
+        tomograms.TomogramFile.mrc_to_np(rec_file)
+    finally:
+        instrumentation.remove_hook(hook)
+    assert [stage for stage, _ in records] == ["mrc_to_np.read", "mrc_to_np.cast"]
+    assert "seconds" in records[0][1]
+
+def test_disabled(rec_file):
+    stats = instrumentation.enable()
+    instrumentation.disable()
+    tomograms.TomogramFile(rec_file)
+    assert stats.stages() == []
+    assert instrumentation.get_stats() is None
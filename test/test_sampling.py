@@ -0,0 +1,61 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms.sampling import SamplePlan
+
+
+@pytest.fixture
+def generators(make_generator):
+    """ 
+    Three small random tomograms, each with a single annotation point, and a
+    generator for each.
+    """
+    return [make_generator([np.array([15, 10 * (i + 1), 30])]) for i in range(3)]
+
+def test_plan_is_deterministic(generators):
+    plan_1 = SamplePlan.create(generators, 10, 10, seed=5)
+    plan_2 = SamplePlan.create(generators, 10, 10, seed=5)
+    assert plan_1.samples == plan_2.samples
+    assert sum(s.positive for s in plan_1.samples) == 10
+
+def test_sharded_planning(generators):
+    plan = SamplePlan.create(generators, 7, 6, seed=1)
+    shards = [SamplePlan.create(generators, 7, 6, seed=1, rank=r, world_size=3) for r in range(3)]
+    assert [s.samples for s in shards] == [plan.shard(r, 3).samples for r in range(3)]
+    assert SamplePlan.merge(shards).samples == plan.samples
+
+def test_save_load(generators, tmp_path):
+    plan = SamplePlan.create(generators, 4, 4, seed=2)
+    filepath = str(tmp_path / "plan.json")
+    plan.save(filepath)
+    assert SamplePlan.load(filepath).samples == plan.samples
+
+def test_read_order(generators):
+    plan = SamplePlan.create(generators, 20, 20, seed=3)
+    order = plan.read_order(np.random.default_rng(0))
+    tomos = [plan.samples[i].tomogram for i in order]
+    # Each tomogram is read in one contiguous run
+    runs = [t for i, t in enumerate(tomos) if i == 0 or tomos[i - 1] != t]
+    assert len(runs) == len(set(tomos))
+
+def test_execute(generators):
+    plan = SamplePlan.create(generators, 10, 10, seed=4)
+    samples = list(plan.execute(generators, buffer_size=7))
+    assert len(samples) == 20
+    assert sorted(tuple(s.lower_bounds) for s in samples) == sorted(s.lower_bounds for s in plan.samples)
+    n_positive = sum(len(s.annotation_points()) > 0 for s in samples)
+    assert n_positive >= 10
+
+def test_execute_augmented_is_replayed(generators):
+    for generator in generators:
+        generator.set_augmentation(tomograms.RandomOrientation())
+    plan = SamplePlan.create(generators, 6, 6, seed=6)
+    first = [np.array(s.data) for s in plan.execute(generators)]
+    second = [np.array(s.data) for s in plan.execute(generators)]
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+
+    # A shard augments its samples as the whole plan does
+    shard = plan.shard(1, 2)
+    assert np.array_equal(shard.extract(generators, 0).data, plan.extract(generators, 1).data)
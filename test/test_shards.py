@@ -0,0 +1,62 @@
+import pytest
+
+import numpy as np
+
+from tomograms.augmentation import Orientation, RandomOrientation
+from tomograms.sampling import SamplePlan
+from tomograms.shards import ShardReader, export_shards, read_shard
+
+
+@pytest.fixture
+def generator(make_generator):
+    """ 
+    A small random tomogram with two annotation points, and a generator for
+    it.
+    """
+    return make_generator([np.array([15, 20, 30]), np.array([10, 40, 20])])
+
+def test_export_generator(generator, tmp_path):
+    out_dir = str(tmp_path / "shards")
+    paths = export_shards(generator, out_dir, n_samples=25, samples_per_shard=10, workers=2)
+    assert len(paths) == 3
+    samples = list(read_shard(paths[0]))
+    assert len(samples) == 10
+    assert samples[0].shape == (8, 16, 16)
+    assert samples[0].metadata["positive"]
+    assert len(samples[0].annotation_points()) > 0
+    assert samples[0].metadata["source"] == generator.tomogram.filepath
+
+    # Data and points survive the round trip
+    parent = generator.tomogram.data
+    lb = samples[0].metadata["lower_bounds"]
+    assert np.array_equal(samples[0].data, parent[lb[0]:lb[0] + 8, lb[1]:lb[1] + 16, lb[2]:lb[2] + 16])
+    for point in samples[0].annotation_points():
+        assert any(np.allclose(point + lb, p) for p in generator.tomogram.annotation_points())
+
+def test_export_orientation(generator, tmp_path):
+    generator.set_augmentation(RandomOrientation(gen=np.random.default_rng(0)))
+    out_dir = str(tmp_path / "shards")
+    export_shards(generator, out_dir, n_samples=10)
+    parent = generator.tomogram.data
+    for sample in ShardReader(out_dir):
+        # The recorded orientation maps the source box onto the sample
+        orientation = Orientation(**sample.metadata["orientation"])
+        lb = sample.metadata["lower_bounds"]
+        box = parent[lb[0]:lb[0] + 8, lb[1]:lb[1] + 16, lb[2]:lb[2] + 16]
+        assert np.array_equal(sample.data, orientation.apply_data(box))
+
+def test_export_plan(generator, tmp_path):
+    plan = SamplePlan.create([generator], 6, 6, seed=0)
+    out_dir = str(tmp_path / "shards")
+    export_shards(plan, out_dir, generators=[generator], samples_per_shard=5, dtype=np.float32)
+    samples = list(ShardReader(out_dir))
+    assert len(samples) == 12
+    assert samples[0].data.dtype == np.float32
+    assert sum(s.metadata["positive"] for s in samples) == 6
+
+def test_shuffled_reader(generator, tmp_path):
+    out_dir = str(tmp_path / "shards")
+    export_shards(generator, out_dir, n_samples=30, samples_per_shard=7)
+    keys = [s.key for s in ShardReader(out_dir, shuffle_buffer=8, seed=1)]
+    assert sorted(keys) == [f"{i:09d}" for i in range(30)]
+    assert keys != sorted(keys)
@@ -0,0 +1,91 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms.catalog import Catalog
+from tomograms.summary import IntensitySummary, histogram_range, summarize
+
+# Random number generator
+gen = np.random.default_rng()
+
+SHAPE = (12, 20, 24)
+
+
+@pytest.fixture
+def dataset(make_dataset):
+    return make_dataset(3, SHAPE)
+
+def test_merge():
+    values = gen.normal(size=1000)
+    whole = IntensitySummary(-1, 1, 16).update(values)
+    parts = IntensitySummary(-1, 1, 16).update(values[:300])
+    parts.merge(IntensitySummary(-1, 1, 16).update(values[300:]))
+    assert np.array_equal(whole.counts, parts.counts)
+    assert whole.underflow + whole.overflow + whole.counts.sum() == len(values)
+    assert np.isclose(parts.mean, np.mean(values))
+    assert np.isclose(parts.std(), np.std(values))
+    assert (parts.minimum, parts.maximum) == (values.min(), values.max())
+    with pytest.raises(ValueError):
+        parts.merge(IntensitySummary(-1, 1, 8))
+
+def test_summarize(dataset):
+    summary = summarize(dataset, bins=64, workers=2, slab=5)
+    data = np.stack([tomograms.TomogramFile.mrc_to_np(t.filepath) for t in dataset])
+    low, high = histogram_range(dataset)
+
+    intensity = summary.intensity
+    assert intensity.count == data.size
+    assert np.isclose(intensity.mean, np.mean(data))
+    assert np.isclose(intensity.std(), np.std(data))
+    assert np.array_equal(intensity.counts, np.histogram(data, bins=64, range=(low, high))[0])
+    assert abs(intensity.quantile(0.5) - np.median(data)) <= (high - low) / 64
+
+    table = tomograms.AnnotationTable.from_tomograms(dataset, read_shapes=True)
+    assert np.allclose(summary.border_distances(), table.border_distances())
+    assert summary.annotation_counts() == {"Flagellar Motor": len(table)}
+    assert np.array_equal(summary.shapes(), [SHAPE] * 3)
+
+def test_catalog_summary(dataset, tmp_path, monkeypatch):
+    catalog = Catalog.from_tomograms(dataset, read_shapes=False)
+    summary = catalog.summarize(bins=32, workers=2)
+    assert all(entry["shape"] == list(SHAPE) for entry in catalog.entries)
+    path = str(tmp_path / "catalog.json")
+    catalog.save(path)
+
+    loaded = Catalog.load(path)
+    assert np.array_equal(loaded.summary.intensity.counts, summary.intensity.counts)
+    assert loaded.summary.intensity.mean == summary.intensity.mean
+
+    # Unchanged tomograms are not read again
+    def fail(self):
+        raise AssertionError("read")
+    monkeypatch.setattr(tomograms.TomogramFile, "open_raw", fail)
+    again = loaded.summarize(bins=32, workers=2)
+    assert np.array_equal(again.intensity.counts, summary.intensity.counts)
+    with pytest.raises(AssertionError):
+        loaded.summarize(bins=16)
+
+def test_resummarize_npy(tmp_path, monkeypatch):
+    # .npy files have no header statistics, so finding the range reads them
+    dataset = []
+    for i in range(2):
+        filepath = str(tmp_path / f"tomo_{i}.npy")
+        np.save(filepath, gen.normal(size=SHAPE).astype(np.float32))
+        dataset.append(tomograms.TomogramFile(filepath, load=False))
+    summary = summarize(dataset, bins=32, workers=2)
+
+    # Unchanged tomograms are read neither for the range nor for the summary
+    def fail(self):
+        raise AssertionError("read")
+    with monkeypatch.context() as patch:
+        patch.setattr(tomograms.TomogramFile, "open_raw", fail)
+        again = summarize(dataset, bins=32, workers=2, previous=summary)
+    assert np.array_equal(again.intensity.counts, summary.intensity.counts)
+    assert (again.intensity.low, again.intensity.high) == (summary.intensity.low, summary.intensity.high)
+
+    # A changed tomogram means the range is found again
+    np.save(dataset[0].filepath, 10 * gen.normal(size=SHAPE).astype(np.float32))
+    changed = summarize(dataset, bins=32, workers=2, previous=summary)
+    assert changed.intensity.count == 2 * np.prod(SHAPE)
+    assert changed.intensity.high > summary.intensity.high
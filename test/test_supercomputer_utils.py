@@ -0,0 +1,66 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms import supercomputer_utils
+from tomograms.sampling import SamplePlan
+from tomograms.shards import ShardReader, export_shards
+
+
+def test_array_rank(monkeypatch):
+    monkeypatch.delenv("SLURM_ARRAY_TASK_ID", raising=False)
+    monkeypatch.delenv("SLURM_ARRAY_TASK_COUNT", raising=False)
+    monkeypatch.delenv("SLURM_ARRAY_TASK_STEP", raising=False)
+    assert supercomputer_utils.array_rank() == (0, 1)
+
+    monkeypatch.setenv("SLURM_ARRAY_TASK_ID", "3")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_MIN", "1")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_COUNT", "4")
+    assert supercomputer_utils.array_rank() == (2, 4)
+    assert supercomputer_utils.array_rank(0, 2) == (0, 2)
+    with pytest.raises(ValueError):
+        supercomputer_utils.array_rank(4)
+
+    # --array=0-14:2
+    monkeypatch.setenv("SLURM_ARRAY_TASK_ID", "6")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_MIN", "0")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_STEP", "2")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_COUNT", "8")
+    assert supercomputer_utils.array_rank() == (3, 8)
+    monkeypatch.setenv("SLURM_ARRAY_TASK_ID", "7")
+    with pytest.raises(ValueError):
+        supercomputer_utils.array_rank()
+
+def test_partition_by_voxels():
+    shapes = [(10, 10, 10), (1, 10, 10), (5, 10, 10), (5, 10, 10), (2, 10, 10)]
+    tomos = [tomograms.TomogramFile(f"tomo_{i}.rec", load=False) for i in range(len(shapes))]
+    shards = supercomputer_utils.partition_by_voxels(tomos, 2, shapes)
+    assert sorted(sum(shards, [])) == list(range(len(shapes)))
+    assert shards == [[0, 4], [1, 2, 3]]
+
+    for tomo, shape in zip(tomos, shapes):
+        tomo.shape = shape
+    share = supercomputer_utils.shard_tomograms(tomos, 1, 2)
+    assert share == [tomos[i] for i in shards[1]]
+
+def test_sharded_export(tmp_path, monkeypatch, make_generator):
+    generator = make_generator([np.array([15, 20, 30])])
+    plan = SamplePlan.create([generator], 6, 5, seed=0)
+
+    out_dir = str(tmp_path / "shards")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_COUNT", "3")
+    monkeypatch.delenv("SLURM_ARRAY_TASK_MIN", raising=False)
+    monkeypatch.delenv("SLURM_ARRAY_TASK_STEP", raising=False)
+    for rank in range(3):
+        monkeypatch.setenv("SLURM_ARRAY_TASK_ID", str(rank))
+        share = supercomputer_utils.shard_plan(plan)
+        export_shards(
+            share, supercomputer_utils.shard_output(out_dir), generators=[generator],
+            samples_per_shard=2, key_prefix=supercomputer_utils.shard_key_prefix()
+        )
+
+    index = supercomputer_utils.merge_shard_outputs(out_dir)
+    assert sum(index["counts"]) == len(plan)
+    keys = [sample.key for sample in ShardReader(out_dir)]
+    assert len(set(keys)) == len(keys) == len(plan)
@@ -0,0 +1,36 @@
+import pytest
+
+import numpy as np
+
+import tomograms
+from tomograms import synthetic
+
+# Random number generator
+gen = np.random.default_rng()
+
+SHAPE = (20, 30, 40)
+
+def test_mod_round_trip(tmp_path):
+    filepath = str(tmp_path / "points.mod")
+    points = synthetic.random_points(SHAPE, 10, gen)
+    synthetic.write_mod(filepath, points, SHAPE)
+    assert np.allclose(tomograms.AnnotationFile.mod_points(filepath), points)
+
+def test_ndjson_round_trip(tmp_path):
+    filepath = str(tmp_path / "points.ndjson")
+    points = synthetic.random_points(SHAPE, 10, gen)
+    synthetic.write_ndjson(filepath, points)
+    assert np.allclose(tomograms.AnnotationFile.ndjson_points(filepath), points)
+
+def test_write_mrc(tmp_path):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, SHAPE, gen, slab=7)
+    data = tomograms.TomogramFile.mrc_to_np(filepath)
+    assert data.shape == SHAPE
+    assert data.std() > 0
+
+def test_write_dataset(tmp_path):
+    directories = synthetic.write_dataset(str(tmp_path), 2, SHAPE, 5, gen)
+    assert len(directories) == 2
+    annotation = tomograms.AnnotationFile(f"{directories[1]}/FM.mod")
+    assert len(annotation.points) == 5
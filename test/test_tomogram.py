@@ -1,8 +1,13 @@
 import pytest
+import asyncio
+import os
+import tracemalloc
 
 import numpy as np
 
 import tomograms
+from tomograms import synthetic
+from tomograms.subtomogram import Subtomogram, SubtomogramGenerator
 
 # Random number generator
 gen = np.random.default_rng()
@@ -50,6 +55,22 @@ def test_annotation_points(sample_tomo):
         np.array([1, 2, 3]) * i
     )
 
+def test_annotation_points_cache(sample_tomo):
+    before = sample_tomo.annotation_points()
+    sample_tomo.add_annotation(tomograms.Annotation([np.array([7, 8, 9]), np.array([4, 5, 6])], "addition"))
+    after = sample_tomo.annotation_points()
+    assert len(after) == len(before) + 2
+    assert np.allclose(sample_tomo.annotation_points(-1), [[7, 8, 9], [4, 5, 6]])
+    assert np.allclose(after[:len(before)], before)
+    # Points are returned as read-only views of the cache
+    assert not after.flags.writeable
+    assert after.base is not None
+
+    # Replacing the annotations list invalidates the cache
+    sample_tomo.annotations = sample_tomo.annotations[-1:]
+    assert len(sample_tomo.annotation_points()) == 2
+    assert list(sample_tomo.annotation_offsets()) == [0, 2]
+
 def test_mrc_to_np():
     file_1 = "test/data/mba2011-04-12-1.mrc" # https://cryoetdataportal.czscience.com/runs/10132
     # TODO: Portal says it's 318x319x109. Why 318 319 switch?
@@ -86,4 +107,280 @@ def test_reload():
 
 def test_get_shape_from_annotations():
     # TODO. Need a small tomogram with annotation
-    pass
\ No newline at end of file
+    pass
+
+def test_shapes_from_annotations(tmp_path):
+    filepath = str(tmp_path / "FM.mod")
+    synthetic.write_mod(filepath, np.array([[4., 5., 6.]]), (20, 30, 40))
+    annotated = tomograms.TomogramFile(str(tmp_path / "tomo.rec"), [tomograms.AnnotationFile(filepath)], load=False)
+    bare = tomograms.TomogramFile(str(tmp_path / "bare.rec"), load=False)
+
+    errors = []
+    shapes = tomograms.shapes_from_annotations([annotated, bare], errors=errors)
+    assert np.array_equal(shapes[0], annotated.get_shape_from_annotations())
+    assert shapes[1] is None
+    assert errors[0][0] is bare
+    with pytest.raises(Exception):
+        tomograms.shapes_from_annotations([bare])
+
+def test_block_mean():
+    data = gen.random(size=(9, 8, 6))
+    binned = tomograms.tomogram.block_mean(data, 2, slab=2)
+    assert binned.shape == (4, 4, 3)
+    assert np.isclose(binned[1, 2, 0], data[2:4, 4:6, 0:2].mean())
+
+def test_pyramid_level(tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    np.save(filepath, gen.random(size=(32, 40, 48)))
+    annotations = [tomograms.Annotation([np.array([8, 12, 20])], "motor")]
+    tomo = tomograms.TomogramFile(filepath, annotations, load=False)
+
+    binned = tomo.pyramid_level(2, preprocess=False)
+    assert binned.shape == (8, 10, 12)
+    assert np.allclose(binned.annotation_points(0), [np.array([2, 3, 5])])
+    assert tomo.data is None
+
+    # Both levels are cached and reused
+    assert os.path.exists(tomo.pyramid_path(1))
+    mtime = os.path.getmtime(tomo.pyramid_path(2))
+    tomo.pyramid_level(2)
+    assert os.path.getmtime(tomo.pyramid_path(2)) == mtime
+
+def test_aload_all(tmp_path):
+    tomos = []
+    for i in range(5):
+        filepath = str(tmp_path / f"tomo_{i}.npy")
+        np.save(filepath, gen.random(size=(4, 5, 6)))
+        tomos.append(tomograms.TomogramFile(filepath, load=False))
+    missing = tomograms.TomogramFile(str(tmp_path / "missing.npy"), load=False)
+
+    async def load():
+        errors = []
+        loaded = [t async for t in tomograms.aload_all(tomos + [missing], concurrency=2, errors=errors)]
+        return loaded, errors
+
+    loaded, errors = asyncio.run(load())
+    assert sorted(t.filepath for t in loaded) == sorted(t.filepath for t in tomos)
+    assert all(t.data is not None for t in loaded)
+    assert len(errors) == 1 and errors[0][0] is missing
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(missing.aload())
+
+    # Loading waits for the consumer
+    async def pause():
+        for t in tomos:
+            t.data = None
+        loader = tomograms.aload_all(tomos, concurrency=1)
+        await loader.__anext__()
+        await asyncio.sleep(0.2)
+        loaded = sum(t.data is not None for t in tomos)
+        await loader.aclose()
+        return loaded
+
+    assert asyncio.run(pause()) == 1
+
+@pytest.mark.parametrize("extension", [".rec", ".npy"])
+def test_read_region(tmp_path, extension):
+    filepath = str(tmp_path / f"tomo{extension}")
+    if extension == ".rec":
+        synthetic.write_mrc(filepath, (20, 30, 40), gen)
+    else:
+        np.save(filepath, gen.random(size=(20, 30, 40)))
+    loaded = tomograms.TomogramFile(filepath)
+    unloaded = tomograms.TomogramFile(filepath, load=False)
+
+    region = unloaded.read_region((3, 5, 7), (4, 10, 12))
+    assert unloaded.data is None
+    assert np.array_equal(region, loaded.data[3:7, 5:15, 7:19])
+
+    # Regions past the edge are cut short, as with slicing
+    region = unloaded.read_region((18, 25, 30), (4, 10, 12))
+    assert np.array_equal(region, loaded.data[18:, 25:, 30:])
+
+    raw = unloaded.read_region((0, 0, 0), (20, 30, 40), preprocess=False)
+    assert np.array_equal(raw, tomograms.TomogramFile(filepath, load=False).load(preprocess=False))
+
+def test_unloaded_generator(tmp_path):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (20, 30, 40), gen)
+    annotations = [tomograms.Annotation([np.array([10, 15, 20])], "motor")]
+    loaded = tomograms.TomogramFile(filepath, annotations)
+    unloaded = tomograms.TomogramFile(filepath, annotations, load=False)
+
+    stg = SubtomogramGenerator(unloaded, load=False)
+    stg.set_vol_shape((8, 10, 12))
+    stg.pads = (1, 1, 1)
+    assert unloaded.shape == (20, 30, 40)
+    sample = stg.positive_sample()
+    assert unloaded.data is None
+    z, y, x = sample.lower_bounds
+    assert np.array_equal(sample.data, loaded.data[z:z + 8, y:y + 10, x:x + 12])
+    assert len(sample.annotation_points()) == 1
+
+def test_lazy_preprocessing(tmp_path):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (20, 30, 40), gen)
+    loaded = tomograms.TomogramFile(filepath)
+    lazy = tomograms.TomogramFile(filepath, load=False)
+    lazy.load(lazy=True)
+    assert lazy.lazy
+    assert np.array_equal(lazy.data, tomograms.TomogramFile.mrc_to_np(filepath))
+    assert np.array_equal(lazy.crop((2, 3, 4), (5, 6, 7)), loaded.data[2:7, 3:9, 4:11])
+
+def test_statistics(tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    data = gen.normal(size=(10, 20, 30))
+    np.save(filepath, data)
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+
+    # Without a cache directory, nothing is written next to the tomogram
+    assert tomograms.TomogramFile(filepath, load=False).statistics()["p2"] == np.percentile(data, 2)
+    assert sorted(os.listdir(tmp_path)) == ["cache", "tomo.npy"]
+
+    tomo = tomograms.TomogramFile(filepath, load=False, cache_dir=cache_dir)
+    statistics = tomo.statistics()
+    assert os.path.exists(tomo.statistics_path())
+    assert np.isclose(statistics["mean"], data.mean())
+    assert (statistics["p2"], statistics["p98"]) == tuple(np.percentile(data, (2, 98)))
+
+    # Unloaded files are streamed, without a float64 copy of the volume
+    rec_filepath = str(tmp_path / "streamed.rec")
+    synthetic.write_mrc(rec_filepath, (256, 64, 64), gen)
+    rec_data = tomograms.TomogramFile.mrc_to_np(rec_filepath)
+    tracemalloc.start()
+    streamed = tomograms.TomogramFile(rec_filepath, load=False).statistics()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < rec_data.nbytes / 2
+    assert (streamed["p2"], streamed["p98"]) == tuple(np.percentile(rec_data, (2, 98)))
+    assert np.isclose(streamed["std"], rec_data.std())
+
+    # Stored statistics are used by new instances
+    other = tomograms.TomogramFile(filepath, load=False, cache_dir=cache_dir)
+    assert other._read_statistics() == statistics
+    other.load()
+    assert np.array_equal(other.data, tomograms.TomogramFile(filepath).data)
+
+    # and ignored once the file changes
+    np.save(filepath, data[:5])
+    assert tomograms.TomogramFile(filepath, load=False, cache_dir=cache_dir)._read_statistics() is None
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_quantize(tmp_path, dtype):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (20, 30, 40), gen)
+    loaded = tomograms.TomogramFile(filepath)
+    quantized = tomograms.TomogramFile(filepath, quantize=dtype)
+    assert quantized.data.dtype == dtype
+    scale, _ = quantized.quantization
+
+    crop = quantized.crop((2, 3, 4), (5, 6, 7))
+    assert crop.dtype == np.float64
+    assert np.max(np.abs(crop - loaded.data[2:7, 3:9, 4:11])) <= scale / 2 + 1e-9
+
+    generator = SubtomogramGenerator(quantized)
+    generator.set_vol_shape((8, 8, 8))
+    generator.set_dtype(np.float32)
+    assert generator.negative_sample().data.dtype == np.float32
+
+    with pytest.raises(ValueError):
+        tomograms.TomogramFile(filepath, load=False, quantize=dtype).load(lazy=True)
+
+def test_parallel_process(tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    np.save(filepath, gen.normal(size=(23, 17, 19)))
+    serial = tomograms.TomogramFile(filepath)
+    parallel = tomograms.TomogramFile(filepath, load=False)
+    parallel.load(workers=4)
+    assert parallel.clip_range == serial.clip_range
+    assert np.array_equal(parallel.data, serial.data)
+
+    data = gen.exponential(size=(31, 5, 7)).astype(np.float32)
+    for q in [(2, 98), (0, 50, 100)]:
+        assert np.array_equal(tomograms.tomogram.parallel_percentile(data, q, 3), np.percentile(data, q))
+    assert np.array_equal(tomograms.TomogramFile.rescale(data, workers=3), tomograms.TomogramFile.rescale(data))
+
+def test_parallel_process_int16(tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    data = gen.integers(-32768, 32768, size=(23, 17, 19)).astype(np.int16)
+    data[0, 0, :2] = [-32768, 32767]
+    np.save(filepath, data)
+    for q in [(2, 98), (0, 50, 100)]:
+        assert np.array_equal(tomograms.tomogram.parallel_percentile(data, q, 3), np.percentile(data, q))
+    serial = tomograms.TomogramFile(filepath)
+    parallel = tomograms.TomogramFile(filepath, load=False)
+    parallel.load(workers=4)
+    assert parallel.clip_range == serial.clip_range
+    assert np.array_equal(parallel.data, serial.data)
+
+@pytest.mark.parametrize("quantize", [None, np.uint8])
+def test_write_processed(tmp_path, quantize):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (10, 12, 14), gen)
+    expected = tomograms.TomogramFile(filepath, quantize=quantize)
+
+    path = tomograms.TomogramFile(filepath, load=False, quantize=quantize).write_processed()
+    assert os.path.exists(path)
+    cached = tomograms.TomogramFile(filepath, load=False, quantize=quantize)
+    assert cached.processed_is_fresh()
+    assert np.array_equal(cached.load(), expected.data)
+    assert cached.quantization == expected.quantization
+
+def test_write_processed_after_reload_or_process(tmp_path):
+    filepath = str(tmp_path / "tomo.rec")
+    synthetic.write_mrc(filepath, (10, 12, 14), gen)
+    expected = tomograms.TomogramFile(filepath, cache_dir=str(tmp_path / "x")).data
+
+    # Reloaded data is raw, so it is preprocessed before being written
+    reloaded = tomograms.TomogramFile(filepath)
+    reloaded.reload()
+    assert not reloaded.processed
+    reloaded.write_processed(force=True)
+    assert np.array_equal(tomograms.TomogramFile(filepath).data, expected)
+
+    # Processed data is written as it is, not stretched again
+    processed = tomograms.TomogramFile(filepath, load=False)
+    processed.load(preprocess=False)
+    processed.process()
+    processed.write_processed(force=True)
+    assert np.array_equal(processed.data, expected)
+    assert np.array_equal(tomograms.TomogramFile(filepath).data, expected)
+
+@pytest.mark.parametrize("pad_mode", ["constant", "edge", "reflect", "symmetric", "wrap"])
+def test_extract(pad_mode):
+    data = gen.random(size=(5, 6, 7))
+    tomo = tomograms.Tomogram(data)
+    padded = np.pad(data, 20, mode=pad_mode)
+    for lower_bounds in [(-3, 2, 4), (1, 1, 1), (3, -8, 10)]:
+        out = np.empty((6, 8, 9), dtype=np.float32)
+        box = tomo.extract(lower_bounds, out.shape, out, pad_mode=pad_mode)
+        assert box is out
+        z, y, x = (b + 20 for b in lower_bounds)
+        assert np.array_equal(box, padded[z:z + 6, y:y + 8, x:x + 9].astype(np.float32))
+    with pytest.raises(ValueError):
+        tomo.extract((0, 0, 0), (2, 2, 2), np.empty((1, 2, 2)))
+
+def test_subtomogram_extraction(tmp_path):
+    filepath = str(tmp_path / "tomo.npy")
+    np.save(filepath, gen.random(size=(20, 30, 40)))
+    tomo = tomograms.TomogramFile(filepath, [tomograms.Annotation([np.array([1, 2, 3])], "motor")])
+
+    view = Subtomogram(tomo, [15, 25, 35], (8, 8, 8))
+    assert view.shape == (5, 5, 5)
+    assert np.shares_memory(view.data, tomo.data)
+    copied = Subtomogram(tomo, [15, 25, 35], (8, 8, 8), copy=True)
+    assert not np.shares_memory(copied.data, tomo.data)
+    padded = Subtomogram(tomo, [-2, 0, 0], (8, 8, 8), pad_mode="edge")
+    assert padded.shape == (8, 8, 8)
+    assert np.allclose(padded.annotation_points(0), [[3, 2, 3]])
+
+    generator = SubtomogramGenerator(tomo)
+    generator.set_vol_shape((8, 8, 8))
+    generator.set_extraction(copy=True, pad_mode="constant")
+    generator.set_augmentation(tomograms.RandomOrientation())
+    batch = np.zeros((2, 8, 8, 8), dtype=np.float32)
+    for i in range(2):
+        sample = generator.positive_sample(out=batch[i])
+        assert np.array_equal(batch[i], sample.data)
@@ -1,6 +1,12 @@
 from .annotation import AnnotationFile
 from .annotation import Annotation
+from .annotation_table import AnnotationTable
+from .catalog import Catalog
 from .tomogram import TomogramFile
 from .tomogram import Tomogram
+from .tomogram import aload_all
+from .tomogram import shapes_from_annotations
+from .augmentation import Orientation
+from .augmentation import RandomOrientation
 
 from .supercomputer_utils import *
@@ -6,13 +6,27 @@ import imodmodel
 import pandas as pd
 import numpy as np
 
+import asyncio
 import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
 
 import os 
 
-from imodmodel import ImodModel
+from .cache import cache_path, temporary_path
 
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence
+
+# The IMOD file id and the start of the model header: "IMOD", the version,
+# the model name, then xmax, ymax, zmax and objsize, all big-endian. See
+# https://bio3d.colorado.edu/imod/doc/binspec.html
+_MOD_HEADER = struct.Struct(">4s4s128s4i")
+
+# Sidecar files of parsed points start with this magic, then the size and
+# modification time of the source file and the number of points, as
+# little-endian int64, followed by the points as little-endian float64.
+_POINTS_MAGIC = b"TOMOPTS1"
+_POINTS_HEADER = struct.Struct("<8s3q")
 
 class Annotation:
     """This class represents a tomogram annotation.
@@ -25,6 +39,17 @@ class Annotation:
         self.points = points
         self.name = "" if name is None else name
 
+    def scaled(self, factor: float) -> 'Annotation':
+        """Get a copy of this annotation on a voxel grid binned by `factor`.
+
+        Args:
+            factor (float): The binning factor, i.e., 2 for bin-2.
+
+        Returns:
+            A new Annotation with each point divided by `factor`.
+        """
+        return Annotation([point / factor for point in self.points], self.name)
+
 class AnnotationFile(Annotation):
     """This class represents an annotation file.
     
@@ -36,12 +61,22 @@ class AnnotationFile(Annotation):
         extension (str): File extension of this annotation file
         df (pandas.DataFrame): DataFrame of this file
     """
-    def __init__(self, filepath: str, name: Optional[str] = None):
+    def __init__(
+            self,
+            filepath: str,
+            name: Optional[str] = None,
+            *,
+            cache_dir: Optional[str] = None
+        ):
         """Initializes an AnnotationFile with a .mod file.
 
         Args:
             filepath (str): The filepath of the annotation to load
             name (str): The name of this annotation
+            cache_dir (str, optional): If given, the points of a .mod file are
+                read and written through a sidecar cache in this directory
+                (see `cached_mod_points`). Defaults to None, in which case the
+                file is parsed and nothing is written.
 
         Raises:
             IOError: If the file extension is not .mod or .ndjson.
@@ -51,12 +86,112 @@ class AnnotationFile(Annotation):
         self.extension = extension
 
         if self.extension == ".mod":
-            points = AnnotationFile.mod_points(self.filepath)
+            if cache_dir is not None:
+                points = AnnotationFile.cached_mod_points(self.filepath, cache_dir)
+            else:
+                points = AnnotationFile.mod_points(self.filepath)
         elif self.extension == ".ndjson":
             points = AnnotationFile.ndjson_points(self.filepath)
 
         super().__init__(points, name)
 
+    @staticmethod
+    def points_cache_path(filepath: str, cache_dir: str) -> str:
+        """Returns the path of the sidecar cache of a .mod file's points.
+
+        Args:
+            filepath (str): The .mod file.
+            cache_dir (str): Directory the cache is stored in.
+        """
+        return cache_path(filepath, "points", cache_dir, ext=".bin")
+
+    @staticmethod
+    def cached_mod_points(filepath: str, cache_dir: str) -> List[np.ndarray]:
+        """Reads the points of a .mod file through a sidecar cache.
+
+        The cache holds the parsed, reordered points along with the size and
+        modification time of the .mod file. If these still match, the points
+        are read with a single read and no parsing. Otherwise the file is
+        parsed with `mod_points` and the cache is rewritten. If the cache
+        cannot be written, the parsed points are returned all the same.
+
+        The cache is kept in `cache_dir` rather than next to the .mod file,
+        so that shared archives are not written to.
+
+        Args:
+            filepath (str)
+            cache_dir (str): Directory the cache is stored in.
+
+        Returns:
+            List of points in the annotation file.
+        """
+        stat = os.stat(filepath)
+        path = AnnotationFile.points_cache_path(filepath, cache_dir)
+        try:
+            with open(path, 'rb') as file:
+                raw = file.read()
+            magic, size, mtime_ns, n = _POINTS_HEADER.unpack_from(raw)
+            if magic == _POINTS_MAGIC and (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                points = np.frombuffer(raw, dtype="<f8", count=3 * n, offset=_POINTS_HEADER.size)
+                return list(points.astype(np.float64).reshape(n, 3))
+        except (OSError, struct.error, ValueError):
+            pass
+
+        points = AnnotationFile.mod_points(filepath)
+        array = np.reshape(np.asarray(points, dtype="<f8"), (-1, 3))
+        tmp = temporary_path(path)
+        try:
+            with open(tmp, 'wb') as file:
+                file.write(_POINTS_HEADER.pack(_POINTS_MAGIC, stat.st_size, stat.st_mtime_ns, len(array)))
+                file.write(array.tobytes())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        return points
+
+    @classmethod
+    async def aopen(cls, filepath: str, name: Optional[str] = None) -> 'AnnotationFile':
+        """Opens an AnnotationFile without blocking the event loop.
+
+        The file is parsed in a worker thread, so many files can be opened
+        concurrently.
+
+        Args:
+            filepath (str): The filepath of the annotation to load
+            name (str): The name of this annotation
+
+        Returns:
+            The opened AnnotationFile.
+        """
+        return await asyncio.to_thread(cls, filepath, name)
+
+    @staticmethod
+    async def aopen_all(
+            filepaths: Sequence[str],
+            names: Optional[Sequence[Optional[str]]] = None,
+            concurrency: int = 8
+        ) -> List['AnnotationFile']:
+        """Opens many annotation files concurrently.
+
+        Args:
+            filepaths (sequence of str): The files to open.
+            names (sequence of str, optional): The name of each annotation.
+                Defaults to None.
+            concurrency (int, optional): The maximum number of files parsed at
+                once. Defaults to 8.
+
+        Returns:
+            The opened AnnotationFiles, in the order of `filepaths`.
+        """
+        names = [None] * len(filepaths) if names is None else names
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def open_one(filepath, name):
+            async with semaphore:
+                return await AnnotationFile.aopen(filepath, name)
+
+        return await asyncio.gather(*(open_one(f, n) for f, n in zip(filepaths, names)))
+
     @staticmethod
     def check_ext(filepath: str, ext: str):
         """Ensures that filepath is of a given type.
@@ -99,15 +234,10 @@ class AnnotationFile(Annotation):
             List of points in the annotation file.
         """
         df = AnnotationFile.mod_to_pd(filepath)
-        points = []
-        for _, row in df.iterrows():
-            # Assumes point is 3D
-            dim_labels = ['x', 'y', 'z']
-            point = np.array([row[dim] for dim in dim_labels])
-            # The annotations seem to have been stored with this indexing. 
-            dims_order = [2, 1, 0] 
-            points.append(point[dims_order])
-        return points
+        # Assumes points are 3D. The annotations seem to have been stored
+        # with this indexing, so reorder to (z, y, x).
+        points = df[['z', 'y', 'x']].to_numpy(dtype=np.float64)
+        return list(points)
     
     @staticmethod
     def ndjson_points(filepath: str) -> List[np.ndarray]:
@@ -132,10 +262,74 @@ class AnnotationFile(Annotation):
                         points.append(point)       
         return points
     
+    @staticmethod
+    def read_mod_header(filepath: str) -> Dict[str, Any]:
+        """Reads the model header of a .mod file, without parsing its objects,
+        contours or points.
+
+        Args:
+            filepath (str)
+
+        Returns:
+            A dictionary of the `version`, `name`, `xmax`, `ymax`, `zmax` and
+                `objsize` fields of the header.
+
+        Raises:
+            IOError: If the file is not a .mod file.
+        """
+        AnnotationFile.check_ext(filepath, ".mod")
+        with open(filepath, 'rb') as file:
+            raw = file.read(_MOD_HEADER.size)
+        if len(raw) < _MOD_HEADER.size:
+            raise IOError(f"{filepath} is too short to be a .mod file.")
+        file_id, version, name, xmax, ymax, zmax, objsize = _MOD_HEADER.unpack(raw)
+        if file_id != b"IMOD":
+            raise IOError(f"{filepath} is not an IMOD model file.")
+        return {
+            "version": version.decode("ascii", "replace"),
+            "name": name.split(b"\x00")[0].decode("ascii", "replace"),
+            "xmax": xmax,
+            "ymax": ymax,
+            "zmax": zmax,
+            "objsize": objsize,
+        }
+
+    @staticmethod
+    def mod_shape(filepath: str) -> np.ndarray:
+        """Finds the shape of the parent tomogram of a .mod file from its
+        header alone.
+
+        Args:
+            filepath (str)
+
+        Returns:
+            Shape of the parent tomogram.
+
+        Raises:
+            IOError: If the file is not a .mod file.
+        """
+        header = AnnotationFile.read_mod_header(filepath)
+        return np.array([header["zmax"], header["xmax"], header["ymax"]])
+
+    @staticmethod
+    def mod_shapes(filepaths: Sequence[str], workers: int = 8) -> List[np.ndarray]:
+        """Reads the tomogram shapes of many .mod files in parallel.
+
+        Args:
+            filepaths (sequence of str): The files to read.
+            workers (int, optional): The number of files read at once.
+                Defaults to 8.
+
+        Returns:
+            The shape implied by each file, in the order of `filepaths`.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(AnnotationFile.mod_shape, filepaths))
+
     def tomogram_shape_from_mod(self):
         """
         Finds the shape of the parent tomogram of this annotation, if this
-        annotation is a `.mod` file.
+        annotation is a `.mod` file. Only the file header is read.
         
         Returns:
             Shape of the parent tomogram.
@@ -143,8 +337,4 @@ class AnnotationFile(Annotation):
         Raises:
             IOError: If this annotation is not a .mod file.
         """
-        AnnotationFile.check_ext(self.filepath, ".mod")
-        header = ImodModel.from_file(self.filepath).header
-        return np.array([header.zmax, header.xmax, header.ymax])
-
-    
\ No newline at end of file
+        return AnnotationFile.mod_shape(self.filepath)
@@ -0,0 +1,282 @@
+"""
+This module provides a compact, column-oriented store of annotation points
+across many tomograms, for dataset-wide queries without walking Annotation
+objects.
+"""
+
+from .annotation import Annotation
+
+import numpy as np
+
+from typing import Dict, Hashable, List, Optional, Sequence
+
+
+class TomogramAnnotations:
+    """A lightweight view of one tomogram's rows in an AnnotationTable.
+
+    Attributes:
+        table (AnnotationTable): The table this view belongs to.
+
+        tomogram (int): The tomogram id of this view.
+    """
+    __slots__ = ("table", "tomogram", "_start", "_stop")
+
+    def __init__(self, table: 'AnnotationTable', tomogram: int):
+        self.table = table
+        self.tomogram = tomogram
+        self._start = int(table.offsets[tomogram])
+        self._stop = int(table.offsets[tomogram + 1])
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    @property
+    def points(self) -> np.ndarray:
+        """An (N, 3) view of this tomogram's points."""
+        return self.table.points[self._start : self._stop]
+
+    @property
+    def annotation_ids(self) -> np.ndarray:
+        """The annotation id of each of this tomogram's points."""
+        return self.table.annotation_ids[self._start : self._stop]
+
+    @property
+    def name_codes(self) -> np.ndarray:
+        """The interned name code of each of this tomogram's points."""
+        return self.table.name_codes[self._start : self._stop]
+
+    def annotations(self) -> List[Annotation]:
+        """Rebuilds this tomogram's annotations as Annotation objects.
+
+        Returns:
+            One Annotation per annotation id, in order.
+        """
+        ids = self.annotation_ids
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) > 0 else []
+        bounds = list(starts) + [len(ids)]
+        return [
+            Annotation(list(self.points[a:b]), self.table.names[self.name_codes[a]])
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+
+
+class AnnotationTable:
+    """Annotation points of many tomograms, stored in contiguous arrays.
+
+    Rows are points, grouped by tomogram. Annotation names are interned: each
+    distinct name is stored once in `names`, and rows refer to it by index.
+
+    Attributes:
+        points (numpy.ndarray): An (N, 3) float64 array of points.
+
+        tomogram_ids (numpy.ndarray): The tomogram id of each point.
+
+        annotation_ids (numpy.ndarray): The id of the annotation each point
+        belongs to, unique across the table.
+
+        name_codes (numpy.ndarray): The index into `names` of each point's
+        annotation name.
+
+        names (list of str): The distinct annotation names.
+
+        offsets (numpy.ndarray): Rows `offsets[t]` to `offsets[t + 1]` belong
+        to tomogram `t`.
+
+        sources (list of str or None): The file path of each tomogram, if
+        known.
+
+        shapes (numpy.ndarray or None): A (T, 3) array of the shape of each
+        tomogram, if known.
+    """
+    __slots__ = (
+        "points", "tomogram_ids", "annotation_ids", "name_codes",
+        "names", "offsets", "sources", "shapes", "_codes"
+    )
+
+    def __init__(
+            self,
+            points: np.ndarray,
+            tomogram_ids: np.ndarray,
+            annotation_ids: np.ndarray,
+            name_codes: np.ndarray,
+            names: List[str],
+            n_tomograms: int,
+            sources: Optional[List[Optional[str]]] = None,
+            shapes: Optional[np.ndarray] = None
+        ):
+        """Initializes an AnnotationTable from its columns. Rows must be sorted
+        by tomogram id; use `from_tomograms` to build one.
+        """
+        self.points = points
+        self.tomogram_ids = tomogram_ids
+        self.annotation_ids = annotation_ids
+        self.name_codes = name_codes
+        self.names = names
+        self.offsets = np.searchsorted(tomogram_ids, np.arange(n_tomograms + 1))
+        self.sources = sources
+        self.shapes = shapes
+        self._codes = {name: code for code, name in enumerate(names)}
+
+    @classmethod
+    def from_tomograms(cls, tomograms: Sequence, *, read_shapes: bool = False) -> 'AnnotationTable':
+        """Builds a table from tomograms, i.e., the output of
+        `all_fm_tomograms()`.
+
+        Args:
+            tomograms (sequence of Tomogram): The tomograms, whose index in
+            the sequence becomes their tomogram id.
+
+            read_shapes (bool, optional): Whether to read the shape of each
+            unloaded TomogramFile from its file header, so that border queries
+            work. Defaults to False, in which case shapes are recorded only
+            for loaded tomograms.
+
+        Returns:
+            The table.
+        """
+        names: List[str] = []
+        codes: Dict[str, int] = {}
+        blocks, tomogram_ids, annotation_ids, name_codes = [], [], [], []
+        shapes = np.full((len(tomograms), 3), -1, dtype=np.int64)
+        annotation_id = 0
+        for tomogram_id, tomogram in enumerate(tomograms):
+            if getattr(tomogram, "shape", None) is not None:
+                shapes[tomogram_id] = tomogram.shape
+            elif read_shapes:
+                shapes[tomogram_id] = tomogram.header_shape()
+            for annotation in tomogram.annotations or []:
+                points = np.reshape(np.asarray(annotation.points, dtype=np.float64), (-1, 3))
+                if annotation.name not in codes:
+                    codes[annotation.name] = len(names)
+                    names.append(annotation.name)
+                n = len(points)
+                blocks.append(points)
+                tomogram_ids.append(np.full(n, tomogram_id, dtype=np.int32))
+                annotation_ids.append(np.full(n, annotation_id, dtype=np.int32))
+                name_codes.append(np.full(n, codes[annotation.name], dtype=np.int32))
+                annotation_id += 1
+
+        def stack(arrays, dtype, shape=(0,)):
+            return np.concatenate(arrays) if len(arrays) > 0 else np.zeros(shape, dtype=dtype)
+
+        return cls(
+            stack(blocks, np.float64, (0, 3)),
+            stack(tomogram_ids, np.int32),
+            stack(annotation_ids, np.int32),
+            stack(name_codes, np.int32),
+            names,
+            len(tomograms),
+            [getattr(t, "filepath", None) for t in tomograms],
+            shapes if np.all(shapes >= 0) else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def n_tomograms(self) -> int:
+        """The number of tomograms in the table."""
+        return len(self.offsets) - 1
+
+    def name_code(self, name: str) -> int:
+        """Returns the interned code of an annotation name.
+
+        Raises:
+            KeyError: If no annotation has this name.
+        """
+        return self._codes[name]
+
+    def view(self, tomogram: int) -> TomogramAnnotations:
+        """Returns a view of one tomogram's rows, without copying.
+
+        Args:
+            tomogram (int): The tomogram id.
+        """
+        return TomogramAnnotations(self, tomogram)
+
+    def mask(self, name: Optional[str] = None) -> np.ndarray:
+        """Returns a boolean mask of rows with the given annotation name.
+
+        Args:
+            name (str, optional): The annotation name. Defaults to None, in
+            which case every row is selected.
+        """
+        if name is None:
+            return np.ones(len(self), dtype=bool)
+        if name not in self._codes:
+            return np.zeros(len(self), dtype=bool)
+        return self.name_codes == self._codes[name]
+
+    def counts_per_tomogram(self, name: Optional[str] = None, *, annotations: bool = False) -> np.ndarray:
+        """Counts points, or annotations, in each tomogram.
+
+        Args:
+            name (str, optional): Only count annotations with this name.
+            Defaults to None.
+
+            annotations (bool, optional): Whether to count annotations rather
+            than points. Defaults to False.
+
+        Returns:
+            An array of one count per tomogram.
+        """
+        mask = self.mask(name)
+        if annotations:
+            ids, first = np.unique(self.annotation_ids[mask], return_index=True)
+            tomogram_ids = self.tomogram_ids[mask][first]
+        else:
+            tomogram_ids = self.tomogram_ids[mask]
+        return np.bincount(tomogram_ids, minlength=self.n_tomograms)
+
+    def counts_by_group(
+            self,
+            groups: Sequence[Hashable],
+            name: Optional[str] = None,
+            *,
+            annotations: bool = False
+        ) -> Dict[Hashable, int]:
+        """Totals counts over groups of tomograms, i.e., species.
+
+        Args:
+            groups (sequence): The group label of each tomogram.
+
+            name (str, optional): Only count annotations with this name.
+            Defaults to None.
+
+            annotations (bool, optional): Whether to count annotations rather
+            than points. Defaults to False.
+
+        Returns:
+            A dictionary from group label to count.
+        """
+        labels, inverse = np.unique(np.asarray(groups), return_inverse=True)
+        per_tomogram = self.counts_per_tomogram(name, annotations=annotations)
+        totals = np.bincount(inverse, weights=per_tomogram, minlength=len(labels))
+        return {label.item(): int(total) for label, total in zip(labels, totals)}
+
+    def border_distances(self) -> np.ndarray:
+        """Computes the distance from each point to the nearest face of its
+        tomogram, in voxels.
+
+        Returns:
+            An array of one distance per point.
+
+        Raises:
+            Exception: If the shapes of the tomograms are not known.
+        """
+        if self.shapes is None:
+            raise Exception("Tomogram shapes are unknown. Build the table with read_shapes=True.")
+        shapes = self.shapes[self.tomogram_ids]
+        return np.minimum(self.points, shapes - 1 - self.points).min(axis=1)
+
+    def near_border(self, distance: float, name: Optional[str] = None) -> np.ndarray:
+        """Returns a boolean mask of points within `distance` voxels of the
+        border of their tomogram.
+
+        Args:
+            distance (float): The distance from the border.
+
+            name (str, optional): Only select annotations with this name.
+            Defaults to None.
+        """
+        return (self.border_distances() < distance) & self.mask(name)
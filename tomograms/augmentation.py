@@ -0,0 +1,205 @@
+"""
+This module provides random flips, 90 degree rotations and axis transposes of
+subtomograms that keep annotation points consistent with the data.
+"""
+
+from .annotation import Annotation
+
+import itertools
+
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class Orientation:
+    """A flip, 90 degree rotation or transpose of a volume.
+
+    Every such transform is a signed permutation of the volume's axes: output
+    axis `i` is input axis `axes[i]`, reversed if `flips[i]` is True. Applying
+    it to data gives a strided view, and applying it to points is a single
+    affine map.
+
+    Attributes:
+        axes (tuple of int): The input axis that becomes each output axis.
+
+        flips (tuple of bool): Whether each output axis is reversed.
+    """
+    def __init__(self, axes: Sequence[int], flips: Sequence[bool]):
+        """Initializes an Orientation.
+
+        Args:
+            axes (sequence of int): A permutation of `(0, 1, 2)`.
+
+            flips (sequence of bool): Whether to reverse each output axis.
+        """
+        self.axes = tuple(int(a) for a in axes)
+        self.flips = tuple(bool(f) for f in flips)
+
+    def matrix(self) -> np.ndarray:
+        """Returns the signed permutation matrix of this orientation.
+
+        Returns:
+            A 3x3 array `M` such that a point `p` maps to `M @ p` plus an
+            offset that depends on the shape of the volume.
+        """
+        matrix = np.zeros((3, 3))
+        for out_axis, (in_axis, flip) in enumerate(zip(self.axes, self.flips)):
+            matrix[out_axis, in_axis] = -1 if flip else 1
+        return matrix
+
+    def apply_data(self, data: np.ndarray, *, copy: bool = False) -> np.ndarray:
+        """Orients a volume.
+
+        Args:
+            data (numpy.ndarray): The volume to orient.
+
+            copy (bool, optional): Whether to return a contiguous copy instead
+            of a strided view of `data`. Defaults to False.
+
+        Returns:
+            The oriented volume.
+        """
+        steps = tuple(slice(None, None, -1 if f else None) for f in self.flips)
+        oriented = np.transpose(data, self.axes)[steps]
+        return np.ascontiguousarray(oriented) if copy else oriented
+
+    def apply_points(self, points: np.ndarray, shape: Sequence[int]) -> np.ndarray:
+        """Orients points in a volume of the given shape.
+
+        Args:
+            points (numpy.ndarray): An (N, 3) array of points.
+
+            shape (sequence of int): The shape of the volume before it is
+            oriented.
+
+        Returns:
+            An (N, 3) array of the oriented points.
+        """
+        out_shape = np.array([shape[a] for a in self.axes])
+        offset = np.where(self.flips, out_shape - 1, 0)
+        return points @ self.matrix().T + offset
+
+
+class RandomOrientation:
+    """An augmentation stage that randomly orients subtomograms.
+
+    Only axes of equal length are transposed, so the shape of an augmented
+    subtomogram always matches its shape before augmentation. For the default
+    `(64, 256, 256)` volumes, this means flips along any axis and 90 degree
+    rotations about the first axis.
+
+    Attributes:
+        flip (bool): Whether to randomly flip axes.
+
+        transpose (bool): Whether to randomly transpose axes of equal length.
+
+        copy (bool): Whether augmented data is made contiguous.
+
+        gen (np.random.Generator): Random number generator for sampling.
+    """
+    def __init__(
+            self,
+            *,
+            flip: bool = True,
+            transpose: bool = True,
+            copy: bool = False,
+            gen: Optional[np.random.Generator] = None
+        ):
+        """Initializes a RandomOrientation augmentation stage.
+
+        Args:
+            flip (bool, optional): Whether to randomly flip axes. Defaults to
+            True.
+
+            transpose (bool, optional): Whether to randomly transpose axes of
+            equal length. Together with flips, this gives 90 degree rotations.
+            Defaults to True.
+
+            copy (bool, optional): Whether to make augmented data contiguous
+            instead of leaving it a strided view. Defaults to False.
+
+            gen (np.random.Generator, optional): Random number generator for
+            sampling. Defaults to None, in which case a new one is created.
+        """
+        self.flip = flip
+        self.transpose = transpose
+        self.copy = copy
+        self.gen = np.random.default_rng() if gen is None else gen
+        self._permutations: Dict[Tuple[int, ...], List[Tuple[int, ...]]] = {}
+
+    def permutations(self, shape: Sequence[int]) -> List[Tuple[int, ...]]:
+        """Returns the axis permutations that preserve the given shape.
+
+        Args:
+            shape (sequence of int): The shape of the volume.
+
+        Returns:
+            The allowed permutations of `(0, 1, 2)`.
+        """
+        shape = tuple(shape)
+        if shape not in self._permutations:
+            if self.transpose:
+                self._permutations[shape] = [
+                    p for p in itertools.permutations(range(len(shape)))
+                    if all(shape[a] == s for a, s in zip(p, shape))
+                ]
+            else:
+                self._permutations[shape] = [tuple(range(len(shape)))]
+        return self._permutations[shape]
+
+    def sample(self, shape: Sequence[int], gen: Optional[np.random.Generator] = None) -> Orientation:
+        """Draws a random orientation for a volume of the given shape.
+
+        Args:
+            shape (sequence of int): The shape of the volume.
+
+            gen (np.random.Generator, optional): Random number generator to
+            draw from. Defaults to None, in which case `self.gen` is used.
+
+        Returns:
+            The sampled orientation.
+        """
+        gen = self.gen if gen is None else gen
+        permutations = self.permutations(shape)
+        axes = permutations[gen.integers(len(permutations))]
+        if self.flip:
+            flips = gen.integers(2, size=len(shape)).astype(bool)
+        else:
+            flips = np.zeros(len(shape), dtype=bool)
+        return Orientation(axes, flips)
+
+    def __call__(self, tomogram, gen: Optional[np.random.Generator] = None):
+        """Randomly orients a tomogram and its annotations in place.
+
+        All annotation points are transformed together in one vectorized
+        operation. The sampled orientation is stored in `tomogram.orientation`.
+
+        Args:
+            tomogram (Tomogram): The tomogram to augment, usually a
+            Subtomogram.
+
+            gen (np.random.Generator, optional): Random number generator to
+            draw the orientation from. Defaults to None, in which case
+            `self.gen` is used.
+
+        Returns:
+            The augmented tomogram.
+        """
+        shape = tomogram.data.shape
+        orientation = self.sample(shape, gen)
+        tomogram.data = orientation.apply_data(tomogram.data, copy=self.copy)
+        tomogram.shape = tomogram.data.shape
+
+        annotations = tomogram.annotations
+        counts = [len(a.points) for a in annotations]
+        if sum(counts) > 0:
+            points = np.concatenate([np.reshape(a.points, (-1, 3)) for a in annotations])
+            oriented = orientation.apply_points(points, shape)
+            splits = np.cumsum(counts)[:-1]
+            tomogram.annotations = [
+                Annotation(list(chunk), a.name)
+                for a, chunk in zip(annotations, np.split(oriented, splits))
+            ]
+        tomogram.orientation = orientation
+        return tomogram
@@ -0,0 +1,77 @@
+"""
+Helpers for locating and validating on-disk caches derived from tomogram and
+annotation files.
+"""
+
+import hashlib
+import os
+import threading
+
+from typing import Optional
+
+
+def cache_path(
+        source: str,
+        tag: str,
+        cache_dir: Optional[str] = None,
+        ext: str = ".npy"
+    ) -> str:
+    """Returns the path of a cache file derived from `source`.
+
+    If `cache_dir` is None, the cache sits next to `source`. Otherwise it is
+    placed in `cache_dir`, and a hash of the absolute source path is added to
+    the filename so that sources with the same name in different directories
+    do not collide.
+
+    Args:
+        source (str): The file the cache is derived from.
+
+        tag (str): A short label for the kind of cache, i.e., "bin2".
+
+        cache_dir (str, optional): Directory to store the cache in. Defaults
+        to None.
+
+        ext (str, optional): Extension of the cache file. Defaults to ".npy".
+
+    Returns:
+        The path of the cache file.
+    """
+    root, _ = os.path.splitext(os.path.basename(source))
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(source), f"{root}.{tag}{ext}")
+    digest = hashlib.sha1(os.path.abspath(source).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{root}-{digest[:12]}.{tag}{ext}")
+
+
+def is_fresh(cache: str, source: str) -> bool:
+    """Checks whether a cache file exists and is at least as new as its source.
+
+    Args:
+        cache (str): The cache file.
+
+        source (str): The file the cache was derived from.
+
+    Returns:
+        True if the cache can be used in place of recomputing it.
+    """
+    if not os.path.exists(cache):
+        return False
+    return os.path.getmtime(cache) >= os.path.getmtime(source)
+
+
+def temporary_path(path: str) -> str:
+    """Returns a sibling path to write to before atomically moving the result
+    to `path` with `os.replace`.
+
+    Writing caches this way means that concurrent jobs and threads never see a
+    partially written file.
+
+    Args:
+        path (str): The final path of the file.
+
+    Returns:
+        A temporary path in the same directory as `path`.
+    """
+    directory, name = os.path.split(path)
+    # Keep the extension last so that numpy does not append its own.
+    return os.path.join(directory, f".tmp-{os.getpid()}-{threading.get_ident()}-{name}")
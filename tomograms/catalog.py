@@ -0,0 +1,238 @@
+"""
+This module provides catalogs: a list of tomogram files, their annotations
+and their shapes, saved to a JSON file so that a dataset is discovered once
+rather than by walking the filesystem every time it is used.
+"""
+
+from .annotation import Annotation, AnnotationFile
+from .summary import DatasetSummary, summarize
+from .tomogram import TomogramFile
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class Catalog:
+    """A saved list of tomogram files and their annotations.
+
+    Each entry records the tomogram file, its annotations, and, where known,
+    its shape and the size and modification time of the file when the
+    catalog was made.
+
+    Attributes:
+        entries (list of dict): One entry per tomogram, with keys `filepath`,
+        `annotations`, `shape`, `source_size` and `source_mtime_ns`.
+        Annotations are stored as `{"filepath", "name"}` for annotation files
+        and as `{"points", "name"}` otherwise.
+
+        summary (DatasetSummary): The dataset profile made by `summarize`, or
+        None.
+    """
+    def __init__(self, entries: List[Dict[str, Any]], summary: Optional[DatasetSummary] = None):
+        """Initializes a Catalog from its entries; use `from_tomograms` to
+        build one.
+        """
+        self.entries = entries
+        self.summary = summary
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def _entry(tomogram: TomogramFile, read_shape: bool) -> Dict[str, Any]:
+        annotations = []
+        for annotation in tomogram.annotations or []:
+            if isinstance(annotation, AnnotationFile):
+                annotations.append({"filepath": annotation.filepath, "name": annotation.name})
+            else:
+                points = np.reshape(np.asarray(annotation.points, dtype=np.float64), (-1, 3))
+                annotations.append({"points": points.tolist(), "name": annotation.name})
+        entry = {
+            "filepath": tomogram.filepath,
+            "annotations": annotations,
+            "shape": None,
+            "source_size": None,
+            "source_mtime_ns": None,
+        }
+        if os.path.exists(tomogram.filepath):
+            entry.update(tomogram._source_signature())
+            if tomogram.shape is not None:
+                entry["shape"] = [int(s) for s in tomogram.shape]
+            elif read_shape:
+                entry["shape"] = list(tomogram.header_shape())
+        return entry
+
+    @classmethod
+    def from_tomograms(
+            cls,
+            tomograms: Sequence[TomogramFile],
+            *,
+            read_shapes: bool = True,
+            workers: int = 8
+        ) -> 'Catalog':
+        """Builds a catalog from tomogram files, i.e., the output of
+        `all_fm_tomograms()`.
+
+        Args:
+            tomograms (sequence of TomogramFile): The tomograms.
+
+            read_shapes (bool, optional): Whether to read the shape of each
+            unloaded tomogram from its file header. Defaults to True.
+
+            workers (int, optional): The number of files inspected at once.
+            Defaults to 8.
+
+        Returns:
+            The catalog.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(lambda t: Catalog._entry(t, read_shapes), tomograms))
+        return cls(entries)
+
+    def tomograms(self, *, cache_dir: Optional[str] = None, quantize: Optional[type] = None) -> List[TomogramFile]:
+        """Creates unloaded TomogramFiles for the entries of this catalog.
+
+        Annotation files are opened, so their points are read, through sidecar
+        caches in `cache_dir` if it is given.
+
+        Args:
+            cache_dir (str, optional): The `cache_dir` of each TomogramFile
+            and AnnotationFile. Defaults to None.
+
+            quantize (type, optional): The `quantize` of each TomogramFile.
+            Defaults to None.
+
+        Returns:
+            One TomogramFile per entry, in order.
+        """
+        tomograms = []
+        for entry in self.entries:
+            annotations: List[Annotation] = []
+            for annotation in entry["annotations"]:
+                if "filepath" in annotation:
+                    annotations.append(AnnotationFile(
+                        annotation["filepath"], annotation["name"], cache_dir=cache_dir
+                    ))
+                else:
+                    points = [np.array(point) for point in annotation["points"]]
+                    annotations.append(Annotation(points, annotation["name"]))
+            tomogram = TomogramFile(
+                entry["filepath"], annotations, load=False, cache_dir=cache_dir, quantize=quantize
+            )
+            if entry["shape"] is not None:
+                tomogram.shape = tuple(entry["shape"])
+            tomograms.append(tomogram)
+        return tomograms
+
+    def filepaths(self) -> List[str]:
+        """Returns the tomogram file of each entry."""
+        return [entry["filepath"] for entry in self.entries]
+
+    def stale(self) -> List[int]:
+        """Finds the entries whose tomogram file changed or disappeared since
+        the catalog was made.
+
+        Returns:
+            The indices of the stale entries.
+        """
+        stale = []
+        for index, entry in enumerate(self.entries):
+            try:
+                stat = os.stat(entry["filepath"])
+            except OSError:
+                stale.append(index)
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (entry["source_size"], entry["source_mtime_ns"]):
+                stale.append(index)
+        return stale
+
+    def summarize(
+            self,
+            *,
+            bins: int = 1024,
+            range: Optional[Tuple[float, float]] = None,
+            workers: int = 8,
+            slab: int = 16,
+            cache_dir: Optional[str] = None
+        ) -> DatasetSummary:
+        """Profiles the catalogued tomograms in one streaming pass (see
+        `summary.summarize`) and stores the result in `self.summary`, so that
+        it is saved with the catalog.
+
+        Tomograms unchanged since an earlier `summarize` with the same
+        histogram bins are not read again. Entries without a shape get the
+        shape found.
+
+        Args:
+            bins (int, optional): The number of histogram bins. Defaults to
+            1024.
+
+            range (tuple of float, optional): The range of the histogram.
+            Defaults to None, in which case it covers all intensities: the
+            range of the earlier summary is kept if no tomogram changed, and
+            otherwise it is found with `summary.histogram_range`, which reads
+            tomograms without MRC header statistics in full.
+
+            workers (int, optional): The number of tomograms summarized at
+            once. Defaults to 8.
+
+            slab (int, optional): The number of z-slices read at a time.
+            Defaults to 16.
+
+            cache_dir (str, optional): The `cache_dir` of the annotation
+            files. Defaults to None.
+
+        Returns:
+            The summary.
+        """
+        tomograms = self.tomograms(cache_dir=cache_dir)
+        self.summary = summarize(
+            tomograms, bins=bins, range=range, workers=workers, slab=slab, previous=self.summary
+        )
+        for entry, summary in zip(self.entries, self.summary.tomograms):
+            if entry["shape"] is None:
+                entry["shape"] = list(summary.shape)
+        return self.summary
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable representation of this catalog."""
+        data: Dict[str, Any] = {"tomograms": self.entries}
+        if self.summary is not None:
+            data["summary"] = self.summary.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Catalog':
+        """Reconstructs a catalog from the output of `to_dict`."""
+        summary = data.get("summary")
+        return cls(
+            list(data["tomograms"]),
+            None if summary is None else DatasetSummary.from_dict(summary)
+        )
+
+    def save(self, filepath: str):
+        """Saves this catalog as a JSON file.
+
+        Args:
+            filepath (str): The file to write.
+        """
+        with open(filepath, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'Catalog':
+        """Loads a catalog saved with `save`.
+
+        Args:
+            filepath (str): The file to read.
+
+        Returns:
+            The loaded catalog.
+        """
+        with open(filepath, 'r') as file:
+            return cls.from_dict(json.load(file))
@@ -0,0 +1,354 @@
+"""
+The `tomograms` command, for preparing datasets in bulk.
+
+    tomograms discover --root ARCHIVE --dir-regex 'dg\\d{4}.*' \\
+        --tomogram-regex '.*\\.rec$' --annotation-regex '^FM\\.mod$' \\
+        --annotation-name 'Flagellar Motor'
+    tomograms catalog -o catalog.json --fm --workers 16
+    tomograms preprocess catalog.json --workers 16 --quantize uint8
+    tomograms pyramid catalog.json --levels 2 --workers 16
+    tomograms summarize catalog.json --bins 1024 --workers 16
+
+`discover` prints the tomograms found, and `catalog` saves them as a Catalog.
+`preprocess` writes the preprocessed copy of each tomogram in a catalog (see
+`TomogramFile.write_processed`), and `pyramid` computes binned copies (see
+`TomogramFile.build_pyramid`). Up-to-date outputs are skipped unless `--force`
+is given. Progress is reported on stderr. `summarize` profiles the dataset in
+one streaming pass and saves the profile in the catalog (see
+`Catalog.summarize`).
+
+In a Slurm job array, `preprocess` and `pyramid` handle only this task's
+share of the catalog, balanced by voxel count (see `shard_tomograms`), so
+`sbatch --array=0-7` spreads the work over 8 nodes. `--rank` and
+`--world-size` override the Slurm variables.
+"""
+
+from .cache import is_fresh
+from .catalog import Catalog
+from .supercomputer_utils import all_fm_tomograms, array_rank, seek_annotated_tomos, seek_dirs, shard_tomograms
+from .tomogram import TomogramFile
+
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from typing import Callable, List, Optional, TextIO
+
+
+class Progress:
+    """Reports the progress of a batch of tomograms, with throughput and an
+    estimate of the time remaining.
+
+    Attributes:
+        total (int): The number of tomograms in the batch.
+
+        total_bytes (int): The total size of their files.
+
+        done (int): The number of tomograms finished, including skipped ones.
+
+        done_bytes (int): The total size of the files worked on, excluding
+        skipped and failed ones, from which throughput is measured.
+
+        skipped (int): The number of tomograms that were already up to date.
+
+        skipped_bytes (int): The total size of the files skipped.
+
+        failed (int): The number of tomograms that raised an exception.
+
+        failed_bytes (int): The total size of the files that failed.
+    """
+    def __init__(self, total: int, total_bytes: int, stream: Optional[TextIO] = None):
+        self.total = total
+        self.total_bytes = total_bytes
+        self.done = 0
+        self.done_bytes = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self.failed = 0
+        self.failed_bytes = 0
+        self.stream = sys.stderr if stream is None else stream
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def update(self, nbytes: int, *, skipped: bool = False, failed: bool = False):
+        """Records a finished tomogram and reports progress.
+
+        Args:
+            nbytes (int): The size of its file.
+
+            skipped (bool, optional): Whether it was already up to date.
+            Defaults to False.
+
+            failed (bool, optional): Whether it raised an exception. Defaults
+            to False.
+        """
+        with self._lock:
+            self.done += 1
+            if skipped:
+                # Skipping takes no time, so it says nothing about throughput
+                self.skipped_bytes += nbytes
+            elif failed:
+                # Neither does failing part of the way through
+                self.failed_bytes += nbytes
+            else:
+                self.done_bytes += nbytes
+            self.skipped += skipped
+            self.failed += failed
+            self.stream.write("\r" + self.line())
+            if self.done == self.total:
+                self.stream.write("\n")
+            self.stream.flush()
+
+    def line(self) -> str:
+        """Returns a one-line summary of the progress so far.
+
+        Throughput counts only the tomograms that were worked on and
+        succeeded, and the time remaining
+        assumes that none of the tomograms left are up to date.
+        """
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        rate = self.done_bytes / elapsed
+        per_minute = 60 * (self.done - self.skipped - self.failed) / elapsed
+        remaining = self.total_bytes - self.done_bytes - self.skipped_bytes - self.failed_bytes
+        eta = remaining / rate if rate > 0 else float("nan")
+        return (
+            f"[{self.done}/{self.total}] {rate / 1e9:.2f} GB/s "
+            f"{per_minute:.1f} tomograms/min "
+            f"ETA {_duration(eta)} "
+            f"({self.skipped} up to date, {self.failed} failed)"
+        )
+
+
+def _duration(seconds: float) -> str:
+    if not np.isfinite(seconds):
+        return "?"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def _file_size(filepath: str) -> int:
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
+def run_batch(
+        tomograms: List[TomogramFile],
+        task: Callable[[TomogramFile], bool],
+        workers: int = 1,
+        stream: Optional[TextIO] = None
+    ) -> Progress:
+    """Runs a task on each tomogram in a thread pool, reporting progress.
+
+    Args:
+        tomograms (list of TomogramFile): The tomograms.
+
+        task (callable): Takes a tomogram, and returns True if it did work or
+        False if the tomogram was already up to date.
+
+        workers (int, optional): The number of tomograms processed at once.
+        Defaults to 1.
+
+        stream (file, optional): Where to report progress. Defaults to None,
+        in which case stderr is used.
+
+    Returns:
+        The final progress.
+    """
+    sizes = [_file_size(t.filepath) for t in tomograms]
+    progress = Progress(len(tomograms), sum(sizes), stream)
+
+    def run(tomogram):
+        try:
+            return task(tomogram), None
+        except Exception as e:
+            return True, e
+        finally:
+            # Drop the data so that memory use stays bounded
+            tomogram.data = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, t): (t, size) for t, size in zip(tomograms, sizes)}
+        for future in as_completed(futures):
+            tomogram, size = futures[future]
+            worked, error = future.result()
+            if error is not None:
+                progress.stream.write(f"\n{tomogram.filepath}: {error}\n")
+            progress.update(size, skipped=not worked, failed=error is not None)
+    return progress
+
+
+def discover(args: argparse.Namespace) -> List[TomogramFile]:
+    """Finds the tomograms described by the source arguments."""
+    if args.fm:
+        return all_fm_tomograms()
+    if args.root is None:
+        raise SystemExit("Either --fm or --root is required.")
+    names = args.annotation_name or []
+    names += [None] * (len(args.annotation_regex) - len(names))
+    directories = seek_dirs(args.root, re.compile(args.dir_regex))
+    return seek_annotated_tomos(
+        directories,
+        re.compile(args.tomogram_regex),
+        [re.compile(r) for r in args.annotation_regex],
+        names
+    )
+
+
+def _discover(args: argparse.Namespace) -> int:
+    tomograms = discover(args)
+    for tomogram in tomograms:
+        annotations = [getattr(a, "filepath", "") for a in tomogram.annotations]
+        print("\t".join([tomogram.filepath] + annotations))
+    print(f"{len(tomograms)} tomograms found.", file=sys.stderr)
+    return 0
+
+
+def _catalog(args: argparse.Namespace) -> int:
+    tomograms = discover(args)
+    catalog = Catalog.from_tomograms(tomograms, read_shapes=not args.no_shapes, workers=args.workers)
+    catalog.save(args.output)
+    print(f"{len(catalog)} tomograms catalogued in {args.output}.", file=sys.stderr)
+    return 0
+
+
+def _quantize_dtype(name: Optional[str]) -> Optional[type]:
+    return None if name is None else {"uint8": np.uint8, "uint16": np.uint16}[name]
+
+
+def _catalog_share(args: argparse.Namespace, **kwargs) -> List[TomogramFile]:
+    """Opens this task's share of the tomograms in the catalog."""
+    rank, world_size = array_rank(args.rank, args.world_size)
+    tomograms = Catalog.load(args.catalog).tomograms(cache_dir=args.cache_dir, **kwargs)
+    if world_size > 1:
+        tomograms = shard_tomograms(tomograms, rank, world_size)
+        print(f"Rank {rank} of {world_size}: {len(tomograms)} tomograms.", file=sys.stderr)
+    return tomograms
+
+
+def _preprocess(args: argparse.Namespace) -> int:
+    tomograms = _catalog_share(args, quantize=_quantize_dtype(args.quantize))
+
+    def task(tomogram):
+        if not args.force and tomogram.processed_is_fresh():
+            return False
+        tomogram.write_processed(workers=args.threads, force=args.force)
+        return True
+
+    progress = run_batch(tomograms, task, args.workers)
+    return 1 if progress.failed else 0
+
+
+def _pyramid(args: argparse.Namespace) -> int:
+    tomograms = _catalog_share(args)
+
+    def task(tomogram):
+        paths = [tomogram.pyramid_path(level) for level in range(1, args.levels + 1)]
+        if not args.force and all(is_fresh(p, tomogram.filepath) for p in paths):
+            return False
+        tomogram.build_pyramid(args.levels, force=args.force)
+        return True
+
+    progress = run_batch(tomograms, task, args.workers)
+    return 1 if progress.failed else 0
+
+
+def _summarize(args: argparse.Namespace) -> int:
+    catalog = Catalog.load(args.catalog)
+    if args.force:
+        catalog.summary = None
+    summary = catalog.summarize(bins=args.bins, workers=args.workers, slab=args.slab, cache_dir=args.cache_dir)
+    catalog.save(args.catalog)
+    intensity = summary.intensity
+    if intensity is not None:
+        p2, p98 = intensity.quantile([0.02, 0.98])
+        print(
+            f"{intensity.count} voxels: mean {intensity.mean:.4g}, std {intensity.std():.4g}, "
+            f"range [{intensity.minimum:.4g}, {intensity.maximum:.4g}], "
+            f"2nd-98th percentile [{p2:.4g}, {p98:.4g}]",
+            file=sys.stderr
+        )
+    for name, count in summary.annotation_counts().items():
+        print(f"{count} points named {name!r}", file=sys.stderr)
+    print(f"{len(summary)} tomograms summarized in {args.catalog}.", file=sys.stderr)
+    return 0
+
+
+def _add_source_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--fm", action="store_true",
+                        help="use all_fm_tomograms() instead of searching --root")
+    parser.add_argument("--root", type=str, default=None, help="directory to search")
+    parser.add_argument("--dir-regex", type=str, default=".*",
+                        help="regex of the directories holding one tomogram each")
+    parser.add_argument("--tomogram-regex", type=str, default=r".*\.rec$",
+                        help="regex of tomogram filenames")
+    parser.add_argument("--annotation-regex", type=str, action="append", default=[],
+                        help="regex of annotation filenames; may be repeated")
+    parser.add_argument("--annotation-name", type=str, action="append", default=None,
+                        help="name of the annotations matching each --annotation-regex")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="tomograms", description="Prepare tomogram datasets.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_discover = subparsers.add_parser("discover", help="list tomograms and their annotations")
+    _add_source_arguments(parser_discover)
+    parser_discover.set_defaults(func=_discover)
+
+    parser_catalog = subparsers.add_parser("catalog", help="save discovered tomograms as a catalog")
+    _add_source_arguments(parser_catalog)
+    parser_catalog.add_argument("-o", "--output", type=str, required=True, help="catalog file to write")
+    parser_catalog.add_argument("--no-shapes", action="store_true",
+                                help="do not read tomogram shapes from file headers")
+    parser_catalog.add_argument("--workers", type=int, default=8, help="files inspected at once")
+    parser_catalog.set_defaults(func=_catalog)
+
+    for name, func, description in [
+            ("preprocess", _preprocess, "write preprocessed copies of catalogued tomograms"),
+            ("pyramid", _pyramid, "write binned copies of catalogued tomograms")]:
+        subparser = subparsers.add_parser(name, help=description)
+        subparser.add_argument("catalog", type=str, help="catalog file written by `tomograms catalog`")
+        subparser.add_argument("--cache-dir", type=str, default=None,
+                               help="directory to write outputs and annotation caches to; by default "
+                                    "outputs go next to each tomogram and no annotation cache is written")
+        subparser.add_argument("--workers", type=int, default=1, help="tomograms processed at once")
+        subparser.add_argument("--force", action="store_true", help="rewrite up-to-date outputs")
+        subparser.add_argument("--rank", type=int, default=None,
+                               help="index of this task; defaults to the Slurm array task")
+        subparser.add_argument("--world-size", type=int, default=None,
+                               help="number of tasks; defaults to the Slurm array size")
+        subparser.set_defaults(func=func)
+        if name == "preprocess":
+            subparser.add_argument("--quantize", choices=["uint8", "uint16"], default=None,
+                                   help="store preprocessed data as this integer dtype")
+            subparser.add_argument("--threads", type=int, default=None,
+                                   help="threads preprocessing each tomogram")
+        else:
+            subparser.add_argument("--levels", type=int, default=1, help="number of binned levels")
+
+    parser_summarize = subparsers.add_parser("summarize", help="profile catalogued tomograms")
+    parser_summarize.add_argument("catalog", type=str, help="catalog file to profile and update")
+    parser_summarize.add_argument("--bins", type=int, default=1024, help="intensity histogram bins")
+    parser_summarize.add_argument("--slab", type=int, default=16, help="z-slices read at a time")
+    parser_summarize.add_argument("--cache-dir", type=str, default=None,
+                                  help="directory of annotation caches; by default annotations are "
+                                       "parsed and no cache is written")
+    parser_summarize.add_argument("--workers", type=int, default=8, help="tomograms read at once")
+    parser_summarize.add_argument("--force", action="store_true", help="reread unchanged tomograms")
+    parser_summarize.set_defaults(func=_summarize)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
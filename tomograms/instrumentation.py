@@ -0,0 +1,224 @@
+"""
+Opt-in timing and memory instrumentation for the loading and sampling paths.
+
+Instrumentation is disabled by default, in which case every instrumented
+stage costs a single global lookup. Enable it to collect per-stage wall time,
+bytes read, arrays allocated and rejection counts:
+
+    from tomograms import instrumentation
+    stats = instrumentation.enable()
+    tomo.load()
+    print(stats.report())
+
+Hooks receive every record as it is made, for export to other metrics
+systems.
+"""
+
+import threading
+import time
+
+from typing import Callable, Dict, List, Optional
+
+
+class StageStats:
+    """Accumulated counters for a single stage.
+
+    Attributes:
+        calls (int): Number of times the stage ran.
+        seconds (float): Total wall time spent in the stage.
+        bytes_read (int): Total bytes read from disk.
+        arrays (int): Number of arrays allocated.
+        bytes_allocated (int): Total bytes of the arrays allocated.
+        rejections (int): Number of rejected sampling attempts.
+    """
+    __slots__ = ("calls", "seconds", "bytes_read", "arrays", "bytes_allocated", "rejections")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes_read = 0
+        self.arrays = 0
+        self.bytes_allocated = 0
+        self.rejections = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        """Returns the counters as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Stats:
+    """A queryable collection of per-stage counters.
+
+    Stages are named after the function they measure, with a suffix for
+    sub-stages, i.e., "mrc_to_np.read". Index with a stage name to get its
+    StageStats.
+    """
+    def __init__(self):
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, **counters: float):
+        """Adds counters to a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            **counters: Amounts to add to the StageStats fields of the same
+                names. `calls` defaults to 1.
+        """
+        counters.setdefault("calls", 1)
+        with self._lock:
+            stage_stats = self._stages.get(stage)
+            if stage_stats is None:
+                stage_stats = self._stages[stage] = StageStats()
+            for name, value in counters.items():
+                setattr(stage_stats, name, getattr(stage_stats, name) + value)
+
+    def __getitem__(self, stage: str) -> StageStats:
+        return self._stages[stage]
+
+    def __contains__(self, stage: str) -> bool:
+        return stage in self._stages
+
+    def stages(self) -> List[str]:
+        """Returns the names of all recorded stages."""
+        return sorted(self._stages)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        """Returns all counters as a dictionary keyed by stage name."""
+        with self._lock:
+            return {name: s.as_dict() for name, s in sorted(self._stages.items())}
+
+    def reset(self):
+        """Clears all counters."""
+        with self._lock:
+            self._stages.clear()
+
+    def report(self) -> str:
+        """Returns a table of all counters."""
+        lines = [f"{'stage':<28}{'calls':>8}{'seconds':>11}{'MB read':>10}{'arrays':>8}{'MB alloc':>10}{'rejects':>9}"]
+        for name, s in self.as_dict().items():
+            lines.append(
+                f"{name:<28}{s['calls']:>8}{s['seconds']:>11.4f}"
+                f"{s['bytes_read'] / 1e6:>10.1f}{s['arrays']:>8}"
+                f"{s['bytes_allocated'] / 1e6:>10.1f}{s['rejections']:>9}"
+            )
+        return "\n".join(lines)
+
+
+_stats: Optional[Stats] = None
+_hooks: List[Callable[[str, Dict[str, float]], None]] = []
+
+
+def enable(stats: Optional[Stats] = None) -> Stats:
+    """Turns instrumentation on.
+
+    Args:
+        stats (Stats, optional): The object to record into. Defaults to None,
+            in which case a new Stats is created.
+
+    Returns:
+        The Stats object being recorded into.
+    """
+    global _stats
+    _stats = Stats() if stats is None else stats
+    return _stats
+
+
+def disable():
+    """Turns instrumentation off. Recorded stats are kept by their owner."""
+    global _stats
+    _stats = None
+
+
+def get_stats() -> Optional[Stats]:
+    """Returns the Stats object being recorded into, or None if disabled."""
+    return _stats
+
+
+def add_hook(hook: Callable[[str, Dict[str, float]], None]):
+    """Registers a callback that receives every record while enabled.
+
+    Args:
+        hook (callable): Called with the stage name and a dictionary of the
+            counters recorded, including `seconds` for timed stages.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[str, Dict[str, float]], None]):
+    """Unregisters a callback added with add_hook."""
+    _hooks.remove(hook)
+
+
+def record(stage: str, **counters: float):
+    """Records counters for a stage, if instrumentation is enabled.
+
+    Args:
+        stage (str): The name of the stage.
+        **counters: Amounts to add to the StageStats fields of the same names.
+    """
+    stats = _stats
+    if stats is None:
+        return
+    stats.record(stage, **counters)
+    for hook in _hooks:
+        hook(stage, counters)
+
+
+class _Stage:
+    """Context manager that times a stage and collects its counters."""
+    __slots__ = ("name", "counters", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counters: Dict[str, float] = {}
+
+    def add(self, **counters: float):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self) -> '_Stage':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.counters["seconds"] = time.perf_counter() - self.start
+        record(self.name, **self.counters)
+
+
+class _NullStage:
+    """Stand-in for _Stage when instrumentation is disabled."""
+    __slots__ = ()
+
+    def add(self, **counters: float):
+        pass
+
+    def __enter__(self) -> '_NullStage':
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str):
+    """Returns a context manager that times a stage, if instrumentation is
+    enabled.
+
+    Counters can be added inside the block with `add`:
+
+        with stage("mrc_to_np.read") as s:
+            data = ...
+            s.add(bytes_read=data.nbytes)
+
+    Args:
+        name (str): The name of the stage.
+
+    Returns:
+        A context manager. When instrumentation is disabled, a shared no-op.
+    """
+    if _stats is None:
+        return _NULL_STAGE
+    return _Stage(name)
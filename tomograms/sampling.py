@@ -0,0 +1,347 @@
+"""
+This module provides sample plans: an epoch of subtomogram samples drawn up
+front from a seed, which can be saved, replayed exactly, split across workers
+and executed in an order that keeps disk reads mostly sequential.
+"""
+
+from .subtomogram import Subtomogram, SubtomogramGenerator
+
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from typing import Iterator, List, Optional, Sequence
+
+
+PlannedSample = namedtuple(
+    "PlannedSample", ["tomogram", "lower_bounds", "shape", "positive", "index"], defaults=[None]
+)
+PlannedSample.__doc__ = """A single planned subtomogram.
+
+Attributes:
+    tomogram (int): Index of the generator, and so the tomogram, to sample
+    from.
+
+    lower_bounds (tuple of int): The lower bounds of the subtomogram.
+
+    shape (tuple of int): The shape of the subtomogram.
+
+    positive (bool): Whether the sample was planned to contain an annotation
+    point.
+
+    index (int or None): The index of the sample in the whole plan, which
+    seeds its augmentation. Kept when a plan is sharded.
+"""
+
+
+class SamplePlan:
+    """An epoch of subtomogram samples, planned up front.
+
+    Sample `i` of a plan depends only on the seed, `i`, and the generators,
+    so a plan can be computed in pieces by separate workers and the pieces
+    agree with the plan computed all at once. Its augmentation, if any, is
+    drawn from `augmentation_gen(seed, i)`, so executing a plan twice gives
+    the same crops.
+
+    Attributes:
+        samples (list of PlannedSample): The planned samples.
+
+        seed (int): The seed the plan was drawn from.
+
+        sources (list of str or None): The file path of each tomogram, if
+        known, to check that a replayed plan uses the same tomograms.
+    """
+    def __init__(
+            self,
+            samples: List[PlannedSample],
+            seed: int,
+            sources: Optional[List[Optional[str]]] = None
+        ):
+        """Initializes a SamplePlan.
+
+        Args:
+            samples (list of PlannedSample): The planned samples.
+
+            seed (int): The seed the plan was drawn from.
+
+            sources (list of str or None, optional): The file path of each
+            tomogram. Defaults to None.
+        """
+        self.samples = samples
+        self.seed = seed
+        self.sources = sources
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @staticmethod
+    def sample_gen(seed: int, index: int) -> np.random.Generator:
+        """Returns the random number generator used to plan sample `index`.
+
+        Args:
+            seed (int): The seed of the plan.
+
+            index (int): The index of the sample in the plan.
+
+        Returns:
+            A generator that depends only on `seed` and `index`.
+        """
+        return np.random.default_rng([seed, index])
+
+    @staticmethod
+    def augmentation_gen(seed: int, index: int) -> np.random.Generator:
+        """Returns the random number generator used to augment sample `index`.
+
+        Args:
+            seed (int): The seed of the plan.
+
+            index (int): The index of the sample in the plan.
+
+        Returns:
+            A generator that depends only on `seed` and `index`, independent
+            of the one returned by `sample_gen`.
+        """
+        return np.random.default_rng([seed, index, 1])
+
+    @classmethod
+    def create(
+            cls,
+            generators: Sequence[SubtomogramGenerator],
+            n_positive: int,
+            n_negative: int,
+            seed: int,
+            *,
+            rank: int = 0,
+            world_size: int = 1
+        ) -> 'SamplePlan':
+        """Plans an epoch of positive and negative samples.
+
+        Positive samples are drawn from a uniformly random tomogram that has
+        annotations, and negative samples from a uniformly random tomogram.
+        Bounds are drawn with each generator's `positive_lower_bounds` and
+        `negative_lower_bounds`, so `vol_shape` and `pads` are respected.
+
+        Args:
+            generators (sequence of SubtomogramGenerator): One generator per
+            tomogram.
+
+            n_positive (int): The number of positive samples in the epoch.
+
+            n_negative (int): The number of negative samples in the epoch.
+
+            seed (int): The seed to plan from.
+
+            rank (int, optional): Index of this worker, to plan only the
+            samples `rank`, `rank + world_size`, `rank + 2 * world_size`, and
+            so on. Defaults to 0.
+
+            world_size (int, optional): The number of workers planning.
+            Defaults to 1.
+
+        Returns:
+            The plan, or this worker's share of it.
+        """
+        annotated = [i for i, g in enumerate(generators)
+                     if len(g.tomogram.annotation_points()) > 0]
+        if n_positive > 0 and len(annotated) == 0:
+            raise Exception("Cannot plan positive samples without annotated tomograms.")
+
+        samples = []
+        for index in range(rank, n_positive + n_negative, world_size):
+            gen = SamplePlan.sample_gen(seed, index)
+            positive = index < n_positive
+            if positive:
+                tomogram = annotated[gen.integers(len(annotated))]
+                lower_bounds = generators[tomogram].positive_lower_bounds(gen=gen)
+            else:
+                tomogram = int(gen.integers(len(generators)))
+                lower_bounds = generators[tomogram].negative_lower_bounds(gen=gen)
+            samples.append(PlannedSample(
+                int(tomogram),
+                tuple(lower_bounds),
+                tuple(int(s) for s in generators[tomogram].vol_shape),
+                positive,
+                index
+            ))
+        sources = [getattr(g.tomogram, "filepath", None) for g in generators]
+        return cls(samples, seed, sources)
+
+    def shard(self, rank: int, world_size: int) -> 'SamplePlan':
+        """Returns one worker's share of this plan.
+
+        Args:
+            rank (int): Index of the worker.
+
+            world_size (int): The number of workers.
+
+        Returns:
+            A plan of every `world_size`-th sample, starting at `rank`.
+        """
+        return SamplePlan(self.samples[rank::world_size], self.seed, self.sources)
+
+    @classmethod
+    def merge(cls, plans: Sequence['SamplePlan']) -> 'SamplePlan':
+        """Combines plans, i.e., the shards of a plan, into one plan.
+
+        Samples are interleaved, so merging the shards of a plan in order of
+        rank gives back the original plan.
+
+        Args:
+            plans (sequence of SamplePlan): The plans to combine, in order of
+            rank. They should share a seed and sources.
+
+        Returns:
+            A plan containing the samples of every plan.
+        """
+        samples = []
+        for index in range(max(len(plan) for plan in plans)):
+            for plan in plans:
+                if index < len(plan):
+                    samples.append(plan.samples[index])
+        return cls(samples, plans[0].seed, plans[0].sources)
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable representation of this plan."""
+        return {
+            "seed": self.seed,
+            "sources": self.sources,
+            "samples": [
+                [s.tomogram, list(s.lower_bounds), list(s.shape), s.positive, s.index]
+                for s in self.samples
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SamplePlan':
+        """Reconstructs a plan from the output of `to_dict`."""
+        samples = [
+            PlannedSample(int(t), tuple(lb), tuple(shape), bool(positive), *index)
+            for t, lb, shape, positive, *index in data["samples"]
+        ]
+        return cls(samples, data["seed"], data.get("sources"))
+
+    def save(self, filepath: str):
+        """Saves this plan as a JSON file.
+
+        Args:
+            filepath (str): The file to write.
+        """
+        with open(filepath, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'SamplePlan':
+        """Loads a plan saved with `save`.
+
+        Args:
+            filepath (str): The file to read.
+
+        Returns:
+            The loaded plan.
+        """
+        with open(filepath, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+    def read_order(self, gen: np.random.Generator, slab: Optional[int] = None) -> List[int]:
+        """Returns the indices of the samples in an order suited to reading.
+
+        Tomograms are visited in a random order. Within a tomogram, samples
+        are sorted by z-slab and then by their remaining lower bounds, so
+        that consecutive crops read nearby parts of the file.
+
+        Args:
+            gen (np.random.Generator): Random number generator for the order
+            of tomograms.
+
+            slab (int, optional): The thickness of the z-slabs. Defaults to
+            None, in which case the z-extent of each sample is used.
+
+        Returns:
+            The sample indices in read order.
+        """
+        n_tomograms = max((s.tomogram for s in self.samples), default=-1) + 1
+        tomogram_rank = gen.permutation(n_tomograms)
+
+        def key(index):
+            sample = self.samples[index]
+            thickness = sample.shape[0] if slab is None else slab
+            z, *rest = sample.lower_bounds
+            return (tomogram_rank[sample.tomogram], z // max(thickness, 1), *rest)
+
+        return sorted(range(len(self.samples)), key=key)
+
+    def execute(
+            self,
+            generators: Sequence[SubtomogramGenerator],
+            *,
+            buffer_size: int = 256,
+            slab: Optional[int] = None,
+            seed: Optional[int] = None
+        ) -> Iterator[Subtomogram]:
+        """Extracts the planned samples.
+
+        Samples are extracted in `read_order`, `buffer_size` at a time, and
+        each buffer is yielded in a random order. Larger buffers give better
+        shuffling at the cost of holding more samples in memory at once.
+
+        Args:
+            generators (sequence of SubtomogramGenerator): The generators the
+            plan was created with, in the same order. Their augmentation
+            stages are applied to the samples.
+
+            buffer_size (int, optional): The number of samples extracted
+            before yielding them in shuffled order. Defaults to 256.
+
+            slab (int, optional): The thickness of the z-slabs passed to
+            `read_order`. Defaults to None.
+
+            seed (int, optional): Seed for the read and yield order. Defaults
+            to None, in which case the seed of the plan is used.
+
+        Yields:
+            The planned subtomograms.
+        """
+        self.check_sources(generators)
+        gen = np.random.default_rng(self.seed if seed is None else seed)
+        order = self.read_order(gen, slab)
+        for start in range(0, len(order), buffer_size):
+            buffer = [self.extract(generators, index) for index in order[start : start + buffer_size]]
+            for position in gen.permutation(len(buffer)):
+                yield buffer[position]
+
+    def check_sources(self, generators: Sequence[SubtomogramGenerator]):
+        """Checks that `generators` sample the tomograms this plan was made for.
+
+        Args:
+            generators (sequence of SubtomogramGenerator): The generators to
+            check.
+
+        Raises:
+            Exception: If a generator's tomogram file differs from the one
+            recorded in the plan.
+        """
+        if self.sources is None:
+            return
+        for index, (source, generator) in enumerate(zip(self.sources, generators)):
+            filepath = getattr(generator.tomogram, "filepath", None)
+            if source is not None and filepath is not None and source != filepath:
+                raise Exception(f"Generator {index} samples {filepath}, but the plan was made for {source}.")
+
+    def extract(self, generators: Sequence[SubtomogramGenerator], index: int) -> Subtomogram:
+        """Extracts a single planned sample.
+
+        Args:
+            generators (sequence of SubtomogramGenerator): The generators the
+            plan was created with, in the same order.
+
+            index (int): The index of the sample in this plan.
+
+        Returns:
+            The subtomogram, with the generator's augmentation applied.
+        """
+        sample = self.samples[index]
+        generator = generators[sample.tomogram]
+        subtomogram = generator.subtomogram(list(sample.lower_bounds), sample.shape)
+        gen = SamplePlan.augmentation_gen(self.seed, index if sample.index is None else sample.index)
+        return generator._augment(subtomogram, gen=gen)
@@ -0,0 +1,366 @@
+"""
+This module exports subtomogram samples to fixed-size shard files and reads
+them back, so training epochs become large sequential reads of ready-made
+samples instead of crops from raw tomograms.
+
+Each shard is an uncompressed tar file. Sample `key` is stored as three
+members: `key.data.npy` with the volume, `key.points.npy` with an (N, 3) array
+of annotation points, and `key.json` with annotation names and the origin of
+the sample.
+"""
+
+from .annotation import Annotation
+from .sampling import SamplePlan
+from .subtomogram import Subtomogram, SubtomogramGenerator
+from .tomogram import Tomogram
+from .cache import temporary_path
+
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+
+class ShardSample(Tomogram):
+    """A sample read from a shard.
+
+    Attributes:
+        key (str): The key of the sample within its shard.
+
+        metadata (dict): The origin of the sample: `source`, `lower_bounds`,
+        `orientation` (its `axes` and `flips`) and `positive`, where known.
+    """
+    def __init__(self, data: np.ndarray, annotations: List[Annotation], key: str, metadata: Dict[str, Any]):
+        super().__init__(data, annotations)
+        self.key = key
+        self.metadata = metadata
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def _add_member(tar: tarfile.TarFile, name: str, payload: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def _sample_members(key: str, sample: Tomogram, dtype: Optional[type]) -> List[tuple]:
+    """Serializes a sample into (name, bytes) pairs for a shard."""
+    data = sample.data if dtype is None else sample.data.astype(dtype, copy=False)
+    annotations = sample.annotations
+    points = [np.reshape(a.points, (-1, 3)) for a in annotations]
+    points = np.concatenate(points) if len(points) > 0 else np.zeros((0, 3))
+    metadata = {
+        "names": [a.name for a in annotations],
+        "counts": [len(a.points) for a in annotations],
+    }
+    parent = getattr(sample, "parent_tomogram", None)
+    if parent is not None:
+        metadata["source"] = getattr(parent, "filepath", None)
+        metadata["lower_bounds"] = [int(b) for b in sample.lower_bounds]
+    orientation = getattr(sample, "orientation", None)
+    if orientation is not None:
+        # Needed to map the sample back onto its source
+        metadata["orientation"] = {
+            "axes": list(orientation.axes),
+            "flips": list(orientation.flips),
+        }
+    if hasattr(sample, "positive"):
+        metadata["positive"] = bool(sample.positive)
+    return [
+        (f"{key}.data.npy", _npy_bytes(np.ascontiguousarray(data))),
+        (f"{key}.points.npy", _npy_bytes(points)),
+        (f"{key}.json", json.dumps(metadata).encode("utf-8")),
+    ]
+
+
+def write_shard(
+        filepath: str,
+        samples: Sequence[Tomogram],
+        first_index: int = 0,
+        dtype: Optional[type] = None,
+        key_prefix: str = ""
+    ) -> int:
+    """Writes samples to a single shard file.
+
+    The shard is written to a temporary file and moved into place when
+    complete.
+
+    Args:
+        filepath (str): The shard file to write.
+
+        samples (sequence of Tomogram): The samples, usually Subtomograms.
+
+        first_index (int, optional): The index used as the key of the first
+        sample. Defaults to 0.
+
+        dtype (type, optional): The dtype to store volumes as. Defaults to
+        None, in which case volumes are stored as they are.
+
+        key_prefix (str, optional): Prepended to the key of every sample.
+        Defaults to "".
+
+    Returns:
+        The number of samples written.
+    """
+    tmp = temporary_path(filepath)
+    with tarfile.open(tmp, "w") as tar:
+        for offset, sample in enumerate(samples):
+            for name, payload in _sample_members(f"{key_prefix}{first_index + offset:09d}", sample, dtype):
+                _add_member(tar, name, payload)
+    os.replace(tmp, filepath)
+    return len(samples)
+
+
+def generator_samples(
+        generator: SubtomogramGenerator,
+        n_samples: int,
+        positive_fraction: float = 0.5
+    ) -> Iterator[Subtomogram]:
+    """Draws samples from a generator.
+
+    Args:
+        generator (SubtomogramGenerator): The generator to sample from.
+
+        n_samples (int): The number of samples to draw.
+
+        positive_fraction (float, optional): The fraction of samples that are
+        positive. Defaults to 0.5.
+
+    Yields:
+        Subtomograms, with a `positive` attribute recording how they were
+        drawn.
+    """
+    n_positive = int(round(n_samples * positive_fraction))
+    for index in range(n_samples):
+        positive = index < n_positive
+        sample = generator.positive_sample() if positive else generator.negative_sample()
+        sample.positive = positive
+        yield sample
+
+
+def export_shards(
+        source: Union[SubtomogramGenerator, SamplePlan, Iterable[Tomogram]],
+        out_dir: str,
+        *,
+        n_samples: Optional[int] = None,
+        generators: Optional[Sequence[SubtomogramGenerator]] = None,
+        positive_fraction: float = 0.5,
+        samples_per_shard: int = 1000,
+        workers: int = 4,
+        prefix: str = "shard",
+        dtype: Optional[type] = None,
+        key_prefix: str = ""
+    ) -> List[str]:
+    """Exports samples to shard files in `out_dir`.
+
+    Samples are extracted on the calling thread and handed to a pool of
+    writer threads a shard at a time, with at most two shards per worker
+    waiting to be written, so memory use stays bounded however many samples
+    are exported. An `index.json` listing the shards and their sizes is
+    written once every shard is complete.
+
+    Args:
+        source (SubtomogramGenerator, SamplePlan or iterable of Tomogram): The
+        samples to export. A generator is sampled `n_samples` times, and a
+        plan is executed with `generators`.
+
+        out_dir (str): The directory to write the shards to.
+
+        n_samples (int, optional): The number of samples to draw if `source`
+        is a SubtomogramGenerator. Defaults to None.
+
+        generators (sequence of SubtomogramGenerator, optional): The
+        generators to execute `source` with, if it is a SamplePlan. Defaults
+        to None.
+
+        positive_fraction (float, optional): The fraction of positive samples
+        drawn if `source` is a SubtomogramGenerator. Defaults to 0.5.
+
+        samples_per_shard (int, optional): The number of samples in each
+        shard. Defaults to 1000.
+
+        workers (int, optional): The number of writer threads. Defaults to 4.
+
+        prefix (str, optional): The filename prefix of the shards. Defaults
+        to "shard".
+
+        dtype (type, optional): The dtype to store volumes as. Defaults to
+        None, in which case volumes are stored as they are.
+
+        key_prefix (str, optional): Prepended to the key of every sample,
+        which is otherwise its index in the export. Exports that are read
+        together need different prefixes for their keys to be unique, e.g.
+        `shard_key_prefix()` in a job array. Defaults to "".
+
+    Returns:
+        The paths of the written shards.
+
+    Raises:
+        ValueError: If `key_prefix` contains "." or "/".
+    """
+    if "." in key_prefix or "/" in key_prefix:
+        raise ValueError("key_prefix cannot contain '.' or '/'.")
+    if isinstance(source, SubtomogramGenerator):
+        if n_samples is None:
+            raise ValueError("n_samples is required to export from a SubtomogramGenerator.")
+        samples = generator_samples(source, n_samples, positive_fraction)
+    elif isinstance(source, SamplePlan):
+        if generators is None:
+            raise ValueError("generators are required to export a SamplePlan.")
+        samples = _plan_samples(source, generators)
+    else:
+        samples = iter(source)
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths: List[str] = []
+    counts: List[int] = []
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch: List[Tomogram] = []
+        written = 0
+
+        def submit(batch, first_index):
+            path = os.path.join(out_dir, f"{prefix}-{len(paths):06d}.tar")
+            paths.append(path)
+            pending.append(pool.submit(write_shard, path, batch, first_index, dtype, key_prefix))
+            # Wait for the oldest shards so that memory use stays bounded
+            while len(pending) > 2 * workers:
+                counts.append(pending.pop(0).result())
+
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) == samples_per_shard:
+                submit(batch, written)
+                written += len(batch)
+                batch = []
+        if len(batch) > 0:
+            submit(batch, written)
+        counts += [future.result() for future in pending]
+
+    index = {"shards": [os.path.basename(p) for p in paths], "counts": counts}
+    with open(os.path.join(out_dir, "index.json"), "w") as file:
+        json.dump(index, file)
+    return paths
+
+
+def _plan_samples(plan: SamplePlan, generators: Sequence[SubtomogramGenerator]) -> Iterator[Subtomogram]:
+    """Executes a plan, marking each sample as positive or negative."""
+    plan.check_sources(generators)
+    gen = np.random.default_rng(plan.seed)
+    for index in plan.read_order(gen):
+        sample = plan.extract(generators, index)
+        sample.positive = plan.samples[index].positive
+        yield sample
+
+
+def _read_npy(payload: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(payload))
+
+
+def read_shard(filepath: str) -> Iterator[ShardSample]:
+    """Reads the samples of a shard in order, streaming through the file.
+
+    Args:
+        filepath (str): The shard file to read.
+
+    Yields:
+        The samples in the shard.
+    """
+    members: Dict[str, bytes] = {}
+    current = None
+    with tarfile.open(filepath, "r|") as tar:
+        for info in tar:
+            key, _, kind = info.name.partition(".")
+            if current is not None and key != current:
+                yield _sample_from_members(current, members)
+                members = {}
+            current = key
+            members[kind] = tar.extractfile(info).read()
+    if current is not None:
+        yield _sample_from_members(current, members)
+
+
+def _sample_from_members(key: str, members: Dict[str, bytes]) -> ShardSample:
+    data = _read_npy(members["data.npy"])
+    points = _read_npy(members["points.npy"])
+    metadata = json.loads(members["json"])
+    names = metadata.pop("names")
+    counts = metadata.pop("counts")
+    annotations = []
+    start = 0
+    for name, count in zip(names, counts):
+        annotations.append(Annotation(list(points[start : start + count]), name))
+        start += count
+    return ShardSample(data, annotations, key, metadata)
+
+
+class ShardReader:
+    """Reads samples from shard files sequentially, with optional shuffling.
+
+    Shards are read in a random order each epoch, and samples pass through a
+    shuffle buffer: once the buffer is full, each new sample replaces a
+    randomly chosen buffered sample, which is yielded. Larger buffers give
+    better shuffling at the cost of memory.
+
+    Attributes:
+        paths (list of str): The shard files to read.
+
+        shuffle_buffer (int): The number of samples held for shuffling. If 0,
+        samples are yielded in the order they are stored.
+
+        gen (np.random.Generator): Random number generator for shuffling.
+    """
+    def __init__(
+            self,
+            shards: Union[str, Sequence[str]],
+            *,
+            shuffle_buffer: int = 0,
+            seed: Optional[int] = None
+        ):
+        """Initializes a ShardReader.
+
+        Args:
+            shards (str or sequence of str): A directory written by
+            `export_shards`, or a list of shard files.
+
+            shuffle_buffer (int, optional): The number of samples held for
+            shuffling. Defaults to 0.
+
+            seed (int, optional): Seed for shuffling. Defaults to None.
+        """
+        if isinstance(shards, str):
+            with open(os.path.join(shards, "index.json")) as file:
+                index = json.load(file)
+            self.paths = [os.path.join(shards, name) for name in index["shards"]]
+        else:
+            self.paths = list(shards)
+        self.shuffle_buffer = shuffle_buffer
+        self.gen = np.random.default_rng(seed)
+
+    def __iter__(self) -> Iterator[ShardSample]:
+        if self.shuffle_buffer <= 0:
+            for path in self.paths:
+                yield from read_shard(path)
+            return
+
+        buffer: List[ShardSample] = []
+        for position in self.gen.permutation(len(self.paths)):
+            for sample in read_shard(self.paths[position]):
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                index = self.gen.integers(len(buffer))
+                yield buffer[index]
+                buffer[index] = sample
+        for index in self.gen.permutation(len(buffer)):
+            yield buffer[index]
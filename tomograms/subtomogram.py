@@ -1,9 +1,10 @@
 from .tomogram import Tomogram
 from .annotation import Annotation
+from .instrumentation import stage
 
 import numpy as np
 
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 def _in_bounds(shape: np.ndarray, point: np.ndarray) -> bool:
     """ 
@@ -22,6 +23,21 @@ def _in_bounds(shape: np.ndarray, point: np.ndarray) -> bool:
             return False
     return True
 
+def _all_in_bounds(shape: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """ 
+    Checks which of the `points` are within the bounds of an array with the
+    given `shape`.
+
+    Args:
+        shape (np.ndarray): The shape of the array.
+
+        points (np.ndarray): An (N, 3) array of points to check.
+
+    Returns:
+        A boolean array that is True where a point is within bounds.
+    """
+    return np.all((points >= 0) & (points < np.asarray(shape)), axis=1)
+
 class Subtomogram(Tomogram):
     """ 
     A class representing a subtomogram extracted from a parent tomogram.
@@ -36,48 +52,103 @@ class Subtomogram(Tomogram):
         data (np.ndarray): The 3D data of the subtomogram.
 
         shape (np.ndarray): The shape of the subtomogram.
+
+        orientation (Orientation or None): The orientation applied by an
+        augmentation stage, if any.
     """
 
-    def __init__(self, parent_tomogram: 'Tomogram', lower_bounds: np.ndarray, shape: np.ndarray) -> None:
+    def __init__(
+            self,
+            parent_tomogram: 'Tomogram',
+            lower_bounds: np.ndarray,
+            shape: np.ndarray,
+            dtype: Optional[type] = None,
+            *,
+            copy: bool = False,
+            pad_mode: Optional[str] = None,
+            pad_value: float = 0,
+            out: Optional[np.ndarray] = None
+        ) -> None:
         """ 
         Initializes a Subtomogram instance.
 
+        If the parent is a TomogramFile whose data is not loaded, only this
+        subtomogram's region is read from the file, with preprocessing. If it
+        was loaded with `lazy=True`, preprocessing is applied to this
+        subtomogram's data alone. If it is quantized, only this subtomogram's
+        data is converted back to floats.
+
+        By default the data is a view of the parent's data where possible, and
+        is cut short where the subtomogram extends past the parent's edge.
+        With `pad_mode` or `out`, the data is instead copied into an array of
+        exactly `shape` (see `Tomogram.extract`), and with `copy`, it never
+        shares memory with the parent, so the parent's data can be freed.
+
         Args:
             parent_tomogram (Tomogram): The parent tomogram.
 
             lower_bounds (np.ndarray): The lower bounds for the subtomogram.
 
             shape (np.ndarray): The shape of the subtomogram.
+
+            dtype (type, optional): The dtype of the subtomogram's data.
+            Defaults to None, in which case the parent decides, i.e.,
+            np.float64 for a quantized TomogramFile.
+
+            copy (bool, optional): Whether to copy the data rather than view
+            the parent's. Defaults to False.
+
+            pad_mode (str, optional): How to pad the parts of the subtomogram
+            outside the parent, as in `Tomogram.extract`. Defaults to None, in
+            which case they are cut off unless `out` is given.
+
+            pad_value (float, optional): The value "constant" padding fills
+            with. Defaults to 0.
+
+            out (np.ndarray, optional): An array of shape `shape` to copy the
+            data into, i.e., one element of a preallocated batch. Defaults to
+            None.
         """
         self.parent_tomogram = parent_tomogram
         self.lower_bounds = lower_bounds
+        self.orientation = None
 
         # Modify annotations from the parent tomogram to match this tomogram
-        new_annotations: List[Annotation] = []
-        for parent_annotation in self.parent_tomogram.annotations:
-            new_points: List[np.ndarray] = []
-            # Offset original points for this new subtomogram
-            for point in parent_annotation.points:
-                new_point = point - lower_bounds
-                # Check if new_point is even in the new tomogram
-                if _in_bounds(shape, new_point):
-                    new_points.append(new_point)
-                # Otherwise continue
-            # Add the annotation only if there are points in it
-            if len(new_points) > 0:
-                new_annotations.append(Annotation(
-                    new_points,
-                    parent_annotation.name
-                ))
+        with stage("Subtomogram.annotations"):
+            new_annotations: List[Annotation] = []
+            # Offset all original points for this new subtomogram at once
+            new_points = parent_tomogram.annotation_points() - np.asarray(lower_bounds)
+            # Check which new points are even in the new tomogram
+            inside = _all_in_bounds(shape, new_points)
+            offsets = parent_tomogram.annotation_offsets()
+            for index, parent_annotation in enumerate(parent_tomogram.annotations):
+                start, stop = offsets[index], offsets[index + 1]
+                keep = inside[start:stop]
+                # Add the annotation only if there are points in it
+                if keep.any():
+                    new_annotations.append(Annotation(
+                        list(new_points[start:stop][keep]),
+                        parent_annotation.name
+                    ))
 
         # Get subvolume data using lower bounds and shape
-        min_0, min_1, min_2 = lower_bounds
-        shape_0, shape_1, shape_2 = shape
-        new_data = parent_tomogram.data[
-            min_0 : min_0 + shape_0,
-            min_1 : min_1 + shape_1,
-            min_2 : min_2 + shape_2
-        ]
+        with stage("Subtomogram.crop"):
+            if pad_mode is not None or out is not None:
+                new_data = parent_tomogram.extract(
+                    lower_bounds,
+                    shape,
+                    out,
+                    pad_mode="constant" if pad_mode is None else pad_mode,
+                    pad_value=pad_value,
+                    dtype=dtype
+                )
+            elif dtype is None:
+                new_data = parent_tomogram.crop(lower_bounds, shape)
+            else:
+                new_data = parent_tomogram.crop(lower_bounds, shape, dtype)
+            parent_data = parent_tomogram.data
+            if copy and parent_data is not None and np.may_share_memory(new_data, parent_data):
+                new_data = np.array(new_data)
 
         # Initialize this new Tomogram
         super().__init__(new_data, new_annotations)
@@ -99,21 +170,51 @@ class SubtomogramGenerator:
         pads (Tuple[int, int, int]): The padding to apply to the boundaries.
 
         gen (np.random.Generator): Random number generator for sampling.
+
+        augmentation (callable or None): An augmentation stage applied to each
+        sampled subtomogram, such as RandomOrientation.
+
+        dtype (type or None): The dtype of sampled subtomograms' data, if not
+        the tomogram's own.
+
+        copy (bool): Whether sampled subtomograms copy their data rather than
+        view the tomogram's.
+
+        pad_mode (str or None): How sampled subtomograms are padded where they
+        extend past the tomogram, if at all.
     """
 
-    def __init__(self, tomogram: 'Tomogram') -> None:
+    def __init__(self, tomogram: 'Tomogram', level: int = 0, *, load: bool = True) -> None:
         """ 
         Initializes a SubtomogramGenerator instance.
 
         Args:
             tomogram (Tomogram): The parent tomogram to sample from.
+
+            level (int, optional): The pyramid level to sample at. Level `n`
+            samples from the tomogram binned by `2**n`, with annotation points
+            scaled to match, and requires a TomogramFile. `vol_shape` and
+            `pads` are measured in voxels of this level. Defaults to 0.
+
+            load (bool, optional): Whether to load the tomogram. If False, the
+            tomogram must be a TomogramFile, and each sample reads only its
+            own region from the file. Defaults to True.
         """
+        if level != 0:
+            tomogram = tomogram.pyramid_level(level)
         self.tomogram = tomogram
-        self.tomogram.load()
+        if load:
+            self.tomogram.load()
+        elif self.tomogram.data is None:
+            self.tomogram.header_shape()
         self.annotations = self.tomogram.annotations
         self.vol_shape = (64, 256, 256)
         self.pads = (8, 32, 32)
         self.gen = np.random.default_rng()
+        self.augmentation = None
+        self.dtype = None
+        self.copy = False
+        self.pad_mode = None
 
     def set_vol_shape(self, new_vol_shape: tuple[int, int, int]):
         """ 
@@ -124,9 +225,112 @@ class SubtomogramGenerator:
         """
         self.vol_shape = new_vol_shape
 
-    def positive_sample(self, point: Optional[np.ndarray] = None) -> Subtomogram:
+    def set_augmentation(self, augmentation: Optional[Callable[[Subtomogram], Subtomogram]]):
         """ 
-        Returns a random subtomogram containing the specified point.
+        Sets an augmentation stage to apply to every sampled subtomogram.
+
+        Args:
+            augmentation (callable or None): Takes a Subtomogram and returns
+            the augmented Subtomogram, i.e., a RandomOrientation. To be used
+            with a SamplePlan, it must also accept a `gen` keyword, the
+            random number generator to draw from. If None, samples are not
+            augmented.
+        """
+        self.augmentation = augmentation
+
+    def set_dtype(self, dtype: Optional[type]):
+        """ 
+        Sets the dtype of sampled subtomograms' data.
+
+        Args:
+            dtype (type or None): The dtype, i.e., np.float32 to dequantize
+            crops of a quantized TomogramFile into single precision. If None,
+            the tomogram decides.
+        """
+        self.dtype = dtype
+
+    def set_extraction(self, *, copy: bool = False, pad_mode: Optional[str] = None):
+        """ 
+        Sets how sampled subtomograms get their data from the tomogram.
+
+        Args:
+            copy (bool, optional): Whether to copy the data rather than view
+            the tomogram's, so that samples do not keep the tomogram's data
+            alive. Defaults to False.
+
+            pad_mode (str, optional): How to pad samples where they extend
+            past the tomogram, as in `Tomogram.extract`, so that every sample
+            has shape `vol_shape`. Defaults to None, in which case samples are
+            cut short instead.
+        """
+        self.copy = copy
+        self.pad_mode = pad_mode
+
+    def subtomogram(
+            self,
+            lower_bounds: List[int],
+            shape: Optional[tuple] = None,
+            out: Optional[np.ndarray] = None
+        ) -> Subtomogram:
+        """ 
+        Extracts a subtomogram with this generator's dtype and extraction
+        settings, without augmentation.
+
+        Args:
+            lower_bounds (List[int]): The lower bounds of the subtomogram.
+
+            shape (Optional[tuple]): The shape of the subtomogram. Defaults
+            to None, in which case `vol_shape` is used.
+
+            out (Optional[np.ndarray]): An array to copy the data into.
+            Defaults to None.
+
+        Returns:
+            The subtomogram.
+        """
+        return Subtomogram(
+            self.tomogram,
+            lower_bounds,
+            self.vol_shape if shape is None else shape,
+            self.dtype,
+            copy=self.copy,
+            pad_mode=self.pad_mode,
+            out=out
+        )
+
+    def _augment(
+            self,
+            subtomogram: Subtomogram,
+            out: Optional[np.ndarray] = None,
+            gen: Optional[np.random.Generator] = None
+        ) -> Subtomogram:
+        """ 
+        Applies the augmentation stage, if any, to a sampled subtomogram. If
+        the subtomogram was extracted into `out`, the augmented data is
+        written back to it. If `gen` is given, the augmentation draws from it
+        instead of its own generator.
+        """
+        if self.augmentation is None:
+            return subtomogram
+        with stage("augmentation"):
+            if gen is None:
+                subtomogram = self.augmentation(subtomogram)
+            else:
+                subtomogram = self.augmentation(subtomogram, gen=gen)
+            if out is not None and subtomogram.data is not out:
+                # The augmented data may be a view of out itself
+                out[...] = np.array(subtomogram.data)
+                subtomogram.data = out
+            return subtomogram
+
+    def positive_lower_bounds(
+            self,
+            point: Optional[np.ndarray] = None,
+            gen: Optional[np.random.Generator] = None
+        ) -> List[int]:
+        """ 
+        Returns random lower bounds of a subtomogram containing the specified
+        point, without extracting it.
 
         The point will not be closer than `pads` voxels to the respective
         borders. If no point is given, a random annotation point from
@@ -136,13 +340,17 @@ class SubtomogramGenerator:
             point (Optional[np.ndarray]): The point to include in the
             subtomogram. Defaults to None.
 
+            gen (Optional[np.random.Generator]): Random number generator to
+            use instead of self.gen. Defaults to None.
+
         Returns:
-            The newly created subtomogram.
+            The lower bounds of the subtomogram.
         """
+        gen = self.gen if gen is None else gen
         if point is None:
             # Pick a random annotation point from self.tomogram's annotations
-            annotation = self.gen.choice(self.annotations)
-            point = self.gen.choice(annotation.points)
+            annotation = gen.choice(self.annotations)
+            point = gen.choice(annotation.points)
 
         possible_lower_bounds = [np.linspace(
                                         max(0, pt - vs + pad),
@@ -152,12 +360,84 @@ class SubtomogramGenerator:
                                     )
             for (ts, vs, pt, pad) in zip(self.tomogram.shape, self.vol_shape, point, self.pads)]
         
-        lower_bounds = [self.gen.choice(lb, shuffle=False) for lb in possible_lower_bounds]
+        return [int(gen.choice(lb, shuffle=False)) for lb in possible_lower_bounds]
+
+    def positive_sample(
+            self,
+            point: Optional[np.ndarray] = None,
+            out: Optional[np.ndarray] = None
+        ) -> Subtomogram:
+        """ 
+        Returns a random subtomogram containing the specified point.
+
+        The point will not be closer than `pads` voxels to the respective
+        borders. If no point is given, a random annotation point from
+        self.tomogram's annotations is selected.
+
+        Args:
+            point (Optional[np.ndarray]): The point to include in the
+            subtomogram. Defaults to None.
+
+            out (Optional[np.ndarray]): An array of shape `vol_shape` to copy
+            the data into, i.e., one element of a preallocated batch.
+            Defaults to None.
+
+        Returns:
+            The newly created subtomogram.
+        """
+        with stage("positive_sample"):
+            lower_bounds = self.positive_lower_bounds(point)
+
+            # Construct a new Tomogram with modified annotations
+            return self._augment(self.subtomogram(lower_bounds, out=out), out)
+
+    def negative_lower_bounds(self, gen: Optional[np.random.Generator] = None) -> List[int]:
+        """ 
+        Returns random lower bounds of a subtomogram that does not contain any
+        points from the annotations, without extracting it.
+
+        This process continues until valid bounds are found or the maximum
+        iterations are reached.
 
-        # Construct a new Tomogram with modified annotations
-        return Subtomogram(self.tomogram, lower_bounds, self.vol_shape)
+        Args:
+            gen (Optional[np.random.Generator]): Random number generator to
+            use instead of self.gen. Defaults to None.
+
+        Returns:
+            The lower bounds of the subtomogram.
+
+        Raises:
+            Exception: If unable to find a valid subtomogram without annotation
+            points after 1000 attempts.
+        """
+        gen = self.gen if gen is None else gen
+        # Generate completely random bounds until one has no annotations
+        maxiter = 1000
+        points = self.tomogram.annotation_points()
+        with stage("negative_lower_bounds") as s:
+            for iter in range(maxiter):
+                possible_lower_bounds = [np.linspace(
+                                                0,
+                                                ts - vs,
+                                                endpoint=False,
+                                                dtype=int
+                                            )
+                                for (ts, vs) in zip(self.tomogram.shape, self.vol_shape)]
+                
+                lower_bounds = [int(gen.choice(lb, shuffle=False))
+                                    for lb in possible_lower_bounds]
+                
+                # Check if this volume contains any annotation points
+                contains_annotation = _all_in_bounds(self.vol_shape, points - lower_bounds).any()
+                
+                if not contains_annotation:
+                    s.add(rejections=iter)
+                    return lower_bounds
+            
+            s.add(rejections=maxiter)
+            raise Exception("Failed to find a volume without an annotation")
 
-    def negative_sample(self) -> Subtomogram:
+    def negative_sample(self, out: Optional[np.ndarray] = None) -> Subtomogram:
         """ 
         Returns a random subtomogram that does not contain any points from the
         annotations.
@@ -165,6 +445,11 @@ class SubtomogramGenerator:
         This process continues until a valid subtomogram is found or the maximum
         iterations are reached.
 
+        Args:
+            out (Optional[np.ndarray]): An array of shape `vol_shape` to copy
+            the data into, i.e., one element of a preallocated batch.
+            Defaults to None.
+
         Returns:
             The newly created subtomogram.
 
@@ -172,32 +457,9 @@ class SubtomogramGenerator:
             Exception: If unable to find a valid subtomogram without annotation
             points after 1000 attempts.
         """
-        # Generate completely random bounds until one has no annotations
-        maxiter = 1000
-        for iter in range(maxiter):
-            possible_lower_bounds = [np.linspace(
-                                            0,
-                                            ts - vs,
-                                            endpoint=False,
-                                            dtype=int
-                                        )
-                            for (ts, vs) in zip(self.tomogram.shape, self.vol_shape)]
-            
-            lower_bounds = [self.gen.choice(lb, shuffle=False)
-                                for lb in possible_lower_bounds]
-            
-            # Check if this volume contains any annotation points
-            contains_annotation = False
-            for point in self.tomogram.annotation_points():
-                new_point = point - lower_bounds
-                if _in_bounds(self.vol_shape, new_point):
-                    contains_annotation = True
-                    break
-            
-            if not contains_annotation:
-                return Subtomogram(self.tomogram, lower_bounds, self.vol_shape)
-        
-        raise Exception("Failed to find a volume without an annotation")
+        with stage("negative_sample"):
+            lower_bounds = self.negative_lower_bounds()
+            return self._augment(self.subtomogram(lower_bounds, out=out), out)
     
     def find_annotation_points(self) -> List[np.ndarray]:
         """ 
@@ -206,10 +468,7 @@ class SubtomogramGenerator:
         Returns:
             A list of annotation points.
         """
-        points: List[np.ndarray] = []
-        for annotation in self.annotations:
-            points += annotation.points
-        return points
+        return list(self.tomogram.annotation_points())
 
 
 if __name__ == "__main__":
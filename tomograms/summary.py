@@ -0,0 +1,529 @@
+"""
+This module profiles whole datasets in one streaming pass: global intensity
+histograms and moments, tomogram shapes, annotation counts and the distances
+from annotation points to the borders of their tomograms.
+
+Each tomogram is read slab by slab through a memory map, so memory use is
+bounded by the slab size rather than the tomogram size. Every tomogram gives
+a small summary, and summaries are merged exactly: histograms share the same
+bins, and moments are combined with the pairwise update of Chan et al.
+
+    summary = summarize(tomograms, bins=1024, workers=8)
+    summary.intensity.mean, summary.intensity.std()
+    summary.intensity.quantile([0.02, 0.98])
+"""
+
+from .instrumentation import stage
+from .tomogram import TomogramFile
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import mrcfile
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class IntensitySummary:
+    """A mergeable summary of intensity values: their count, mean, spread,
+    extremes and a histogram with fixed bins.
+
+    Values outside the histogram range are counted in `underflow` and
+    `overflow` rather than dropped, so the counts always add up to `count`.
+
+    Attributes:
+        low (float): The lower edge of the histogram.
+
+        high (float): The upper edge of the histogram.
+
+        counts (numpy.ndarray): The number of values in each bin.
+
+        underflow (int): The number of values below `low`.
+
+        overflow (int): The number of values above `high`.
+
+        count (int): The number of values.
+
+        mean (float): The mean of the values.
+
+        m2 (float): The sum of squared deviations from the mean.
+
+        minimum (float): The smallest value, or inf if there are none.
+
+        maximum (float): The largest value, or -inf if there are none.
+    """
+    __slots__ = ("low", "high", "counts", "underflow", "overflow", "count", "mean", "m2", "minimum", "maximum")
+
+    def __init__(self, low: float, high: float, bins: int):
+        """Initializes an empty summary.
+
+        Args:
+            low (float): The lower edge of the histogram.
+
+            high (float): The upper edge of the histogram.
+
+            bins (int): The number of bins.
+        """
+        if not high > low:
+            raise ValueError(f"The histogram range ({low}, {high}) is empty.")
+        self.low = float(low)
+        self.high = float(high)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    @property
+    def bins(self) -> int:
+        """The number of histogram bins."""
+        return len(self.counts)
+
+    def edges(self) -> np.ndarray:
+        """Returns the `bins + 1` edges of the histogram."""
+        return np.linspace(self.low, self.high, self.bins + 1)
+
+    def _combine(self, count: int, mean: float, m2: float):
+        """Combines these moments with those of another set of values."""
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def update(self, values: np.ndarray) -> 'IntensitySummary':
+        """Adds values to this summary.
+
+        Args:
+            values (numpy.ndarray): The values, of any shape.
+
+        Returns:
+            This summary.
+        """
+        values = np.ravel(values)
+        if values.size == 0:
+            return self
+        mean = float(np.mean(values))
+        m2 = float(np.sum(np.square(values - mean)))
+        self._combine(values.size, mean, m2)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        counts, _ = np.histogram(values, bins=self.bins, range=(self.low, self.high))
+        self.counts += counts
+        self.underflow += int(np.count_nonzero(values < self.low))
+        self.overflow += int(np.count_nonzero(values > self.high))
+        return self
+
+    def compatible(self, other: 'IntensitySummary') -> bool:
+        """Whether this summary has the same histogram bins as another."""
+        return (self.low, self.high, self.bins) == (other.low, other.high, other.bins)
+
+    def merge(self, other: 'IntensitySummary') -> 'IntensitySummary':
+        """Adds the values summarized by another summary to this one.
+
+        Args:
+            other (IntensitySummary): A summary with the same histogram bins.
+
+        Returns:
+            This summary.
+
+        Raises:
+            ValueError: If the histogram bins differ.
+        """
+        if not self.compatible(other):
+            raise ValueError("Summaries with different histogram bins cannot be merged.")
+        self._combine(other.count, other.mean, other.m2)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def variance(self) -> float:
+        """Returns the population variance of the values."""
+        return self.m2 / self.count if self.count > 0 else float("nan")
+
+    def std(self) -> float:
+        """Returns the population standard deviation of the values."""
+        return float(np.sqrt(self.variance()))
+
+    def quantile(self, q) -> np.ndarray:
+        """Estimates quantiles from the histogram, interpolating linearly
+        within bins.
+
+        Values below or above the histogram range are placed at `minimum` and
+        `maximum` respectively, so quantiles falling among them are coarse.
+
+        Args:
+            q (float or array-like): The quantiles, between 0 and 1.
+
+        Returns:
+            The estimated values at the quantiles, or NaN if there are no
+            values.
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)
+        edges = np.concatenate([[self.minimum], self.edges(), [self.maximum]])
+        edges[1] = max(edges[1], self.minimum)
+        edges[-2] = min(edges[-2], self.maximum)
+        counts = np.concatenate([[self.underflow], self.counts, [self.overflow]])
+        cumulative = np.concatenate([[0], np.cumsum(counts)])
+        # Keep the edges increasing where the extremes fall inside the histogram
+        return np.interp(np.asarray(q, dtype=np.float64) * self.count, cumulative, np.maximum.accumulate(edges))
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable representation of this summary."""
+        return {
+            "low": self.low,
+            "high": self.high,
+            "counts": self.counts.tolist(),
+            "underflow": self.underflow,
+            "overflow": self.overflow,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "minimum": self.minimum if self.count > 0 else None,
+            "maximum": self.maximum if self.count > 0 else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'IntensitySummary':
+        """Reconstructs a summary from the output of `to_dict`."""
+        summary = cls(data["low"], data["high"], len(data["counts"]))
+        summary.counts = np.asarray(data["counts"], dtype=np.int64)
+        summary.underflow = data["underflow"]
+        summary.overflow = data["overflow"]
+        summary.count = data["count"]
+        summary.mean = data["mean"]
+        summary.m2 = data["m2"]
+        if data["count"] > 0:
+            summary.minimum = data["minimum"]
+            summary.maximum = data["maximum"]
+        return summary
+
+
+class TomogramSummary:
+    """The summary of a single tomogram.
+
+    Attributes:
+        filepath (str): The tomogram file.
+
+        shape (tuple of int): The shape of the tomogram.
+
+        source_size (int): The size of the file when it was summarized.
+
+        source_mtime_ns (int): The modification time of the file when it was
+        summarized.
+
+        intensity (IntensitySummary): The summary of its raw intensities.
+
+        annotation_counts (dict): The number of annotation points with each
+        annotation name.
+
+        border_distances (numpy.ndarray): The distance from each annotation
+        point to the nearest face of the tomogram, in voxels, in the order of
+        `annotation_points()`.
+    """
+    __slots__ = ("filepath", "shape", "source_size", "source_mtime_ns", "intensity",
+                 "annotation_counts", "border_distances")
+
+    def __init__(
+            self,
+            filepath: str,
+            shape: Tuple[int, int, int],
+            source_size: int,
+            source_mtime_ns: int,
+            intensity: IntensitySummary,
+            annotation_counts: Dict[str, int],
+            border_distances: np.ndarray
+        ):
+        self.filepath = filepath
+        self.shape = tuple(int(s) for s in shape)
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.intensity = intensity
+        self.annotation_counts = annotation_counts
+        self.border_distances = np.asarray(border_distances, dtype=np.float64)
+
+    def is_fresh(self) -> bool:
+        """Whether the tomogram file is unchanged since it was summarized."""
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (self.source_size, self.source_mtime_ns)
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable representation of this summary."""
+        return {
+            "filepath": self.filepath,
+            "shape": list(self.shape),
+            "source_size": self.source_size,
+            "source_mtime_ns": self.source_mtime_ns,
+            "intensity": self.intensity.to_dict(),
+            "annotation_counts": dict(self.annotation_counts),
+            "border_distances": self.border_distances.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TomogramSummary':
+        """Reconstructs a summary from the output of `to_dict`."""
+        return cls(
+            data["filepath"],
+            data["shape"],
+            data["source_size"],
+            data["source_mtime_ns"],
+            IntensitySummary.from_dict(data["intensity"]),
+            data["annotation_counts"],
+            data["border_distances"],
+        )
+
+
+class DatasetSummary:
+    """The summaries of the tomograms of a dataset, and their reductions.
+
+    Attributes:
+        tomograms (list of TomogramSummary): One summary per tomogram, in
+        order. All share the same histogram bins.
+    """
+    def __init__(self, tomograms: List[TomogramSummary]):
+        self.tomograms = tomograms
+
+    def __len__(self) -> int:
+        return len(self.tomograms)
+
+    @property
+    def intensity(self) -> Optional[IntensitySummary]:
+        """The intensity summary of all tomograms together, or None if there
+        are no tomograms."""
+        if len(self.tomograms) == 0:
+            return None
+        first = self.tomograms[0].intensity
+        merged = IntensitySummary(first.low, first.high, first.bins)
+        for summary in self.tomograms:
+            merged.merge(summary.intensity)
+        return merged
+
+    def shapes(self) -> np.ndarray:
+        """Returns a (T, 3) array of the shape of each tomogram."""
+        return np.array([s.shape for s in self.tomograms], dtype=np.int64).reshape(-1, 3)
+
+    def annotation_counts(self) -> Dict[str, int]:
+        """Returns the total number of annotation points with each name."""
+        totals: Dict[str, int] = {}
+        for summary in self.tomograms:
+            for name, count in summary.annotation_counts.items():
+                totals[name] = totals.get(name, 0) + count
+        return totals
+
+    def border_distances(self) -> np.ndarray:
+        """Returns the border distances of the annotation points of all
+        tomograms, concatenated in order."""
+        if len(self.tomograms) == 0:
+            return np.zeros(0, dtype=np.float64)
+        return np.concatenate([s.border_distances for s in self.tomograms])
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable representation of this summary.
+
+        The merged intensity summary and annotation counts are included for
+        readers of the JSON, but are recomputed from the tomograms on load.
+        """
+        intensity = self.intensity
+        return {
+            "intensity": None if intensity is None else intensity.to_dict(),
+            "annotation_counts": self.annotation_counts(),
+            "tomograms": [s.to_dict() for s in self.tomograms],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DatasetSummary':
+        """Reconstructs a summary from the output of `to_dict`."""
+        return cls([TomogramSummary.from_dict(s) for s in data["tomograms"]])
+
+
+def _header_range(tomogram: TomogramFile) -> Optional[Tuple[float, float]]:
+    """Read the minimum and maximum recorded in an MRC header, if valid."""
+    _, extension = os.path.splitext(tomogram.filepath)
+    if extension not in [".mrc", ".rec"]:
+        return None
+    with mrcfile.open(tomogram.filepath, 'r', header_only=True) as mrc:
+        low, high = float(mrc.header.dmin), float(mrc.header.dmax)
+    # mrcfile marks missing statistics with dmax < dmin
+    return (low, high) if np.isfinite(low) and np.isfinite(high) and high > low else None
+
+
+def _streamed_range(tomogram: TomogramFile, slab: int) -> Tuple[float, float]:
+    """Find the minimum and maximum of a tomogram by streaming over it."""
+    low, high = float("inf"), float("-inf")
+    with tomogram.open_raw() as raw:
+        for z0 in range(0, len(raw), slab):
+            values = raw[z0 : z0 + slab]
+            low = min(low, float(values.min()))
+            high = max(high, float(values.max()))
+    return low, high
+
+
+def histogram_range(tomograms: Sequence[TomogramFile], *, workers: int = 8, slab: int = 16) -> Tuple[float, float]:
+    """Finds a histogram range covering the intensities of all tomograms.
+
+    The minimum and maximum stored in MRC headers are used where present, so
+    usually no data is read. Other tomograms are streamed over.
+
+    Args:
+        tomograms (sequence of TomogramFile): The tomograms.
+
+        workers (int, optional): The number of tomograms inspected at once.
+        Defaults to 8.
+
+        slab (int, optional): The number of z-slices read at a time when
+        streaming. Defaults to 16.
+
+    Returns:
+        The smallest and largest intensity.
+    """
+    def inspect(tomogram):
+        found = _header_range(tomogram)
+        return found if found is not None else _streamed_range(tomogram, slab)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ranges = list(pool.map(inspect, tomograms))
+    low = min(r[0] for r in ranges)
+    high = max(r[1] for r in ranges)
+    if not high > low:
+        # A constant dataset still needs a non-empty histogram
+        high = low + 1.0
+    return low, high
+
+
+def summarize_tomogram(
+        tomogram: TomogramFile,
+        low: float,
+        high: float,
+        bins: int = 1024,
+        *,
+        slab: int = 16,
+        intensity: Optional[IntensitySummary] = None,
+        shape: Optional[Tuple[int, int, int]] = None
+    ) -> TomogramSummary:
+    """Summarizes one tomogram, reading its data slab by slab.
+
+    Args:
+        tomogram (TomogramFile): The tomogram. Its data need not be loaded.
+
+        low (float): The lower edge of the intensity histogram.
+
+        high (float): The upper edge of the intensity histogram.
+
+        bins (int, optional): The number of histogram bins. Defaults to 1024.
+
+        slab (int, optional): The number of z-slices read at a time. Defaults
+        to 16.
+
+        intensity (IntensitySummary, optional): A summary of the intensities
+        made earlier, with the given shape. If given, no data is read.
+        Defaults to None.
+
+        shape (tuple of int, optional): The shape of the tomogram, required
+        with `intensity`. Defaults to None.
+
+    Returns:
+        The summary.
+    """
+    signature = tomogram._source_signature()
+    if intensity is None:
+        intensity = IntensitySummary(low, high, bins)
+        with stage("summarize_tomogram") as s, tomogram.open_raw() as raw:
+            shape = raw.shape
+            for z0 in range(0, len(raw), slab):
+                values = raw[z0 : z0 + slab]
+                intensity.update(tomogram._as_loaded(values))
+                s.add(bytes_read=values.nbytes)
+
+    counts: Dict[str, int] = {}
+    for annotation in tomogram.annotations or []:
+        counts[annotation.name] = counts.get(annotation.name, 0) + len(annotation.points)
+    points = tomogram.annotation_points()
+    distances = np.minimum(points, np.asarray(shape) - 1 - points).min(axis=1) if len(points) > 0 else []
+    return TomogramSummary(
+        tomogram.filepath, shape, signature["source_size"], signature["source_mtime_ns"],
+        intensity, counts, distances
+    )
+
+
+def summarize(
+        tomograms: Sequence[TomogramFile],
+        *,
+        bins: int = 1024,
+        range: Optional[Tuple[float, float]] = None,
+        workers: int = 8,
+        slab: int = 16,
+        previous: Optional[DatasetSummary] = None
+    ) -> DatasetSummary:
+    """Summarizes a dataset in one streaming pass, summarizing tomograms in
+    parallel.
+
+    Memory use is about `workers` slabs of `slab` z-slices each, whatever the
+    size of the tomograms.
+
+    Args:
+        tomograms (sequence of TomogramFile): The tomograms, i.e., the output
+        of `Catalog.tomograms()`.
+
+        bins (int, optional): The number of histogram bins. Defaults to 1024.
+
+        range (tuple of float, optional): The range of the histogram. Defaults
+        to None, in which case the range of `previous` is kept if every
+        tomogram is unchanged since it was summarized there with the same
+        number of bins, and `histogram_range` is used otherwise. Note that
+        `histogram_range` reads tomograms without MRC header statistics, such
+        as `.npy` files, in full, before the pass that summarizes them.
+
+        workers (int, optional): The number of tomograms summarized at once.
+        Defaults to 8.
+
+        slab (int, optional): The number of z-slices read at a time. Defaults
+        to 16.
+
+        previous (DatasetSummary, optional): An earlier summary. The data of
+        tomograms it summarized with the same histogram bins, and whose files
+        are unchanged, is not read again; their annotations are still
+        recounted. Defaults to None.
+
+    Returns:
+        The summary.
+    """
+    fresh: Dict[str, TomogramSummary] = {}
+    if previous is not None:
+        fresh = {summary.filepath: summary for summary in previous.tomograms if summary.is_fresh()}
+    if range is None:
+        summaries = [fresh.get(tomogram.filepath) for tomogram in tomograms]
+        if all(summary is not None and summary.intensity.bins == bins for summary in summaries):
+            ranges = {(summary.intensity.low, summary.intensity.high) for summary in summaries}
+            if len(ranges) == 1:
+                # Nothing changed, so neither did the range
+                range = ranges.pop()
+    low, high = histogram_range(tomograms, workers=workers, slab=slab) if range is None else range
+    reference = IntensitySummary(low, high, bins)
+    reusable = {
+        filepath: summary for filepath, summary in fresh.items()
+        if summary.intensity.compatible(reference)
+    }
+
+    def run(tomogram):
+        summary = reusable.get(tomogram.filepath)
+        if summary is not None:
+            return summarize_tomogram(
+                tomogram, low, high, bins, intensity=summary.intensity, shape=summary.shape
+            )
+        return summarize_tomogram(tomogram, low, high, bins, slab=slab)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return DatasetSummary(list(pool.map(run, tomograms)))
@@ -5,10 +5,15 @@ A collection of utilities for use on BYU's supercomputer.
 
 import re
 import os
+import json
+import heapq
 from .annotation import AnnotationFile
 from .tomogram import TomogramFile
+from .sampling import SamplePlan
 
-from typing import List, Union, Optional
+import numpy as np
+
+from typing import List, Union, Optional, Sequence, Tuple
 
 def all_fm_tomograms() -> List[TomogramFile]:
     """Collect all pairs of `.rec` tomogram filepaths and flagellar motor `.mod` filepaths.
@@ -285,4 +290,209 @@ def seek_annotated_tomos(
             tomos.append(tomo)
     return tomos
 
+def array_rank(rank: Optional[int] = None, world_size: Optional[int] = None) -> Tuple[int, int]:
+    """Find which share of a job this process should do.
+
+    Explicit arguments take precedence. Otherwise the Slurm job array
+    variables are used: `SLURM_ARRAY_TASK_ID` minus `SLURM_ARRAY_TASK_MIN`,
+    divided by `SLURM_ARRAY_TASK_STEP`, gives the rank and
+    `SLURM_ARRAY_TASK_COUNT` the world size, so that arrays such as
+    `--array=1-8` and `--array=0-14:2` work. Outside of a job array, the
+    process does all of the work.
+
+    Args:
+        rank (int, optional): The index of this process. Defaults to None.
+
+        world_size (int, optional): The number of processes sharing the
+        work. Defaults to None.
+
+    Returns:
+        The rank and world size.
+
+    Raises:
+        ValueError: If the rank is not between 0 and the world size, or the
+        task id does not fit the array's minimum and step.
+    """
+    if rank is None:
+        task = os.environ.get("SLURM_ARRAY_TASK_ID")
+        if task is None:
+            rank = 0
+        else:
+            step = int(os.environ.get("SLURM_ARRAY_TASK_STEP", 1))
+            rank, remainder = divmod(int(task) - int(os.environ.get("SLURM_ARRAY_TASK_MIN", 0)), step)
+            if remainder != 0:
+                raise ValueError(
+                    f"Task {task} is not on the step of the job array. "
+                    "Arrays with a list of task ids are not supported; use --rank."
+                )
+    if world_size is None:
+        world_size = int(os.environ.get("SLURM_ARRAY_TASK_COUNT", 1))
+    if not 0 <= rank < world_size:
+        raise ValueError(f"Rank {rank} is not within a world size of {world_size}.")
+    return rank, world_size
+
+def partition_by_voxels(
+            tomograms: Sequence[TomogramFile], 
+            world_size: int, 
+            shapes: Optional[Sequence[Sequence[int]]] = None
+        ) -> List[List[int]]:
+    """Split tomograms into shards with about the same total number of
+    voxels.
+
+    The largest tomograms are placed first, each in the shard with the fewest
+    voxels so far. The result depends only on the shapes and their order, so
+    every process of a job array computes the same partition.
+
+    Args:
+        tomograms (sequence of TomogramFile): The tomograms to split.
+
+        world_size (int): The number of shards.
+
+        shapes (sequence, optional): The shape of each tomogram. Defaults to
+        None, in which case shapes are taken from the tomograms, reading file
+        headers where the data is not loaded.
+
+    Returns:
+        The indices of the tomograms in each shard, in ascending order.
+    """
+    if shapes is None:
+        shapes = [t.shape if t.shape is not None else t.header_shape() for t in tomograms]
+    voxels = [int(np.prod(shape)) for shape in shapes]
+    order = sorted(range(len(voxels)), key=lambda i: (-voxels[i], i))
+    loads = [(0, shard) for shard in range(world_size)]
+    shards: List[List[int]] = [[] for _ in range(world_size)]
+    for index in order:
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(index)
+        heapq.heappush(loads, (load + voxels[index], shard))
+    return [sorted(shard) for shard in shards]
+
+def shard_tomograms(
+            tomograms: Sequence[TomogramFile], 
+            rank: Optional[int] = None, 
+            world_size: Optional[int] = None,
+            shapes: Optional[Sequence[Sequence[int]]] = None
+        ) -> List[TomogramFile]:
+    """Select this process's share of the tomograms, balanced by voxel count.
+
+    Args:
+        tomograms (sequence of TomogramFile): All of the tomograms, i.e., the
+        output of `all_fm_tomograms()`, in the same order in every process.
+
+        rank (int, optional): The index of this process. Defaults to None, in
+        which case it is found as in `array_rank`.
+
+        world_size (int, optional): The number of processes. Defaults to None,
+        in which case it is found as in `array_rank`.
+
+        shapes (sequence, optional): The shape of each tomogram, as in
+        `partition_by_voxels`. Defaults to None.
+
+    Returns:
+        The tomograms this process should handle.
+    """
+    rank, world_size = array_rank(rank, world_size)
+    return [tomograms[i] for i in partition_by_voxels(tomograms, world_size, shapes)[rank]]
+
+def shard_plan(
+            plan: SamplePlan, 
+            rank: Optional[int] = None, 
+            world_size: Optional[int] = None
+        ) -> SamplePlan:
+    """Select this process's share of a sample plan. The shares of all
+    processes can be combined again with `SamplePlan.merge`.
+
+    Args:
+        plan (SamplePlan): The full plan.
+
+        rank (int, optional): The index of this process. Defaults to None, in
+        which case it is found as in `array_rank`.
+
+        world_size (int, optional): The number of processes. Defaults to None,
+        in which case it is found as in `array_rank`.
+
+    Returns:
+        Every `world_size`-th sample of the plan, starting at `rank`.
+    """
+    rank, world_size = array_rank(rank, world_size)
+    return plan.shard(rank, world_size)
+
+def shard_output(out_dir: str, rank: Optional[int] = None, world_size: Optional[int] = None) -> str:
+    """Get the directory for this process's outputs, such as the shards
+    written by `export_shards`, and create it if needed.
+
+        export_shards(shard_plan(plan), shard_output(out_dir),
+                      generators=generators, key_prefix=shard_key_prefix())
+
+    Args:
+        out_dir (str): The directory shared by all processes.
+
+        rank (int, optional): The index of this process. Defaults to None, in
+        which case it is found as in `array_rank`.
+
+        world_size (int, optional): The number of processes. Defaults to None,
+        in which case it is found as in `array_rank`.
+
+    Returns:
+        The directory `out_dir/rank-RRRRR-of-WWWWW`.
+    """
+    rank, world_size = array_rank(rank, world_size)
+    directory = os.path.join(out_dir, f"rank-{rank:05d}-of-{world_size:05d}")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def shard_key_prefix(rank: Optional[int] = None, world_size: Optional[int] = None) -> str:
+    """Get a sample key prefix unique to this process, to pass as the
+    `key_prefix` of `export_shards` so that the keys of all ranks stay unique
+    once merged with `merge_shard_outputs`.
+
+    Args:
+        rank (int, optional): The index of this process. Defaults to None, in
+        which case it is found as in `array_rank`.
+
+        world_size (int, optional): The number of processes. Defaults to None,
+        in which case it is found as in `array_rank`.
+
+    Returns:
+        The prefix `rank-RRRRR-`.
+    """
+    rank, world_size = array_rank(rank, world_size)
+    return f"rank-{rank:05d}-"
+
+def merge_shard_outputs(out_dir: str) -> dict:
+    """Combine the `index.json` files written by `export_shards` into each
+    rank's directory of `out_dir` into one `out_dir/index.json`, so that
+    `ShardReader(out_dir)` reads the shards of every rank.
+
+    Run this once every rank has finished. Sample keys are unique across
+    ranks only if each rank exported with its `shard_key_prefix()`.
+
+    Args:
+        out_dir (str): The directory passed to `shard_output` by every rank.
 
+    Returns:
+        The merged index.
+
+    Raises:
+        Exception: If a rank's directory is missing or has no index.
+    """
+    directories = sorted(d for d in os.listdir(out_dir) if re.match(r"^rank-\d{5}-of-\d{5}$", d))
+    if len(directories) == 0:
+        raise Exception(f"No rank directories found in {out_dir}.")
+    world_size = int(directories[0].rsplit("-", 1)[1])
+    expected = [f"rank-{rank:05d}-of-{world_size:05d}" for rank in range(world_size)]
+    if directories != expected:
+        raise Exception(f"Expected the directories of {world_size} ranks in {out_dir}, found {directories}.")
+
+    merged = {"shards": [], "counts": []}
+    for directory in directories:
+        index_path = os.path.join(out_dir, directory, "index.json")
+        if not os.path.exists(index_path):
+            raise Exception(f"{index_path} is missing. Has every rank finished?")
+        with open(index_path, 'r') as file:
+            index = json.load(file)
+        merged["shards"] += [os.path.join(directory, name) for name in index["shards"]]
+        merged["counts"] += index["counts"]
+    with open(os.path.join(out_dir, "index.json"), 'w') as file:
+        json.dump(merged, file)
+    return merged
@@ -0,0 +1,161 @@
+"""
+Utilities to write synthetic tomogram and annotation files, for tests and
+benchmarks that should not depend on real data.
+"""
+
+import json
+import os
+
+import mrcfile
+import numpy as np
+import pandas as pd
+from imodmodel import ImodModel
+
+from typing import List, Optional, Sequence
+
+
+def random_points(
+        shape: Sequence[int],
+        n_points: int,
+        gen: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+    """Draws random points inside a volume of the given shape.
+
+    Args:
+        shape (sequence of int): The shape of the volume.
+
+        n_points (int): The number of points to draw.
+
+        gen (np.random.Generator, optional): Random number generator. Defaults
+        to None, in which case a new one is created.
+
+    Returns:
+        An (n_points, 3) array of integer-valued points.
+    """
+    gen = np.random.default_rng() if gen is None else gen
+    return gen.integers(0, shape, size=(n_points, 3)).astype(np.float64)
+
+
+def write_mrc(
+        filepath: str,
+        shape: Sequence[int],
+        gen: Optional[np.random.Generator] = None,
+        *,
+        slab: int = 16
+    ):
+    """Writes a `.mrc` or `.rec` file of random float32 data.
+
+    The data is written a slab of z-slices at a time through a memory map, so
+    files larger than available memory can be generated.
+
+    Args:
+        filepath (str): The file to write.
+
+        shape (sequence of int): The shape of the volume.
+
+        gen (np.random.Generator, optional): Random number generator. Defaults
+        to None, in which case a new one is created.
+
+        slab (int, optional): The number of z-slices generated at once.
+        Defaults to 16.
+    """
+    gen = np.random.default_rng() if gen is None else gen
+    shape = tuple(int(s) for s in shape)
+    with mrcfile.new_mmap(filepath, shape, mrc_mode=2, overwrite=True) as mrc:
+        for z0 in range(0, shape[0], slab):
+            z1 = min(z0 + slab, shape[0])
+            mrc.data[z0:z1] = gen.normal(size=(z1 - z0,) + shape[1:])
+        mrc.update_header_stats()
+
+
+def write_mod(filepath: str, points: np.ndarray, shape: Sequence[int]):
+    """Writes points to an IMOD `.mod` file.
+
+    Points are given in tomogram index order, as returned by
+    AnnotationFile.mod_points.
+
+    Args:
+        filepath (str): The file to write.
+
+        points (numpy.ndarray): An (N, 3) array of points.
+
+        shape (sequence of int): The shape of the annotated tomogram, stored
+        in the model header.
+    """
+    points = np.reshape(points, (-1, 3))
+    # AnnotationFile.mod_points reverses the axes of stored points.
+    df = pd.DataFrame({
+        "x": points[:, 2],
+        "y": points[:, 1],
+        "z": points[:, 0],
+    })
+    model = ImodModel.from_dataframe(df)
+    nz, ny, nx = shape
+    model.header.xmax = int(nx)
+    model.header.ymax = int(ny)
+    model.header.zmax = int(nz)
+    model.to_file(filepath)
+
+
+def write_ndjson(filepath: str, points: np.ndarray):
+    """Writes points to a CryoET Data Portal style `.ndjson` file.
+
+    Points are given in tomogram index order, as returned by
+    AnnotationFile.ndjson_points.
+
+    Args:
+        filepath (str): The file to write.
+
+        points (numpy.ndarray): An (N, 3) array of points.
+    """
+    with open(filepath, 'w') as file:
+        for point in np.reshape(points, (-1, 3)):
+            location = {"x": float(point[1]), "y": float(point[2]), "z": float(point[0])}
+            file.write(json.dumps({"type": "orientedPoint", "location": location}) + "\n")
+
+
+def write_dataset(
+        root: str,
+        n_tomograms: int,
+        shape: Sequence[int],
+        n_points: int,
+        gen: Optional[np.random.Generator] = None,
+        *,
+        prefix: str = "syn"
+    ) -> List[str]:
+    """Writes a directory tree of synthetic annotated tomograms.
+
+    Each tomogram gets its own directory, `{prefix}0000`, `{prefix}0001`, and
+    so on, containing `{prefix}NNNN.rec`, `FM.mod` and `FM.ndjson`. This
+    mirrors the layout searched by the functions in `supercomputer_utils`.
+
+    Args:
+        root (str): The directory to write the dataset into.
+
+        n_tomograms (int): The number of tomograms to write.
+
+        shape (sequence of int): The shape of each tomogram.
+
+        n_points (int): The number of annotation points per tomogram.
+
+        gen (np.random.Generator, optional): Random number generator. Defaults
+        to None, in which case a new one is created.
+
+        prefix (str, optional): Prefix of the tomogram directory names.
+        Defaults to "syn".
+
+    Returns:
+        The directories of the written tomograms.
+    """
+    gen = np.random.default_rng() if gen is None else gen
+    directories = []
+    for index in range(n_tomograms):
+        name = f"{prefix}{index:04d}"
+        directory = os.path.join(root, name)
+        os.makedirs(directory, exist_ok=True)
+        write_mrc(os.path.join(directory, f"{name}.rec"), shape, gen)
+        points = random_points(shape, n_points, gen)
+        write_mod(os.path.join(directory, "FM.mod"), points, shape)
+        write_ndjson(os.path.join(directory, "FM.ndjson"), points)
+        directories.append(directory)
+    return directories
@@ -2,13 +2,222 @@ import numpy as np
 from skimage import exposure
 
 import mrcfile
+import mrcfile.utils
 
+import asyncio
+import itertools
+import json
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from .annotation import Annotation
 from .annotation import AnnotationFile
+from .cache import cache_path, is_fresh, temporary_path
+from .instrumentation import stage
+
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+def block_mean(
+        data: np.ndarray,
+        factor: int,
+        *,
+        out: Optional[np.ndarray] = None,
+        slab: int = 16,
+        dtype: type = np.float32
+    ) -> np.ndarray:
+    """Bin a volume by averaging non-overlapping cubes of `factor` voxels per
+    side.
+
+    The volume is read a slab of z-slices at a time, so `data` may be a
+    memory-mapped array much larger than available memory. Voxels beyond the
+    last whole block along an axis are dropped.
+
+    Args:
+        data (numpy.ndarray): A 3-dimensional array to bin.
+
+        factor (int): The binning factor along each axis.
+
+        out (numpy.ndarray, optional): Array to write the binned volume into,
+        i.e., a memory-mapped `.npy` file. Defaults to None, in which case a
+        new array is allocated.
+
+        slab (int, optional): The number of binned z-slices computed at once.
+        Defaults to 16.
+
+        dtype (type, optional): The dtype of the newly allocated output, if
+        `out` is not given. Defaults to numpy.float32.
+
+    Returns:
+        The binned volume, of shape `data.shape // factor`.
+    """
+    binned_shape = tuple(s // factor for s in data.shape)
+    if out is None:
+        out = np.empty(binned_shape, dtype=dtype)
+    nz, ny, nx = binned_shape
+    for z0 in range(0, nz, slab):
+        z1 = min(z0 + slab, nz)
+        block = np.asarray(
+            data[z0 * factor : z1 * factor, : ny * factor, : nx * factor],
+            dtype=np.float64
+        )
+        block = block.reshape(z1 - z0, factor, ny, factor, nx, factor)
+        out[z0:z1] = block.mean(axis=(1, 3, 5))
+    return out
+
+
+def _slab_bounds(length: int, workers: int, slab: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Split `length` z-slices into slabs of `slab` slices, or by default
+    into about four slabs per worker."""
+    if slab is None:
+        slab = max(1, -(-length // (4 * workers)))
+    return [(z0, min(z0 + slab, length)) for z0 in range(0, length, slab)]
+
+
+def _map_slabs(function, data: np.ndarray, workers: int, slab: Optional[int] = None) -> list:
+    """Apply `function(z0, z1)` to each slab of `data` in a thread pool."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda b: function(*b), _slab_bounds(len(data), workers, slab)))
+
+
+def _sum_slabs(function, data: np.ndarray, workers: int, slab: Optional[int] = None):
+    """Sum `function(z0, z1)` over the slabs of `data` in a thread pool,
+    with at most `workers` slabs in flight, so that only a few results are
+    held at a time."""
+    total = None
+    bounds = iter(_slab_bounds(len(data), workers, slab))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(function, *b) for b in itertools.islice(bounds, workers))
+        while pending:
+            result = pending.popleft().result()
+            following = next(bounds, None)
+            if following is not None:
+                pending.append(pool.submit(function, *following))
+            total = result if total is None else total + result
+    return total
+
+
+def parallel_percentile(
+        data: np.ndarray,
+        percentiles: Sequence[float],
+        workers: int,
+        *,
+        bins: int = 65536,
+        slab: Optional[int] = None,
+        dtype: Optional[type] = None
+    ) -> np.ndarray:
+    """Compute percentiles of an array with a thread pool, giving the same
+    result as `np.percentile(np.asarray(data, dtype), percentiles)`.
+
+    The order statistics that np.percentile interpolates between are found
+    exactly by counting: each slab is binned between the global minimum and
+    maximum, the bins holding the wanted ranks are located from the total
+    counts, and only the values in those bins are gathered and partitioned.
+    They are then interpolated the way np.percentile interpolates them.
+
+    Only one slab per thread is held in memory at a time, besides the
+    gathered values, so with `slab` set this also streams over memory-mapped
+    data without reading it all into memory.
+
+    Args:
+        data (numpy.ndarray): The array, with at least one dimension.
+        percentiles (sequence of float): The percentiles, between 0 and 100.
+        workers (int): The number of threads. With one thread and no `slab`,
+            np.percentile is used.
+        bins (int, optional): The number of bins values are counted in.
+            Defaults to 65536.
+        slab (int, optional): The number of z-slices binned at a time.
+            Defaults to None, in which case there are about four slabs per
+            thread.
+        dtype (type, optional): The dtype the data is interpolated in, as if
+            converted to it. Defaults to None, in which case floating point
+            data keeps its dtype and other data is converted to float64.
+
+    Returns:
+        The percentiles of `data`.
+    """
+    if dtype is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    n = data.size
+    if n == 0 or (workers <= 1 and slab is None):
+        return np.percentile(np.asarray(data, dtype=dtype), percentiles)
+    workers = max(workers, 1)
+    extrema = _map_slabs(lambda z0, z1: (data[z0:z1].min(), data[z0:z1].max()), data, workers, slab)
+    # Integer extrema would overflow when subtracted
+    low = min(float(e[0]) for e in extrema)
+    high = max(float(e[1]) for e in extrema)
+    if np.isnan(low) or np.isnan(high) or not np.isfinite(high - low):
+        # NaNs propagate, and infinities defeat binning
+        return np.percentile(np.asarray(data, dtype=dtype), percentiles)
+
+    # The same indexes and weights as np.percentile's linear method
+    virtual = (n - 1) * np.true_divide(percentiles, 100)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = np.minimum(previous.astype(np.intp), n - 1)
+    following = np.minimum(previous + 1, n - 1)
+    ranks = np.unique(np.concatenate((previous, following)))
+
+    width = (high - low) / bins
+    def bin_of(values):
+        if width == 0:
+            return np.zeros(values.shape, dtype=np.intp)
+        offsets = np.subtract(values, low, dtype=np.float64)
+        offsets /= width
+        indexes = offsets.astype(np.intp)
+        return np.minimum(indexes, bins - 1, out=indexes)
+
+    counts = _sum_slabs(
+        lambda z0, z1: np.bincount(bin_of(data[z0:z1]).ravel(), minlength=bins),
+        data, workers, slab
+    )
+    cumulative = np.cumsum(counts)
+    rank_bins = np.searchsorted(cumulative, ranks, side='right')
+    wanted = np.unique(rank_bins)
+
+    def gather(z0, z1):
+        values = np.asarray(data[z0:z1])
+        indexes = bin_of(values)
+        return [values[indexes == b] for b in wanted]
+
+    gathered = _map_slabs(gather, data, workers, slab)
+    candidates = {b: np.concatenate([g[i] for g in gathered]) for i, b in enumerate(wanted)}
+    order_statistics = {}
+    for rank, b in zip(ranks, rank_bins):
+        below = cumulative[b - 1] if b > 0 else 0
+        order_statistics[rank] = np.partition(candidates[b], rank - below)[rank - below]
+
+    a = np.array([order_statistics[r] for r in previous], dtype=dtype)
+    b = np.array([order_statistics[r] for r in following], dtype=dtype)
+    # As np.percentile's interpolation, which is exact at both ends
+    difference = b - a
+    result = np.add(a, difference * gamma)
+    np.subtract(b, difference * (1 - gamma), out=result, where=gamma >= 0.5,
+                casting='unsafe', dtype=type(result.dtype))
+    return result
+
+
+def _pad_indices(start: int, length: int, size: int, mode: str) -> np.ndarray:
+    """Map positions `start` to `start + length` along an axis of `size`
+    voxels into the axis, padding as np.pad does in `mode`."""
+    positions = np.arange(start, start + length)
+    if mode == "edge":
+        return np.clip(positions, 0, size - 1)
+    if mode == "wrap":
+        return positions % size
+    if mode == "reflect":
+        if size == 1:
+            return np.zeros_like(positions)
+        period = 2 * (size - 1)
+        folded = positions % period
+        return np.where(folded < size, folded, period - folded)
+    # "symmetric"
+    period = 2 * size
+    folded = positions % period
+    return np.where(folded < size, folded, period - 1 - folded)
 
-from typing import List, Optional
 
 class Tomogram:
     """Represents a tomogram.
@@ -38,40 +247,203 @@ class Tomogram:
         self.data = data
         self.shape = data.shape
     
+    def crop(
+            self,
+            lower_bounds: Sequence[int],
+            shape: Sequence[int],
+            dtype: Optional[type] = None
+        ) -> np.ndarray:
+        """Get the data in a box of the tomogram.
+
+        As with slicing, the box is cut short where it extends past the edge of
+        the tomogram.
+
+        Args:
+            lower_bounds (sequence of int): The lower bounds of the box.
+            shape (sequence of int): The shape of the box.
+            dtype (type, optional): The dtype to return the box as. Defaults
+                to None, in which case a view of the data is returned.
+
+        Returns:
+            The data in the box.
+        """
+        min_0, min_1, min_2 = lower_bounds
+        shape_0, shape_1, shape_2 = shape
+        region = self.data[
+            min_0 : min_0 + shape_0,
+            min_1 : min_1 + shape_1,
+            min_2 : min_2 + shape_2
+        ]
+        return region if dtype is None else region.astype(dtype, copy=False)
+
+    def extract(
+            self,
+            lower_bounds: Sequence[int],
+            shape: Sequence[int],
+            out: Optional[np.ndarray] = None,
+            *,
+            pad_mode: str = "constant",
+            pad_value: float = 0,
+            dtype: Optional[type] = None
+        ) -> np.ndarray:
+        """Copy a box of the tomogram into an array of exactly its shape.
+
+        Unlike `crop`, the result never shares memory with the tomogram, and
+        parts of the box outside the tomogram are padded rather than cut off.
+        Only the part of the tomogram the box covers is read, through `crop`.
+
+        Args:
+            lower_bounds (sequence of int): The lower bounds of the box, which
+                may be negative.
+            shape (sequence of int): The shape of the box.
+            out (numpy.ndarray, optional): The array to write the box to, of
+                shape `shape`, i.e., one element of a preallocated batch.
+                Defaults to None, in which case a new array is allocated.
+            pad_mode (str, optional): How to fill the parts of the box outside
+                the tomogram, as in np.pad: "constant", "edge", "reflect",
+                "symmetric" or "wrap". Defaults to "constant".
+            pad_value (float, optional): The value "constant" padding fills
+                with. Defaults to 0.
+            dtype (type, optional): The dtype of a newly allocated array.
+                Defaults to None, in which case the dtype of `crop` is used.
+
+        Returns:
+            The box, `out` if given.
+
+        Raises:
+            ValueError: If `out` does not have shape `shape`, or `pad_mode` is
+                unknown.
+        """
+        shape = tuple(int(s) for s in shape)
+        if out is not None and out.shape != shape:
+            raise ValueError(f"out has shape {out.shape}, but the box has shape {shape}.")
+        if pad_mode not in ("constant", "edge", "reflect", "symmetric", "wrap"):
+            raise ValueError(f"Unknown pad_mode {pad_mode!r}.")
+        sizes = tuple(int(s) for s in (self.shape if self.shape is not None else self.header_shape()))
+        starts = [int(b) for b in lower_bounds]
+        if dtype is None and out is not None:
+            dtype = out.dtype
+
+        inside = all(0 <= b and b + l <= n for b, l, n in zip(starts, shape, sizes))
+        if inside or pad_mode == "constant":
+            # Read the part of the box inside the tomogram
+            lows = [min(max(b, 0), n) for b, n in zip(starts, sizes)]
+            highs = [min(max(b + l, 0), n) for b, l, n in zip(starts, shape, sizes)]
+            region = self._crop_as(lows, [h - l for l, h in zip(lows, highs)], dtype)
+            if out is None:
+                out = np.empty(shape, dtype=region.dtype)
+            inner = tuple(slice(max(l - b, 0), max(h - b, 0)) for l, h, b in zip(lows, highs, starts))
+            if not inside:
+                out.fill(pad_value)
+            out[inner] = region
+            return out
+
+        # Map every position of the box to a position in the tomogram
+        indices = [_pad_indices(b, l, n, pad_mode) for b, l, n in zip(starts, shape, sizes)]
+        lows = [int(i.min()) for i in indices]
+        highs = [int(i.max()) + 1 for i in indices]
+        region = self._crop_as(lows, [h - l for l, h in zip(lows, highs)], dtype)
+        if out is None:
+            out = np.empty(shape, dtype=region.dtype)
+        out[...] = region[np.ix_(*(i - l for i, l in zip(indices, lows)))]
+        return out
+
+    def _crop_as(self, lower_bounds: Sequence[int], shape: Sequence[int], dtype: Optional[type]) -> np.ndarray:
+        """Crop, converting to `dtype` if given."""
+        if dtype is None:
+            return self.crop(lower_bounds, shape)
+        return self.crop(lower_bounds, shape, dtype)
+
     def add_annotation(self, annotation: Annotation):
         """Add an annotation to the tomogram.
 
+        Its points are appended to the cached array returned by
+        `annotation_points`.
+
         Args:
             annotation (Annotation): An annotation object to be added to
                 the tomogram's annotations.
         """
+        cached = self._point_cache_is_current()
         self.annotations.append(annotation)
-    
-    def annotation_points(self, annotation_index: Optional[int] = None):
+        if cached:
+            self._append_points(annotation.points)
+            self._cached_count += 1
+
+    def _point_cache_is_current(self) -> bool:
+        """Check whether the cached points match self.annotations."""
+        return (
+            getattr(self, "_cached_annotations", None) is self.annotations
+            and self._cached_count == len(self.annotations)
+        )
+
+    def _append_points(self, points):
+        """Append an annotation's points to the cached array, growing it
+        geometrically."""
+        points = np.reshape(np.asarray(points, dtype=np.float64), (-1, 3))
+        n, m = self._n_points, len(points)
+        if n + m > len(self._point_buffer):
+            buffer = np.empty((max(2 * len(self._point_buffer), n + m, 16), 3))
+            buffer[:n] = self._point_buffer[:n]
+            self._point_buffer = buffer
+        self._point_buffer[n : n + m] = points
+        self._n_points = n + m
+        self._point_offsets.append(self._n_points)
+
+    def _point_cache(self) -> np.ndarray:
+        """Get the cached (N, 3) array of all points, rebuilding it if the
+        annotations list was replaced or changed other than through
+        `add_annotation`."""
+        if not self._point_cache_is_current():
+            self._point_buffer = np.empty((0, 3))
+            self._n_points = 0
+            self._point_offsets = [0]
+            for annotation in self.annotations:
+                self._append_points(annotation.points)
+            self._cached_annotations = self.annotations
+            self._cached_count = len(self.annotations)
+        points = self._point_buffer[: self._n_points]
+        points.flags.writeable = False
+        return points
+
+    def annotation_offsets(self) -> np.ndarray:
+        """Get where each annotation's points start in `annotation_points()`.
+
+        Returns:
+            An array of one more element than there are annotations. The
+            points of annotation `i` are rows `offsets[i]` to `offsets[i + 1]`.
+        """
+        self._point_cache()
+        return np.array(self._point_offsets)
+
+    def annotation_points(self, annotation_index: Optional[int] = None) -> np.ndarray:
         """Get annotation points from the tomogram.
 
         Retrieves annotation points from a specific annotation
         if an index is provided, or all annotation points from all
         annotations if no index is given.
 
+        Points are kept in a cached array that `add_annotation` extends, and
+        are returned as read-only views of it, without copying. The points of
+        an annotation are assumed not to change once it is added.
+
         Args:
             annotation_index (int, optional): The index of the annotation
                 from which to retrieve points. If None, retrieves points
                 from all annotations. Defaults to None.
 
         Returns:
-            A list of points from the specified annotation or
+            An (N, 3) array of points from the specified annotation or
                 all annotations.
         """
+        points = self._point_cache()
         if annotation_index is not None:
-            return self.annotations[annotation_index].points
-        else:
-            indices = range(len(self.annotations))
-            points = []
-            for index in indices:
-                points += self.annotation_points(index)
-            return points
-        
+            if annotation_index < 0:
+                annotation_index += len(self.annotations)
+            start = self._point_offsets[annotation_index]
+            stop = self._point_offsets[annotation_index + 1]
+            return points[start:stop]
+        return points
 
 
 class TomogramFile(Tomogram):
@@ -86,6 +458,13 @@ class TomogramFile(Tomogram):
             tomogram.
         data (numpy.ndarray): A 3-dimensional array containing the tomogram
             image.
+        quantize (type or None): The unsigned integer dtype preprocessed data
+            is stored as, if any.
+        quantization (tuple of float or None): The `(scale, offset)` that
+            maps stored integers back to intensities, `value = scale * code +
+            offset`, while the data is quantized.
+        processed (bool): Whether `data` holds preprocessed data, stretched
+            from `clip_range`, rather than raw data.
     """
 
     def __init__(
@@ -94,7 +473,9 @@ class TomogramFile(Tomogram):
             annotations: 
             Optional[List[Annotation]] = None, 
             *, 
-            load: bool = True
+            load: bool = True,
+            cache_dir: Optional[str] = None,
+            quantize: Optional[type] = None
         ):
         """Initialize a TomogramFile instance.
 
@@ -105,64 +486,145 @@ class TomogramFile(Tomogram):
             load (bool, optional): Whether to load tomogram array data
                 immediately. Defaults to True. If False, use self.load() when
                 ready to load data.
+            cache_dir (str, optional): Directory in which to store files
+                derived from this tomogram, such as binned volumes. Defaults to
+                None, in which case they are stored next to the tomogram file.
+            quantize (type, optional): Store the preprocessed data as this
+                unsigned integer dtype, np.uint8 or np.uint16, instead of
+                float64. Crops are converted back to floats one at a time (see
+                `crop`), so resident memory drops 4 to 8 times at the cost of
+                a rounding error of at most half a quantization step. Defaults
+                to None.
         """
+        if quantize is not None and np.dtype(quantize) not in (np.uint8, np.uint16):
+            raise ValueError("quantize must be np.uint8 or np.uint16.")
         self.data = None
-        self.annotations = annotations
+        self.shape = None
+        self.annotations = [] if annotations is None else annotations
         self.filepath = filepath
+        self.cache_dir = cache_dir
+        self.clip_range = None
+        self.lazy = False
+        self.processed = False
+        self.quantize = quantize
+        self.quantization = None
+        self._statistics = None
 
         if load:
             self.data = self.load()
 
-    def load(self, *, preprocess: bool = True):
+    def load(self, *, preprocess: bool = True, lazy: bool = False, workers: Optional[int] = None):
         """Load the tomogram data from the specified file.
 
         This method determines the file type based on its extension and loads
-        the data accordingly.
+        the data accordingly. If a preprocessed copy written by
+        `write_processed` is up to date, it is read instead of preprocessing
+        the file again.
 
         Args:
             preprocess (bool, optional): Whether to preprocess the data after
                 loading. Defaults to True.
+            lazy (bool, optional): If True and `preprocess` is True, keep the
+                raw data and apply preprocessing only to each crop taken with
+                `crop`, such as by Subtomogram. Crops are identical to those of
+                a preprocessed volume. Defaults to False.
+            workers (int, optional): The number of threads preprocessing
+                uses, as in `process`. Defaults to None.
 
         Returns:
             The loaded tomogram data.
 
         Raises:
             IOError: If the file type is not supported.
+
+            ValueError: If `lazy` is True and the tomogram is quantized.
         """
         if self.data is not None:
             return self.data
+        if lazy and preprocess and self.quantize is not None:
+            raise ValueError("Quantized tomograms cannot be preprocessed lazily.")
         
-        # Determine how to load based on file extension.
-        root, extension = os.path.splitext(self.filepath)
-        if extension in [".mrc", ".rec"]:
-            data = TomogramFile.mrc_to_np(self.filepath)
-        elif extension == ".npy":
-            data = np.load(self.filepath)
-        else:
-            raise IOError("Tomogram file must be of type .mrc, .rec, or .npy.")
-        
-        # Initialize Tomogram class
-        super().__init__(data, self.annotations)
+        with stage("TomogramFile.load"):
+            if preprocess and not lazy and self.clip_range is None and self._load_processed():
+                return self.data
 
-        if preprocess:
-            self.process()
+            # Determine how to load based on file extension.
+            root, extension = os.path.splitext(self.filepath)
+            if extension in [".mrc", ".rec"]:
+                data = TomogramFile.mrc_to_np(self.filepath)
+            elif extension == ".npy":
+                with stage("TomogramFile.load.npy") as s:
+                    data = np.load(self.filepath)
+                    s.add(bytes_read=data.nbytes, arrays=1, bytes_allocated=data.nbytes)
+            else:
+                raise IOError("Tomogram file must be of type .mrc, .rec, or .npy.")
+            
+            # Initialize Tomogram class
+            super().__init__(data, self.annotations)
+            self.processed = False
+
+            if preprocess:
+                if self.clip_range is None:
+                    statistics = self._read_statistics()
+                    if statistics is not None:
+                        self.clip_range = (statistics["p2"], statistics["p98"])
+                    else:
+                        self.clip_range = TomogramFile.clip_values(self.data, workers=workers)
+                if lazy:
+                    self.lazy = True
+                else:
+                    self.process(self.clip_range, workers=workers)
         
         return self.data
 
+    async def aload(self, *, preprocess: bool = True, lazy: bool = False) -> np.ndarray:
+        """Load the tomogram data without blocking the event loop.
+
+        The file is read and processed by `load` in a worker thread, so many
+        loads can overlap, which hides per-file latency on network
+        filesystems.
+
+        Args:
+            preprocess (bool, optional): Whether to preprocess the data after
+                loading. Defaults to True.
+            lazy (bool, optional): Whether to defer preprocessing to crops, as
+                in `load`. Defaults to False.
+
+        Returns:
+            The loaded tomogram data.
+        """
+        return await asyncio.to_thread(self.load, preprocess=preprocess, lazy=lazy)
+
     @staticmethod
-    def rescale(array: np.ndarray) -> np.ndarray:
+    def rescale(array: np.ndarray, *, workers: Optional[int] = None) -> np.ndarray:
         """Rescale array values to the range [0, 1].
 
         Args:
             array (numpy.ndarray): The array to be rescaled.
+            workers (int, optional): The number of threads to rescale z-slabs
+                of the array with. The result is identical to that of a single
+                thread. Defaults to None, in which case one thread is used.
 
         Returns:
             The rescaled array.
         """
-        maximum = np.max(array)
-        minimum = np.min(array)
+        if workers is None or workers <= 1 or array.ndim == 0:
+            maximum = np.max(array)
+            minimum = np.min(array)
+            range_ = maximum - minimum
+            return (array - minimum) / range_
+
+        extrema = _map_slabs(lambda z0, z1: (np.min(array[z0:z1]), np.max(array[z0:z1])), array, workers)
+        minimum = np.min([e[0] for e in extrema]).astype(array.dtype)
+        maximum = np.max([e[1] for e in extrema]).astype(array.dtype)
         range_ = maximum - minimum
-        return (array - minimum) / range_
+        out = np.empty(array.shape, dtype=((array[:1] - minimum) / range_).dtype)
+
+        def rescale_slab(z0, z1):
+            np.divide(array[z0:z1] - minimum, range_, out=out[z0:z1])
+
+        _map_slabs(rescale_slab, array, workers)
+        return out
 
     @staticmethod
     def mrc_to_np(filepath: str) -> np.ndarray:
@@ -174,25 +636,170 @@ class TomogramFile(Tomogram):
         Returns:
             The data loaded as a numpy array.
         """
-        with mrcfile.open(filepath, 'r') as mrc:
-            data = mrc.data.astype(np.float64)
-            return data
+        with stage("mrc_to_np.read") as s:
+            with mrcfile.open(filepath, 'r') as mrc:
+                raw = mrc.data
+            s.add(bytes_read=raw.nbytes, arrays=1, bytes_allocated=raw.nbytes)
+        with stage("mrc_to_np.cast") as s:
+            data = raw.astype(np.float64)
+            s.add(arrays=1, bytes_allocated=data.nbytes)
+        return data
 
-    def process(self) -> np.ndarray:
+    @staticmethod
+    def clip_values(data: np.ndarray, *, workers: Optional[int] = None) -> Tuple[float, float]:
+        """Compute the intensities that contrast stretching maps to the ends of
+        the output range.
+
+        Args:
+            data (numpy.ndarray): The tomogram data.
+            workers (int, optional): The number of threads to compute the
+                percentiles with (see `parallel_percentile`). The result is
+                identical to that of a single thread. Defaults to None, in
+                which case one thread is used.
+
+        Returns:
+            The 2nd and 98th percentiles of `data`.
+        """
+        with stage("process.percentile") as s:
+            if workers is None or workers <= 1:
+                p2, p98 = np.percentile(data, (2, 98))
+                # np.percentile partitions a copy of the data
+                s.add(arrays=1, bytes_allocated=data.nbytes)
+            else:
+                p2, p98 = parallel_percentile(data, (2, 98), workers)
+        return float(p2), float(p98)
+
+    def process(
+            self,
+            in_range: Optional[Tuple[float, float]] = None,
+            *,
+            workers: Optional[int] = None
+        ) -> np.ndarray:
         """Process the tomogram to improve contrast using contrast stretching.
 
         This method applies contrast stretching to enhance the visibility
-        of features in the tomogram.
+        of features in the tomogram. If `self.quantize` is set, the result is
+        stored quantized, a slab at a time, without a float copy of the whole
+        volume.
+
+        Args:
+            in_range (tuple of float, optional): The intensities to stretch to
+                the ends of the output range. Defaults to None, in which case
+                the 2nd and 98th percentiles of the data are used.
+            workers (int, optional): The number of threads to process z-slabs
+                of the tomogram with. The result is identical to that of a
+                single thread. Defaults to None, in which case one thread is
+                used.
         
         Returns:
             The processed tomogram data.
         """
         # Contrast stretching
-        p2, p98 = np.percentile(self.data, (2, 98))
-        data_rescale = exposure.rescale_intensity(self.data, in_range=(p2, p98))
+        if in_range is None:
+            in_range = TomogramFile.clip_values(self.data, workers=workers)
+        with stage("process.rescale") as s:
+            if self.quantize is not None:
+                data_rescale, self.quantization = TomogramFile.quantize_rescaled(
+                    self.data, in_range, self.quantize, workers=workers
+                )
+            elif workers is None or workers <= 1:
+                data_rescale = exposure.rescale_intensity(self.data, in_range=in_range)
+            else:
+                data_rescale = TomogramFile._rescale_intensity_slabs(self.data, in_range, workers)
+            s.add(arrays=1, bytes_allocated=data_rescale.nbytes)
         self.data = data_rescale
+        self.clip_range = tuple(in_range)
+        self.lazy = False
+        self.processed = True
         return self.data
 
+    @staticmethod
+    def _rescale_intensity_slabs(
+            data: np.ndarray,
+            in_range: Tuple[float, float],
+            workers: int
+        ) -> np.ndarray:
+        """Contrast stretch z-slabs of the data in a thread pool. The stretch
+        is elementwise, so this matches stretching the whole volume."""
+        out_dtype = exposure.rescale_intensity(data[:1, :1, :1], in_range=in_range).dtype
+        out = np.empty(data.shape, dtype=out_dtype)
+
+        def rescale_slab(z0, z1):
+            out[z0:z1] = exposure.rescale_intensity(data[z0:z1], in_range=in_range)
+
+        _map_slabs(rescale_slab, data, workers)
+        return out
+
+    @staticmethod
+    def quantize_rescaled(
+            data: np.ndarray,
+            in_range: Tuple[float, float],
+            dtype: type,
+            *,
+            slab: int = 16,
+            workers: Optional[int] = None
+        ) -> Tuple[np.ndarray, Tuple[float, float]]:
+        """Contrast stretch data and round it to unsigned integers.
+
+        The stretched data lies in [0, 1], or in [-1, 1] if `in_range` starts
+        below zero, and that range is spread over every integer of `dtype`.
+
+        Args:
+            data (numpy.ndarray): The raw tomogram data.
+            in_range (tuple of float): The intensities to stretch to the ends
+                of the output range.
+            dtype (type): The unsigned integer dtype to store.
+            slab (int, optional): The number of z-slices stretched at once.
+                Defaults to 16.
+            workers (int, optional): The number of threads stretching slabs.
+                Defaults to None, in which case one thread is used.
+
+        Returns:
+            The quantized data and the `(scale, offset)` that maps it back to
+            stretched intensities.
+        """
+        scale, low = TomogramFile._quantization(in_range, dtype)
+        out = np.empty(data.shape, dtype=dtype)
+
+        def quantize_slab(z0, z1):
+            for start in range(z0, z1, slab):
+                stop = min(start + slab, z1)
+                raw = np.asarray(data[start:stop], dtype=np.float64)
+                stretched = exposure.rescale_intensity(raw, in_range=in_range)
+                stretched -= low
+                stretched /= scale
+                out[start:stop] = np.rint(stretched, out=stretched)
+
+        if workers is None or workers <= 1:
+            quantize_slab(0, len(data))
+        else:
+            _map_slabs(quantize_slab, data, workers)
+        return out, (scale, low)
+
+    @staticmethod
+    def _quantization(in_range: Tuple[float, float], dtype: type) -> Tuple[float, float]:
+        """The `(scale, offset)` of data stretched from `in_range` and
+        quantized to `dtype`."""
+        low = 0.0 if in_range[0] >= 0 else -1.0
+        return (1.0 - low) / np.iinfo(dtype).max, low
+
+    def dequantize(self, region: np.ndarray, dtype: type = np.float64) -> np.ndarray:
+        """Convert quantized data back to intensities.
+
+        Args:
+            region (numpy.ndarray): Part of the quantized data.
+            dtype (type, optional): The float dtype to return. Defaults to
+                np.float64.
+
+        Returns:
+            The intensities, in a new array of `dtype`.
+        """
+        scale, offset = self.quantization
+        out = region.astype(dtype)
+        out *= out.dtype.type(scale)
+        out += out.dtype.type(offset)
+        return out
+
     def reload(self) -> np.ndarray:
         """Reload the tomogram data from the file.
 
@@ -203,8 +810,427 @@ class TomogramFile(Tomogram):
             The reloaded tomogram data.
         """
         self.data = TomogramFile.mrc_to_np(self.filepath)
+        self.lazy = False
+        self.processed = False
+        self.quantization = None
         return self.data
 
+    @contextmanager
+    def open_raw(self) -> Iterator[np.ndarray]:
+        """Open the unprocessed tomogram data as a memory-mapped array.
+
+        No data is read until the array is indexed, so this is suitable for
+        streaming over volumes too large to load.
+
+        Yields:
+            A read-only, memory-mapped view of the data in the file.
+
+        Raises:
+            IOError: If the file type is not supported.
+        """
+        _, extension = os.path.splitext(self.filepath)
+        if extension in [".mrc", ".rec"]:
+            with mrcfile.mmap(self.filepath, 'r') as mrc:
+                yield mrc.data
+        elif extension == ".npy":
+            yield np.load(self.filepath, mmap_mode='r')
+        else:
+            raise IOError("Tomogram file must be of type .mrc, .rec, or .npy.")
+
+    def _as_loaded(self, array: np.ndarray) -> np.ndarray:
+        """Convert raw data read from the file to the dtype `load` gives."""
+        _, extension = os.path.splitext(self.filepath)
+        if extension in [".mrc", ".rec"]:
+            return np.asarray(array, dtype=np.float64)
+        return np.asarray(array)
+
+    def header_shape(self) -> Tuple[int, int, int]:
+        """Read the shape of the tomogram from the file header, without loading
+        its data.
+
+        If the data is not loaded, the shape is also stored in `self.shape`.
+
+        Returns:
+            The shape of the tomogram data.
+        """
+        _, extension = os.path.splitext(self.filepath)
+        if extension in [".mrc", ".rec"]:
+            with mrcfile.open(self.filepath, 'r', header_only=True) as mrc:
+                shape = mrcfile.utils.data_shape_from_header(mrc.header)
+        else:
+            with self.open_raw() as raw:
+                shape = raw.shape
+        shape = tuple(int(s) for s in shape)
+        if self.data is None:
+            self.shape = shape
+        return shape
+
+    def statistics_path(self) -> str:
+        """Returns the path of the file storing this tomogram's statistics."""
+        return cache_path(self.filepath, "stats", self.cache_dir, ext=".json")
+
+    def _source_signature(self) -> Dict[str, int]:
+        """Identify the current version of the tomogram file."""
+        stat = os.stat(self.filepath)
+        return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+    def _read_statistics(self) -> Optional[Dict[str, float]]:
+        """Read stored statistics, if they exist and match the current file."""
+        if self._statistics is not None:
+            return self._statistics
+        try:
+            with open(self.statistics_path(), 'r') as file:
+                statistics = json.load(file)
+        except (OSError, ValueError):
+            return None
+        signature = self._source_signature()
+        if any(statistics.get(key) != value for key, value in signature.items()):
+            return None
+        self._statistics = statistics
+        return statistics
+
+    def statistics(self, *, workers: Optional[int] = None) -> Dict[str, float]:
+        """Get global intensity statistics of the raw tomogram data.
+
+        The statistics are computed once and kept in memory. If `cache_dir`
+        is set, they are also stored in a small JSON file there (see
+        `statistics_path`) along with the size and modification time of the
+        tomogram file, so later calls, even from other processes, only read
+        that file. Without a `cache_dir`, nothing is written, so reading from
+        a shared or read-only archive has no side effects. Statistics stored
+        by `write_processed` are read in either case.
+
+        Args:
+            workers (int, optional): The number of threads computing the
+                percentiles, as in `clip_values`. Defaults to None.
+
+        Returns:
+            A dictionary with the 2nd and 98th percentiles used by
+            preprocessing, `p2` and `p98`, as well as the `mean` and `std`.
+        """
+        statistics = self._read_statistics()
+        if statistics is not None:
+            return statistics
+
+        if self.lazy:
+            # The loaded data is still raw
+            statistics = self._compute_statistics(self.data, workers)
+        else:
+            with self.open_raw() as raw:
+                # Streamed from the memory map, as if converted the way load does
+                dtype = self._as_loaded(raw[:0]).dtype
+                statistics = self._compute_statistics(raw, workers, dtype=dtype)
+        statistics.update(self._source_signature())
+        self._statistics = statistics
+        if self.cache_dir is not None:
+            try:
+                self._write_statistics(statistics)
+            except OSError:
+                pass
+        return statistics
+
+    def _write_statistics(self, statistics: Dict[str, float]):
+        """Store statistics in `statistics_path`, replacing it atomically."""
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.statistics_path()
+        tmp = temporary_path(path)
+        with open(tmp, 'w') as file:
+            json.dump(statistics, file)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _compute_statistics(
+            data: np.ndarray,
+            workers: Optional[int] = None,
+            *,
+            slab: int = 16,
+            dtype: Optional[type] = None
+        ) -> Dict[str, float]:
+        """Compute `statistics` a slab at a time, so that memory-mapped data
+        is streamed rather than read into memory. The percentiles are those
+        of `np.asarray(data, dtype)`, as in `parallel_percentile`."""
+        workers = 1 if workers is None else max(workers, 1)
+        with stage("statistics.percentile"):
+            p2, p98 = parallel_percentile(data, (2, 98), workers, slab=slab, dtype=dtype)
+
+        def moments(z0, z1):
+            values = np.asarray(data[z0:z1], dtype=np.float64)
+            mean = values.mean()
+            return values.size, mean, np.square(values - mean).sum()
+
+        with stage("statistics.moments"):
+            count, mean, m2 = 0, 0.0, 0.0
+            # Combine the moments of the slabs with the pairwise update of Chan et al.
+            for n, slab_mean, slab_m2 in _map_slabs(moments, data, workers, slab):
+                total = count + n
+                delta = slab_mean - mean
+                mean += delta * n / total
+                m2 += slab_m2 + delta * delta * count * n / total
+                count = total
+        return {"p2": float(p2), "p98": float(p98), "mean": float(mean), "std": float(np.sqrt(m2 / count))}
+
+    def intensity_range(self) -> Tuple[float, float]:
+        """Get the intensities that preprocessing stretches to the ends of the
+        output range.
+
+        These come from `statistics`, unless the tomogram was already loaded
+        with preprocessing.
+
+        Returns:
+            The 2nd and 98th percentiles of the raw tomogram data.
+        """
+        if self.clip_range is None:
+            statistics = self.statistics()
+            self.clip_range = (statistics["p2"], statistics["p98"])
+        return self.clip_range
+
+    def processed_path(self) -> str:
+        """Returns the path of the preprocessed copy of this tomogram written
+        by `write_processed`. Quantized tomograms have their own copy per
+        dtype."""
+        tag = "processed" if self.quantize is None else f"processed-{np.dtype(self.quantize).name}"
+        return cache_path(self.filepath, tag, self.cache_dir)
+
+    def processed_is_fresh(self) -> bool:
+        """Checks whether the preprocessed copy and the statistics it was
+        made with are up to date with the tomogram file."""
+        return is_fresh(self.processed_path(), self.filepath) and self._read_statistics() is not None
+
+    def _load_processed(self) -> bool:
+        """Load the preprocessed copy, if it is up to date."""
+        if not self.processed_is_fresh():
+            return False
+        statistics = self._read_statistics()
+        with stage("TomogramFile.load.processed") as s:
+            data = np.load(self.processed_path())
+            s.add(bytes_read=data.nbytes, arrays=1, bytes_allocated=data.nbytes)
+        super().__init__(data, self.annotations)
+        self.clip_range = (statistics["p2"], statistics["p98"])
+        if self.quantize is not None:
+            self.quantization = TomogramFile._quantization(self.clip_range, self.quantize)
+        self.lazy = False
+        self.processed = True
+        return True
+
+    def write_processed(self, *, workers: Optional[int] = None, force: bool = False) -> str:
+        """Preprocess this tomogram and save the result, so that later loads,
+        even from other processes, read it instead of preprocessing again.
+
+        The preprocessed data is saved as a `.npy` file (see
+        `processed_path`), quantized if `self.quantize` is set, and the
+        statistics it was made with are stored in `statistics_path`, even
+        without a `cache_dir`. Both are replaced when the tomogram file
+        changes.
+
+        Args:
+            workers (int, optional): The number of threads preprocessing
+                uses, as in `process`. Defaults to None.
+            force (bool, optional): Whether to rewrite an up-to-date copy.
+                Defaults to False.
+
+        Returns:
+            The path of the preprocessed copy.
+        """
+        path = self.processed_path()
+        if not force and self.processed_is_fresh():
+            return path
+        statistics = self.statistics(workers=workers)
+        in_range = (statistics["p2"], statistics["p98"])
+        if self.processed and self.clip_range != in_range:
+            # Stretched from another range; start again from the raw data
+            self.data = None
+        if self.data is None:
+            self.load(preprocess=False)
+        if not self.processed:
+            self.process(in_range, workers=workers)
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = temporary_path(path)
+        np.save(tmp, self.data)
+        os.replace(tmp, path)
+        self._write_statistics(statistics)
+        return path
+
+    def crop(
+            self,
+            lower_bounds: Sequence[int],
+            shape: Sequence[int],
+            dtype: Optional[type] = None
+        ) -> np.ndarray:
+        """Get the data in a box of the tomogram.
+
+        If the data is not loaded, only the box is read from the file, with
+        preprocessing. If the tomogram was loaded with `lazy=True`,
+        preprocessing is applied to the box alone. If the data is quantized,
+        only the box is converted back to floats.
+
+        Args:
+            lower_bounds (sequence of int): The lower bounds of the box.
+            shape (sequence of int): The shape of the box.
+            dtype (type, optional): The dtype to return the box as. Defaults
+                to None, in which case the box has the dtype of the loaded
+                data, or np.float64 if the data is quantized.
+
+        Returns:
+            The data in the box.
+        """
+        if self.data is None:
+            region = self.read_region(lower_bounds, shape)
+            return region if dtype is None else region.astype(dtype, copy=False)
+        if self.quantization is not None:
+            region = super().crop(lower_bounds, shape)
+            return self.dequantize(region, np.float64 if dtype is None else dtype)
+        region = super().crop(lower_bounds, shape)
+        if self.lazy:
+            region = exposure.rescale_intensity(region, in_range=self.clip_range)
+        return region if dtype is None else region.astype(dtype, copy=False)
+
+    def read_region(
+            self,
+            lower_bounds: Sequence[int],
+            shape: Sequence[int],
+            *,
+            preprocess: bool = True
+        ) -> np.ndarray:
+        """Read part of the tomogram from its file without loading the rest.
+
+        For `.mrc` and `.rec` files, the byte offsets of the region are
+        computed from the header and only the rows of the needed z-slices are
+        read, one positioned read per z-slice. As with slicing, the region is
+        cut short where it extends past the edge of the tomogram.
+
+        Args:
+            lower_bounds (sequence of int): The lower bounds of the region.
+            shape (sequence of int): The shape of the region.
+            preprocess (bool, optional): Whether to apply the same contrast
+                stretching as `load`. Defaults to True.
+
+        Returns:
+            The region, with the same dtype and values as the corresponding
+            slice of the loaded data.
+        """
+        with stage("TomogramFile.read_region") as s:
+            _, extension = os.path.splitext(self.filepath)
+            if extension in [".mrc", ".rec"]:
+                region = self._read_mrc_region(lower_bounds, shape)
+            else:
+                with self.open_raw() as raw:
+                    slices = tuple(slice(max(lb, 0), max(lb, 0) + sh) for lb, sh in zip(lower_bounds, shape))
+                    region = np.array(raw[slices])
+            s.add(bytes_read=region.nbytes, arrays=1, bytes_allocated=region.nbytes)
+            region = self._as_loaded(region)
+
+        if preprocess:
+            region = exposure.rescale_intensity(region, in_range=self.intensity_range())
+        return region
+
+    def _read_mrc_region(self, lower_bounds: Sequence[int], shape: Sequence[int]) -> np.ndarray:
+        """Read a region of a `.mrc` or `.rec` file with positioned reads."""
+        with mrcfile.open(self.filepath, 'r', header_only=True) as mrc:
+            header = mrc.header
+            dtype = mrcfile.utils.data_dtype_from_header(header)
+            nz, ny, nx = mrcfile.utils.data_shape_from_header(header)
+            data_offset = header.nbytes + int(header.nsymbt)
+
+        (z0, y0, x0) = (max(int(b), 0) for b in lower_bounds)
+        z1 = min(z0 + int(shape[0]), nz)
+        y1 = min(y0 + int(shape[1]), ny)
+        x1 = min(x0 + int(shape[2]), nx)
+        z1, y1, x1 = max(z1, z0), max(y1, y0), max(x1, x0)
+
+        region = np.empty((z1 - z0, y1 - y0, x1 - x0), dtype=dtype)
+        row_bytes = nx * dtype.itemsize
+        fd = os.open(self.filepath, os.O_RDONLY)
+        try:
+            for z in range(z0, z1):
+                # Whole rows y0 to y1 are contiguous within a z-slice
+                offset = data_offset + (z * ny + y0) * row_bytes
+                length = (y1 - y0) * row_bytes
+                buffer = os.pread(fd, length, offset)
+                if len(buffer) != length:
+                    raise IOError(f"Unexpected end of file reading {self.filepath}.")
+                rows = np.frombuffer(buffer, dtype=dtype).reshape(y1 - y0, nx)
+                region[z - z0] = rows[:, x0:x1]
+        finally:
+            os.close(fd)
+        return region
+
+    def pyramid_path(self, level: int) -> str:
+        """Returns the path of the cached binned volume for a pyramid level.
+
+        Args:
+            level (int): The pyramid level. Level `n` is binned by `2**n`.
+
+        Returns:
+            The path of the `.npy` file storing this level.
+        """
+        return cache_path(self.filepath, f"bin{2**level}", self.cache_dir)
+
+    def build_pyramid(self, levels: int, *, slab: int = 16, force: bool = False) -> List[str]:
+        """Compute and cache binned copies of this tomogram.
+
+        Each level is computed by block-mean binning the previous level by a
+        factor of 2, reading and writing a slab at a time. Levels that are
+        already cached and newer than the tomogram file are not recomputed.
+
+        Args:
+            levels (int): The number of binned levels to compute. Level `n`
+                is binned by a factor of `2**n`.
+            slab (int, optional): The number of binned z-slices computed at
+                once. Defaults to 16.
+            force (bool, optional): Whether to recompute cached levels that
+                are up to date. Defaults to False.
+
+        Returns:
+            The paths of the cached levels, from level 1 to `levels`.
+        """
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        paths = []
+        with self.open_raw() as source:
+            for level in range(1, levels + 1):
+                path = self.pyramid_path(level)
+                if force or not is_fresh(path, self.filepath):
+                    binned_shape = tuple(s // 2 for s in source.shape)
+                    tmp = temporary_path(path)
+                    out = np.lib.format.open_memmap(
+                        tmp, mode='w+', dtype=np.float32, shape=binned_shape
+                    )
+                    block_mean(source, 2, out=out, slab=slab)
+                    out.flush()
+                    del out
+                    os.replace(tmp, path)
+                paths.append(path)
+                source = np.load(path, mmap_mode='r')
+        return paths
+
+    def pyramid_level(self, level: int, *, preprocess: bool = True) -> 'TomogramFile':
+        """Get this tomogram binned by a factor of `2**level`.
+
+        The binned volume is computed and cached on disk the first time it is
+        requested. Annotation points are scaled to the binned voxel grid.
+
+        Args:
+            level (int): The pyramid level. Level 0 is this tomogram.
+            preprocess (bool, optional): Whether to preprocess the binned data
+                after loading. Defaults to True.
+
+        Returns:
+            A loaded TomogramFile of the binned volume, with scaled
+            annotations.
+        """
+        if level == 0:
+            self.load(preprocess=preprocess)
+            return self
+        path = self.build_pyramid(level)[-1]
+        factor = 2**level
+        annotations = [a.scaled(factor) for a in (self.annotations or [])]
+        binned = TomogramFile(path, annotations, load=False, quantize=self.quantize)
+        binned.load(preprocess=preprocess)
+        return binned
+
     def get_shape_from_annotations(self) -> np.ndarray:
         """
         Returns the shape of the tomogram without having to load it using the
@@ -235,7 +1261,117 @@ class TomogramFile(Tomogram):
         else: # Confirm that all the shapes agree
             shape = shapes[0]
             for s in shapes[1:]:
-                if s != shape:
+                if not np.array_equal(s, shape):
                     raise Exception(f"Inconsistent tomogram shapes of {shape} and {s} implied by .mod annotations.")
             return shape
 
+
+def shapes_from_annotations(
+        tomograms: Sequence[Tomogram],
+        workers: int = 8,
+        *,
+        errors: Optional[List[Tuple[Tomogram, Exception]]] = None
+    ) -> List[Optional[np.ndarray]]:
+    """Infer the shapes of many tomograms from their `.mod` annotations in
+    parallel, reading only the header of each file.
+
+    Args:
+        tomograms (sequence of Tomogram): The tomograms, i.e., the output of
+            `all_fm_tomograms()`.
+
+        workers (int, optional): The number of tomograms inspected at once.
+            Defaults to 8.
+
+        errors (list, optional): If given, a tomogram whose shape cannot be
+            inferred gets a shape of None, and `(tomogram, exception)` is
+            appended to this list. Otherwise the first such exception is
+            raised. Defaults to None.
+
+    Returns:
+        The shape of each tomogram, in the order of `tomograms`.
+    """
+    def infer(tomogram):
+        try:
+            return tomogram.get_shape_from_annotations(), None
+        except Exception as e:
+            if errors is None:
+                raise
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(infer, tomograms))
+    shapes = []
+    for tomogram, (shape, error) in zip(tomograms, results):
+        if error is not None:
+            errors.append((tomogram, error))
+        shapes.append(shape)
+    return shapes
+
+
+async def aload_all(
+        tomograms: Iterable[TomogramFile],
+        concurrency: int = 8,
+        *,
+        preprocess: bool = True,
+        errors: Optional[List[Tuple[TomogramFile, Exception]]] = None
+    ) -> AsyncIterator[TomogramFile]:
+    """Load many tomograms concurrently, yielding each as it finishes.
+
+    At most `concurrency` tomograms are loading or waiting to be consumed at
+    once: the next tomogram starts loading only after a finished one has been
+    yielded, so a slow consumer holds back loading. Each yielded tomogram
+    keeps its data in memory for as long as it is referenced, so callers that
+    collect the results, e.g. in a list, keep every tomogram resident. Drop
+    references to tomograms, or set their `data` to None, once done with them.
+
+        async for tomo in aload_all(tomograms, concurrency=16):
+            ...
+
+    Args:
+        tomograms (iterable of TomogramFile): The tomograms to load. Consumed
+            lazily.
+        concurrency (int, optional): The maximum number of tomograms loading
+            or waiting to be consumed. Defaults to 8.
+        preprocess (bool, optional): Whether to preprocess the data after
+            loading. Defaults to True.
+        errors (list, optional): If given, tomograms that fail to load are
+            appended to this list as `(tomogram, exception)` pairs and skipped.
+            Otherwise, the first failure is raised. Defaults to None.
+
+    Yields:
+        Loaded tomograms, in the order they finish loading.
+    """
+    async def load_one(tomogram: TomogramFile) -> TomogramFile:
+        try:
+            await tomogram.aload(preprocess=preprocess)
+        except Exception as exception:
+            if errors is None:
+                raise
+            errors.append((tomogram, exception))
+            return None
+        return tomogram
+
+    remaining = iter(tomograms)
+    pending = set()
+
+    def refill():
+        while len(pending) < concurrency:
+            tomogram = next(remaining, None)
+            if tomogram is None:
+                return
+            pending.add(asyncio.ensure_future(load_one(tomogram)))
+
+    try:
+        refill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                tomogram = task.result()
+                if tomogram is not None:
+                    yield tomogram
+                # Start the next load only once this one has been consumed
+                refill()
+    finally:
+        for task in pending:
+            task.cancel()